@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+"""
+Funget 基准测试模块
+"""
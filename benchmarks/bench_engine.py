@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+线程引擎与 asyncio 引擎的下载对比
+在本地 Range 服务上分别用 MultiDownloader 和 AsyncMultiDownloader 下载同一份数据
+
+    python -m benchmarks.bench_engine --size 256 --worker 32 --block-size 4
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from funget.download.aio import adownload
+from funget.download.multi import download as multi_thread_download
+
+from .server import RangeServer
+
+
+def _run(name, func, filepath, expected, size):
+    # 后台采样下载过程中的线程数峰值
+    peak = [threading.active_count()]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(0.01):
+            peak[0] = max(peak[0], threading.active_count() - 1)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    success = func(filepath)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    stop.set()
+    sampler.join()
+    threads = peak[0]
+    with open(filepath, "rb") as fr:
+        valid = hashlib.md5(fr.read()).hexdigest() == expected
+    print(
+        f"{name:<8} success={success} valid={valid} "
+        f"time={elapsed:.2f}s cpu={cpu:.2f}s "
+        f"throughput={size / elapsed / 1024 / 1024:.1f}MB/s threads={threads}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=256, help="文件大小(MB)")
+    parser.add_argument("--worker", type=int, default=32, help="并发连接数")
+    parser.add_argument("--block-size", type=int, default=4, help="块大小(MB)")
+    args = parser.parse_args()
+
+    data = os.urandom(args.size * 1024 * 1024)
+    expected = hashlib.md5(data).hexdigest()
+    with RangeServer() as server, tempfile.TemporaryDirectory() as tmpdir:
+        url = server.add("/bench.bin", data)
+
+        _run(
+            "thread",
+            lambda path: multi_thread_download(
+                url=url,
+                filepath=path,
+                worker_num=args.worker,
+                block_size=args.block_size,
+                overwrite=True,
+            ),
+            os.path.join(tmpdir, "thread.bin"),
+            expected,
+            len(data),
+        )
+        _run(
+            "asyncio",
+            lambda path: asyncio.run(
+                adownload(
+                    url=url,
+                    filepath=path,
+                    worker_num=args.worker,
+                    block_size=args.block_size,
+                    overwrite=True,
+                )
+            ),
+            os.path.join(tmpdir, "asyncio.bin"),
+            expected,
+            len(data),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+不同写入目标的下载对比
+在本地 Range 服务上用 MultiDownloader 分别写入文件(pwrite/mmap)、内存和丢弃数据,
+null 的结果即纯网络侧的上限, 与 file 的差距就是磁盘侧的开销
+
+    python -m benchmarks.bench_sink --size 256 --worker 16 --block-size 4
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from funget.download.multi import MultiDownloader
+
+from .server import RangeServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=256, help="文件大小(MB)")
+    parser.add_argument("--worker", type=int, default=16, help="并发线程数")
+    parser.add_argument("--block-size", type=int, default=4, help="块大小(MB)")
+    parser.add_argument(
+        "--sink",
+        nargs="+",
+        default=["file", "mmap", "memory", "null"],
+        help="参与对比的写入目标",
+    )
+    args = parser.parse_args()
+
+    data = os.urandom(args.size * 1024 * 1024)
+    with RangeServer() as server, tempfile.TemporaryDirectory() as tmpdir:
+        url = server.add("/bench.bin", data)
+        for sink in args.sink:
+            downloader = MultiDownloader(
+                url=url,
+                filepath=os.path.join(tmpdir, f"{sink}.bin"),
+                block_size=args.block_size,
+                overwrite=True,
+            )
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+            success = downloader.download(
+                worker_num=args.worker, overwrite=True, sink=sink
+            )
+            elapsed = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+            print(
+                f"{sink:<8} success={success} time={elapsed:.2f}s cpu={cpu:.2f}s "
+                f"throughput={len(data) / elapsed / 1024 / 1024:.1f}MB/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+本地 HTTP 测试服务
+在进程内启动一个支持 Range 请求的 HTTP 服务, 用于基准测试和单元测试。
+可以模拟响应延迟、单连接带宽上限和随机错误, 也接收 PUT/POST 上传。
+"""
+
+import hashlib
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
+
+_RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """支持单段 Range 请求的处理器"""
+
+    protocol_version = "HTTP/1.1"
+    write_size = 256 * 1024
+    # 每次写出后的暂停时间(秒), 用于模拟慢速连接
+    write_delay = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _parse_range(self, size: int) -> Optional[Tuple[int, int]]:
+        """解析 Range 头, 返回闭区间 (start, end), 不支持或无效时返回 None"""
+        header = self.headers.get("Range")
+        if not header or not self.server.accept_ranges:
+            return None
+        # If-Range 与当前 ETag 不一致时忽略 Range, 返回完整内容
+        if_range = self.headers.get("If-Range")
+        if if_range and if_range != self.server.etags[self.path]:
+            return None
+        match = _RANGE_PATTERN.fullmatch(header.strip())
+        if match is None:
+            return None
+        first, last = match.groups()
+        if first == "" and last == "":
+            return None
+        if first == "":
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        return start, end
+
+    def _inject_error(self) -> bool:
+        """按 error_rate 随机注入错误, 返回 True 表示已经处理了本次请求"""
+        server = self.server
+        if not server.error_rate:
+            return False
+        with server.random_lock:
+            failed = server.random.random() < server.error_rate
+            if failed:
+                server.errors += 1
+        if not failed:
+            return False
+        if server.error_status:
+            self.send_response(server.error_status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            # 不返回任何内容直接断开连接
+            self.close_connection = True
+        return True
+
+    def _throttle(self, started: float, sent: int):
+        """按单连接带宽上限暂停"""
+        bandwidth = self.server.bandwidth
+        if bandwidth:
+            delay = sent / bandwidth - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    def _send_body(self, data: bytes, head_only: bool = False):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self._inject_error():
+            return
+
+        # If-None-Match 与当前 ETag 一致时返回 304
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match and if_none_match == self.server.etags[self.path]:
+            self.send_response(304)
+            self.send_header("ETag", self.server.etags[self.path])
+            self.end_headers()
+            return
+
+        range_ = self._parse_range(len(data))
+        if range_ is not None and range_[0] >= len(data):
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(data)}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if range_ is None:
+            start, end = 0, len(data) - 1
+            self.send_response(200)
+        else:
+            start, end = range_
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        if self.server.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", self.server.etags[self.path])
+        for name, value in self.server.extra_headers.get(self.path, {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if head_only:
+            return
+
+        view = memoryview(data)
+        offset = start
+        started = time.monotonic()
+        while offset <= end:
+            stop = min(offset + self.write_size, end + 1)
+            # 先等到按带宽上限可以发出这一段的时间再写
+            self._throttle(started, stop - start)
+            self.wfile.write(view[offset:stop])
+            offset = stop
+            if self.write_delay:
+                time.sleep(self.write_delay)
+
+    def _lookup(self) -> Optional[bytes]:
+        self.server.requests.append(
+            (self.command, self.path, self.headers.get("Range"))
+        )
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        return data
+
+    def do_HEAD(self):
+        data = self._lookup()
+        if data is not None:
+            self._send_body(data, head_only=True)
+
+    def do_GET(self):
+        data = self._lookup()
+        if data is not None:
+            try:
+                self._send_body(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    def _read_body(self) -> int:
+        """读取并丢弃请求体, 支持 Content-Length 和 chunked, 返回字节数"""
+        length = self.headers.get("Content-Length")
+        started = time.monotonic()
+        received = 0
+        if length is not None:
+            remaining = int(length)
+            while remaining > 0:
+                data = self.rfile.read(min(self.write_size, remaining))
+                if not data:
+                    break
+                received += len(data)
+                remaining -= len(data)
+                self._throttle(started, received)
+            return received
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return received
+                self.rfile.read(size)
+                self.rfile.readline()
+                received += size
+                self._throttle(started, received)
+        return received
+
+    def _receive(self):
+        self.server.requests.append((self.command, self.path, None))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        try:
+            received = self._read_body()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        if self._inject_error():
+            return
+        self.server.uploads[self.path] = (
+            self.server.uploads.get(self.path, 0) + received
+        )
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_PUT(self):
+        self._receive()
+
+    def do_POST(self):
+        self._receive()
+
+
+class RangeServer:
+    """进程内的 Range HTTP 服务
+
+    Example:
+        with RangeServer() as server:
+            url = server.add("/file.bin", b"...")
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        accept_ranges: bool = True,
+        handler=RangeRequestHandler,
+        latency: float = 0.0,
+        bandwidth: int = 0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: Optional[int] = None,
+    ):
+        """
+        :param latency: 每个请求在响应前等待的秒数
+        :param bandwidth: 单连接带宽上限(字节/秒), 0 表示不限制
+        :param error_rate: 请求失败的概率
+        :param error_status: 失败时返回的状态码, 0 表示直接断开连接
+        :param seed: 错误注入的随机种子, 固定后每次运行的失败序列相同
+        """
+        self._httpd = ThreadingHTTPServer((host, port), handler)
+        self._httpd.daemon_threads = True
+        self._httpd.files: Dict[str, bytes] = {}
+        self._httpd.etags: Dict[str, str] = {}
+        self._httpd.extra_headers: Dict[str, Dict[str, str]] = {}
+        self._httpd.accept_ranges = accept_ranges
+        # 收到的请求记录: (method, path, Range)
+        self._httpd.requests: List[Tuple[str, str, Optional[str]]] = []
+        # 每个路径收到的上传字节数
+        self._httpd.uploads: Dict[str, int] = {}
+        self._httpd.latency = latency
+        self._httpd.bandwidth = bandwidth
+        self._httpd.error_rate = error_rate
+        self._httpd.error_status = error_status
+        self._httpd.errors = 0
+        self._httpd.random = random.Random(seed)
+        self._httpd.random_lock = Lock()
+        self._thread: Optional[Thread] = None
+
+    @property
+    def requests(self) -> List[Tuple[str, str, Optional[str]]]:
+        return self._httpd.requests
+
+    @property
+    def uploads(self) -> Dict[str, int]:
+        return self._httpd.uploads
+
+    @property
+    def errors(self) -> int:
+        """已注入的错误数"""
+        return self._httpd.errors
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add(
+        self, path: str, data: bytes, headers: Optional[Dict[str, str]] = None
+    ) -> str:
+        """注册一个文件, 返回其下载地址, headers 为该文件响应中附加的响应头"""
+        self._httpd.files[path] = data
+        self._httpd.extra_headers[path] = dict(headers or {})
+        self._httpd.etags[path] = f'"{hashlib.md5(data).hexdigest()}"'
+        return f"{self.base_url}{path}"
+
+    def etag(self, path: str) -> str:
+        return self._httpd.etags[path]
+
+    def start(self) -> "RangeServer":
+        self._thread = Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+下载/上传吞吐量基准测试套件
+在进程内的本地服务上按参数组合运行 SingleDownloader、MultiDownloader、AsyncMultiDownloader、
+ProcessMultiDownloader 和 SingleUploader, 结果写入 JSON; CPU 时间包括已结束的子进程,
+多进程引擎的内存峰值包括子进程。compare 对比两份结果, 吞吐量下降或 CPU 时间上升超过阈值时
+返回非零退出码
+
+    python -m benchmarks.suite run --size 64 --worker 4 16 --block-size 1 4 --output base.json
+    python -m benchmarks.suite run --size 64 --latency 0.02 --bandwidth 50 --error-rate 0.01
+    python -m benchmarks.suite compare base.json new.json --threshold 0.1
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from funget.config import get_config
+from funget.download.multi import MultiDownloader
+from funget.download.single import SingleDownloader
+from funget.upload.single import SingleUploader
+
+from .server import RangeServer
+
+ENGINES = ("single", "multi", "asyncio", "process", "upload")
+# 每种引擎用到的参数, 其余参数不参与组合
+ENGINE_PARAMS = {
+    "single": ("chunk_size",),
+    "multi": ("worker_num", "block_size", "chunk_size"),
+    "asyncio": ("worker_num", "block_size", "chunk_size"),
+    "process": ("worker_num", "block_size", "chunk_size"),
+    "upload": ("chunk_size",),
+}
+# 在子进程中传输数据的引擎, 内存峰值需要包括子进程
+CHILD_ENGINES = ("process",)
+RESULT_VERSION = 1
+
+
+def _statm_rss(pid: str = "self") -> int:
+    with open(f"/proc/{pid}/statm") as fr:
+        return int(fr.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _child_pids() -> Optional[List[str]]:
+    """当前进程的子进程, 不支持 /proc/<pid>/task/<tid>/children 时返回 None"""
+    pids = []
+    try:
+        for tid in os.listdir("/proc/self/task"):
+            with open(f"/proc/self/task/{tid}/children") as fr:
+                pids.extend(fr.read().split())
+    except OSError:
+        return None
+    return pids
+
+
+def _rss(children: bool = False) -> Optional[int]:
+    """当前常驻内存(字节), 不支持 /proc 时退回到进程的峰值
+
+    children 为真时加上子进程的常驻内存, 无法取得子进程的内存时返回 None
+    """
+    try:
+        rss = _statm_rss()
+    except (OSError, ValueError, IndexError):
+        if children:
+            return None
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 上单位是字节, Linux 上是 KB
+        return usage if sys.platform == "darwin" else usage * 1024
+    if not children:
+        return rss
+    pids = _child_pids()
+    if pids is None:
+        return None
+    for pid in pids:
+        try:
+            rss += _statm_rss(pid)
+        except (OSError, ValueError, IndexError):
+            # 子进程已经退出
+            pass
+    return rss
+
+
+def _cpu_time() -> float:
+    """本进程和已结束子进程的 CPU 时间之和"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + usage.ru_utime + usage.ru_stime
+
+
+class _Sampler:
+    """后台采样运行期间的内存和线程数峰值
+
+    children 为真时内存包括子进程, 无法取得子进程的内存时 peak_rss 为 None
+    """
+
+    def __init__(self, interval: float = 0.01, children: bool = False):
+        self.interval = interval
+        self.children = children
+        self.peak_rss = _rss(children)
+        self.peak_threads = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = _rss(self.children)
+            if rss is None or self.peak_rss is None:
+                self.peak_rss = None
+                continue
+            self.peak_rss = max(self.peak_rss, rss)
+            # 不计入采样线程自己
+            self.peak_threads = max(self.peak_threads, threading.active_count() - 1)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def _measure(func: Callable[[], bool], children: bool = False) -> Dict[str, Any]:
+    """执行一次传输, 记录耗时、CPU 时间(包括已结束的子进程)、内存和线程数峰值
+
+    children 为真时内存峰值包括子进程, 用于多进程引擎
+    """
+    with _Sampler(children=children) as sampler:
+        start = time.perf_counter()
+        cpu_start = _cpu_time()
+        success = func()
+        elapsed = time.perf_counter() - start
+        cpu = _cpu_time() - cpu_start
+    return {
+        "success": bool(success),
+        "elapsed": elapsed,
+        "cpu": cpu,
+        "peak_rss": sampler.peak_rss,
+        "threads": sampler.peak_threads,
+    }
+
+
+def _peak(values) -> Optional[int]:
+    """多次运行的内存峰值, 任一次无法测量时为 None"""
+    values = list(values)
+    return None if None in values else max(values)
+
+
+def _format_rss(rss: Optional[int]) -> str:
+    return "N/A" if rss is None else f"{rss / 1024 / 1024:.0f}MB"
+
+
+def _task(engine: str, url: str, path: str, source: str, params: Dict[str, int]):
+    """返回执行一次传输的函数"""
+    worker_num = params.get("worker_num")
+    block_size = params.get("block_size")
+    chunk_size = params["chunk_size"]
+    if engine == "single":
+        return lambda: SingleDownloader(
+            url=url, filepath=path, overwrite=True
+        ).download(chunk_size=chunk_size)
+    if engine == "multi":
+        return lambda: MultiDownloader(
+            url=url, filepath=path, block_size=block_size, overwrite=True
+        ).download(worker_num=worker_num, overwrite=True, chunk_size=chunk_size)
+    if engine == "asyncio":
+        from funget.download.aio import AsyncMultiDownloader
+
+        async def run():
+            downloader = AsyncMultiDownloader(
+                url=url, filepath=path, block_size=block_size, overwrite=True
+            )
+            return await downloader.adownload(
+                worker_num=worker_num, overwrite=True, chunk_size=chunk_size
+            )
+
+        return lambda: asyncio.run(run())
+    if engine == "process":
+        from funget.download.process import ProcessMultiDownloader
+
+        return lambda: ProcessMultiDownloader(
+            url=url, filepath=path, block_size=block_size, overwrite=True
+        ).download(worker_num=worker_num, overwrite=True, chunk_size=chunk_size)
+    if engine == "upload":
+        return lambda: SingleUploader(url=url, filepath=source).upload(
+            chunk_size=chunk_size
+        )
+    raise ValueError(f"Unknown engine: {engine}")
+
+
+def _cases(args) -> List[Dict[str, Any]]:
+    """按引擎展开参数组合, 引擎用不到的参数不参与组合"""
+    values = {
+        "worker_num": args.worker,
+        "block_size": args.block_size,
+        "chunk_size": [size * 1024 for size in args.chunk_size],
+    }
+    cases = []
+    for engine in args.engine:
+        names = ENGINE_PARAMS[engine]
+        for combination in itertools.product(*(values[name] for name in names)):
+            params = dict(zip(names, combination))
+            label = "-".join(f"{name}={value}" for name, value in params.items())
+            cases.append(
+                {"name": f"{engine}:{label}", "engine": engine, "params": params}
+            )
+    return cases
+
+
+def run(args) -> Dict[str, Any]:
+    # 进度条的绘制会干扰输出和计时
+    config = get_config()
+    progress_bar, config.progress_bar = config.progress_bar, False
+
+    data = os.urandom(args.size * 1024 * 1024)
+    expected = hashlib.md5(data).hexdigest()
+    results = []
+    try:
+        with RangeServer(
+            latency=args.latency,
+            bandwidth=int(args.bandwidth * 1024 * 1024),
+            error_rate=args.error_rate,
+            error_status=args.error_status,
+            seed=args.seed,
+        ) as server, tempfile.TemporaryDirectory() as tmpdir:
+            url = server.add("/bench.bin", data)
+            source = os.path.join(tmpdir, "source.bin")
+            with open(source, "wb") as fw:
+                fw.write(data)
+
+            for case in _cases(args):
+                path = os.path.join(tmpdir, "target.bin")
+                target = (
+                    f"{server.base_url}/upload" if case["engine"] == "upload" else url
+                )
+                runs = []
+                for _ in range(args.repeat):
+                    if os.path.exists(path):
+                        os.remove(path)
+                    errors = server.errors
+                    measured = _measure(
+                        _task(case["engine"], target, path, source, case["params"]),
+                        children=case["engine"] in CHILD_ENGINES,
+                    )
+                    measured["errors"] = server.errors - errors
+                    if case["engine"] != "upload" and measured["success"]:
+                        with open(path, "rb") as fr:
+                            measured["success"] = (
+                                hashlib.md5(fr.read()).hexdigest() == expected
+                            )
+                    runs.append(measured)
+
+                elapsed = statistics.median(item["elapsed"] for item in runs)
+                result = {
+                    **case,
+                    "runs": len(runs),
+                    "success": all(item["success"] for item in runs),
+                    "elapsed": elapsed,
+                    "throughput": len(data) / elapsed / 1024 / 1024,
+                    "cpu": statistics.median(item["cpu"] for item in runs),
+                    "peak_rss": _peak(item["peak_rss"] for item in runs),
+                    "threads": max(item["threads"] for item in runs),
+                    "errors": sum(item["errors"] for item in runs),
+                    "samples": [item["elapsed"] for item in runs],
+                }
+                results.append(result)
+                print(
+                    f"{result['name']:<60} success={result['success']} "
+                    f"throughput={result['throughput']:.1f}MB/s cpu={result['cpu']:.2f}s "
+                    f"rss={_format_rss(result['peak_rss'])} threads={result['threads']} "
+                    f"errors={result['errors']}",
+                    flush=True,
+                )
+    finally:
+        config.progress_bar = progress_bar
+
+    return {
+        "version": RESULT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "options": {
+            "size": args.size,
+            "repeat": args.repeat,
+            "latency": args.latency,
+            "bandwidth": args.bandwidth,
+            "error_rate": args.error_rate,
+            "error_status": args.error_status,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def compare(
+    base: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.1
+) -> List[Dict[str, Any]]:
+    """对比两份结果
+
+    Args:
+        base: 基准结果
+        new: 新结果
+        threshold: 吞吐量下降或 CPU 时间上升的相对阈值
+
+    Returns:
+        List[Dict[str, Any]]: 两份结果中都有的用例, regression 为真表示超出阈值
+    """
+    base_results = {item["name"]: item for item in base["results"]}
+    rows = []
+    for item in new["results"]:
+        old = base_results.get(item["name"])
+        if old is None:
+            continue
+        throughput = (
+            item["throughput"] / old["throughput"] - 1 if old["throughput"] else 0.0
+        )
+        cpu = item["cpu"] / old["cpu"] - 1 if old["cpu"] else 0.0
+        reasons = []
+        if throughput < -threshold:
+            reasons.append(f"throughput {throughput:+.1%}")
+        if cpu > threshold:
+            reasons.append(f"cpu {cpu:+.1%}")
+        if old["success"] and not item["success"]:
+            reasons.append("failed")
+        rows.append(
+            {
+                "name": item["name"],
+                "throughput": throughput,
+                "cpu": cpu,
+                "regression": bool(reasons),
+                "reasons": reasons,
+            }
+        )
+    return rows
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path) as fr:
+        return json.load(fr)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="运行基准测试")
+    run_parser.add_argument("--size", type=int, default=64, help="文件大小(MB)")
+    run_parser.add_argument(
+        "--engine", nargs="+", default=list(ENGINES), choices=ENGINES
+    )
+    run_parser.add_argument(
+        "--worker", type=int, nargs="+", default=[4, 16], help="并发数"
+    )
+    run_parser.add_argument(
+        "--block-size", type=int, nargs="+", default=[4], help="块大小(MB)"
+    )
+    run_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        nargs="+",
+        default=[256, 2048],
+        help="单次读写大小(KB)",
+    )
+    run_parser.add_argument(
+        "--repeat", type=int, default=3, help="每个用例的运行次数, 取中位数"
+    )
+    run_parser.add_argument(
+        "--latency", type=float, default=0.0, help="每个请求的延迟(秒)"
+    )
+    run_parser.add_argument(
+        "--bandwidth", type=float, default=0, help="单连接带宽上限(MB/s)"
+    )
+    run_parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="请求失败的概率"
+    )
+    run_parser.add_argument(
+        "--error-status", type=int, default=503, help="失败时的状态码, 0 表示断开连接"
+    )
+    run_parser.add_argument("--seed", type=int, default=0, help="错误注入的随机种子")
+    run_parser.add_argument("--output", help="结果 JSON 文件")
+
+    compare_parser = commands.add_parser("compare", help="对比两份结果")
+    compare_parser.add_argument("base", help="基准结果")
+    compare_parser.add_argument("new", help="新结果")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="相对阈值")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        result = run(args)
+        if args.output:
+            with open(args.output, "w") as fw:
+                json.dump(result, fw, indent=2)
+        return 0 if all(item["success"] for item in result["results"]) else 1
+
+    rows = compare(_load(args.base), _load(args.new), args.threshold)
+    for row in rows:
+        flag = "REGRESSION " + ", ".join(row["reasons"]) if row["regression"] else "ok"
+        print(
+            f"{row['name']:<60} throughput={row['throughput']:+.1%} "
+            f"cpu={row['cpu']:+.1%} {flag}"
+        )
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
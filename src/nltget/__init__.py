@@ -1,4 +1,19 @@
-from .download import download, multi_thread_download, simple_download
+from .download import (
+    adownload,
+    download,
+    download_many,
+    multi_thread_download,
+    simple_download,
+)
+from .metrics import get_registry
 from .upload import single_upload
 
-__all__ = ["simple_download", "multi_thread_download", "download", "single_upload"]
+__all__ = [
+    "simple_download",
+    "multi_thread_download",
+    "download",
+    "adownload",
+    "download_many",
+    "single_upload",
+    "get_registry",
+]
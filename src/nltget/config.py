@@ -21,15 +21,31 @@ class DownloadConfig:
     max_retries: int = 3
     timeout: int = 30  # seconds
 
+    # 自适应并发配置
+    adaptive: bool = False
+    max_worker_num: int = 64
+
     # 文件配置
     overwrite: bool = False
     create_dirs: bool = True
+    # 预分配策略: fallocate 预先分配磁盘空间, sparse 只设置文件大小, none 不预分配
+    preallocate: str = "fallocate"
+    # 下载记录数据库路径, 设置后通过 ETag/Last-Modified 条件请求跳过未改变的文件
+    metadata_path: Optional[str] = None
+    # 下载缓存目录, 设置后下载完成的文件按内容保存, 再次下载同一 URL 时直接从缓存生成
+    cache_dir: Optional[str] = None
+    cache_max_size: int = 0  # bytes, 0 表示不限制
+    # 续传日志中分块校验值的算法, 如 sha256, 续传时据此只重新下载损坏的块;
+    # 需要额外对整个文件做一遍哈希, 默认 none 不计算
+    block_hash: str = "none"
 
     # 网络配置
     headers: Optional[Dict[str, str]] = None
 
     # 自动选择配置
     auto_multi_threshold: int = 10 * 1024 * 1024  # 10MB
+    # 根据探测测得的往返时间和吞吐量自动选择下载方式和参数, 关闭时按 auto_multi_threshold 选择
+    auto_tune: bool = True
 
     def __post_init__(self):
         if self.headers is None:
@@ -114,6 +130,30 @@ class FungetConfig:
             config.download.max_retries = int(os.getenv("FUNGET_MAX_RETRIES"))
         if os.getenv("FUNGET_TIMEOUT"):
             config.download.timeout = int(os.getenv("FUNGET_TIMEOUT"))
+        if os.getenv("FUNGET_ADAPTIVE"):
+            config.download.adaptive = os.getenv("FUNGET_ADAPTIVE").lower() in (
+                "1",
+                "true",
+                "yes",
+            )
+        if os.getenv("FUNGET_MAX_WORKER_NUM"):
+            config.download.max_worker_num = int(os.getenv("FUNGET_MAX_WORKER_NUM"))
+        if os.getenv("FUNGET_PREALLOCATE"):
+            config.download.preallocate = os.getenv("FUNGET_PREALLOCATE").lower()
+        if os.getenv("FUNGET_METADATA_PATH"):
+            config.download.metadata_path = os.getenv("FUNGET_METADATA_PATH")
+        if os.getenv("FUNGET_CACHE_DIR"):
+            config.download.cache_dir = os.getenv("FUNGET_CACHE_DIR")
+        if os.getenv("FUNGET_CACHE_MAX_SIZE"):
+            config.download.cache_max_size = int(os.getenv("FUNGET_CACHE_MAX_SIZE"))
+        if os.getenv("FUNGET_BLOCK_HASH"):
+            config.download.block_hash = os.getenv("FUNGET_BLOCK_HASH").lower()
+        if os.getenv("FUNGET_AUTO_TUNE"):
+            config.download.auto_tune = os.getenv("FUNGET_AUTO_TUNE").lower() in (
+                "1",
+                "true",
+                "yes",
+            )
 
         # 上传配置
         if os.getenv("FUNGET_UPLOAD_METHOD"):
@@ -124,6 +164,12 @@ class FungetConfig:
         # 全局配置
         if os.getenv("FUNGET_LOG_LEVEL"):
             config.log_level = os.getenv("FUNGET_LOG_LEVEL")
+        if os.getenv("FUNGET_PROGRESS_BAR"):
+            config.progress_bar = os.getenv("FUNGET_PROGRESS_BAR").lower() in (
+                "1",
+                "true",
+                "yes",
+            )
 
         return config
 
@@ -137,10 +183,18 @@ class FungetConfig:
                 "chunk_size": self.download.chunk_size,
                 "max_retries": self.download.max_retries,
                 "timeout": self.download.timeout,
+                "adaptive": self.download.adaptive,
+                "max_worker_num": self.download.max_worker_num,
                 "overwrite": self.download.overwrite,
                 "create_dirs": self.download.create_dirs,
+                "preallocate": self.download.preallocate,
+                "metadata_path": self.download.metadata_path,
+                "cache_dir": self.download.cache_dir,
+                "cache_max_size": self.download.cache_max_size,
+                "block_hash": self.download.block_hash,
                 "headers": self.download.headers,
                 "auto_multi_threshold": self.download.auto_multi_threshold,
+                "auto_tune": self.download.auto_tune,
             },
             "upload": {
                 "chunk_size": self.upload.chunk_size,
@@ -1,13 +1,37 @@
+from .aio import AsyncMultiDownloader, adownload
 from .common import download
+from .events import DownloadEvents, TraceExporter
+from .extract import download_extract
+from .manager import DownloadManager, DownloadResult, download_many
 from .multi import download as multi_download
 from .multi import download as multi_thread_download
+from .process import ProcessMultiDownloader
+from .process import download as process_download
+from .remote import RemoteFile
+from .remotezip import download_zip_members
 from .single import download as simple_download
 from .single import download as single_download
+from .stream import RemoteStream, iter_download, open_remote
 
 __all__ = [
+    "adownload",
+    "AsyncMultiDownloader",
+    "DownloadEvents",
+    "DownloadManager",
+    "DownloadResult",
+    "download_many",
+    "iter_download",
+    "open_remote",
     "single_download",
     "multi_download",
     "download",
+    "download_extract",
+    "download_zip_members",
     "multi_thread_download",
+    "process_download",
+    "ProcessMultiDownloader",
+    "RemoteFile",
+    "RemoteStream",
     "simple_download",
+    "TraceExporter",
 ]
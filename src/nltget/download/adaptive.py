@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from funlog import getLogger
+
+logger = getLogger("funget")
+
+# 视为服务端限流或过载的状态码
+THROTTLE_STATUS = (429, 503)
+
+
+def is_congestion_error(error: Exception) -> bool:
+    """是否为需要降低并发的错误: 限流/过载响应、连接重置或超时"""
+    if isinstance(error, requests.exceptions.RetryError):
+        # urllib3 对 429/503 的重试耗尽
+        return True
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in THROTTLE_STATUS
+    return isinstance(
+        error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    )
+
+
+class AdaptiveConcurrency:
+    """AIMD 并发控制器
+
+    从较低的并发数开始, 每个采样周期把总吞吐量与目前的最高吞吐量比较: 明显更高时记下
+    达到它的并发数并加一个连接; 持平时说明多出的连接没有带来收益, 退回到达到最高吞吐量的
+    并发数(每次最多乘以 plateau_decrease), 保持 hold_intervals 个周期后再加一个连接试探;
+    吞吐量明显下降时以当前吞吐量作为新的基准。出现限流(429/503)、连接重置时并发数乘以
+    decrease, 同样重新确定基准。
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 64,
+        interval: float = 1.0,
+        increase: int = 1,
+        decrease: float = 0.5,
+        plateau_decrease: float = 0.75,
+        threshold: float = 0.05,
+        hold_intervals: int = 3,
+    ):
+        """
+        :param initial: 初始并发数
+        :param minimum: 最小并发数
+        :param maximum: 最大并发数
+        :param interval: 采样周期(秒)
+        :param increase: 吞吐量上升时每个周期增加的并发数
+        :param decrease: 出现限流或连接错误时的乘性减小系数
+        :param plateau_decrease: 吞吐量停止上升时单次回退的最小系数
+        :param threshold: 吞吐量变化超过该比例才视为上升或下降
+        :param hold_intervals: 回退后保持不变的周期数, 之后再向上试探
+        """
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.peak = self.limit
+        self.interval = interval
+        self.increase = increase
+        self.decrease = decrease
+        self.plateau_decrease = plateau_decrease
+        self.threshold = threshold
+        self.hold_intervals = max(0, hold_intervals)
+        self.throughput = 0.0
+        # 目前的最高吞吐量, 以及达到它的最小并发数
+        self.best_throughput: Optional[float] = None
+        self.best_limit = self.limit
+        # 每个周期的 (并发数, 吞吐量), 便于事后分析
+        self.history: List[Tuple[int, float]] = []
+        self._lock = Lock()
+        self._errors = 0
+        self._last_bytes: Optional[int] = None
+        self._last_time: Optional[float] = None
+        self._hold = 0
+
+    def on_error(self, error: Exception):
+        """记录一次请求错误, 拥塞类错误在下个周期触发降并发"""
+        if is_congestion_error(error):
+            with self._lock:
+                self._errors += 1
+
+    def update(self, total_bytes: int, now: Optional[float] = None) -> int:
+        """根据截至目前的总下载字节数调整并发数
+
+        Args:
+            total_bytes: 累计下载的字节数
+            now: 当前时间, 默认取 time.monotonic()
+
+        Returns:
+            int: 调整后的并发数
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            errors, self._errors = self._errors, 0
+            if self._last_time is None or now <= self._last_time:
+                self._last_bytes, self._last_time = total_bytes, now
+                return self.limit
+
+            self.throughput = (total_bytes - self._last_bytes) / (now - self._last_time)
+            self._last_bytes, self._last_time = total_bytes, now
+            limit = min(max(self._next_limit(errors), self.minimum), self.maximum)
+
+            if limit != self.limit:
+                logger.debug(
+                    f"Concurrency {self.limit} -> {limit} "
+                    f"(throughput {self.throughput / 1024 / 1024:.1f}MB/s, errors {errors})"
+                )
+            self.limit = limit
+            self.peak = max(self.peak, limit)
+            self.history.append((limit, self.throughput))
+            return limit
+
+    def _next_limit(self, errors: int) -> int:
+        """根据本周期的吞吐量决定下一个周期的并发数, 调用方需持有锁"""
+        throughput, best = self.throughput, self.best_throughput
+        if errors:
+            # 限流或连接错误: 乘性减小, 以本周期的吞吐量作为新的基准
+            limit = max(int(self.limit * self.decrease), self.minimum)
+            self.best_throughput, self.best_limit = throughput, limit
+            self._hold = self.hold_intervals
+            return limit
+        if best is None or throughput > best * (1 + self.threshold):
+            # 吞吐量明显上升, 继续加连接
+            self.best_throughput, self.best_limit = throughput, self.limit
+            return self.limit + self.increase
+        if throughput >= best * (1 - self.threshold):
+            # 吞吐量持平
+            self.best_throughput = max(best, throughput)
+            if self.limit > self.best_limit:
+                # 多出的连接没有带来收益, 退回到达到最高吞吐量的并发数
+                self._hold = self.hold_intervals
+                return max(self.best_limit, int(self.limit * self.plateau_decrease))
+            # 更少的连接也能达到最高吞吐量
+            self.best_limit = self.limit
+            if self._hold > 0:
+                self._hold -= 1
+                return self.limit
+            return self.limit + self.increase
+        # 并发数没有减少而吞吐量下降, 说明链路变差, 以当前吞吐量作为新的基准
+        self.best_throughput, self.best_limit = throughput, self.limit
+        self._hold = self.hold_intervals
+        return self.limit
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.limit,
+            "peak_concurrency": self.peak,
+            "throughput": self.throughput,
+        }
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import functools
+import os
+import time
+from typing import Optional, Union
+
+from funlog import getLogger
+
+from ..metrics import (
+    BYTES,
+    REQUEST_DURATION,
+    RETRIES,
+    TIME_TO_FIRST_BYTE,
+    WORKER_THROUGHPUT,
+    retry_cause,
+)
+from .events import RangeState, emits_complete
+from .multi import MultiDownloader
+from .progress import ProgressRenderer
+from .sink import Sink
+from .work import ResourceChangedError
+
+logger = getLogger("funget")
+
+
+def _import_aiohttp():
+    """按需导入 aiohttp, 未安装时给出安装提示"""
+    try:
+        import aiohttp
+    except ImportError as e:
+        raise ImportError(
+            "AsyncMultiDownloader requires aiohttp, install it with `pip install nltget[async]`"
+        ) from e
+    return aiohttp
+
+
+class AsyncMultiDownloader(MultiDownloader):
+    """基于 asyncio 的多连接下载器
+
+    每个范围请求都是同一个事件循环上的协程, 所有请求共享一个连接池和一个写入器,
+    不再为每个范围占用一个线程。范围划分和断点续传与 MultiDownloader 保持一致。
+    """
+
+    @staticmethod
+    async def _write(loop, fw: Sink, chunk, offset: int) -> int:
+        """在线程池中写入一块数据
+
+        写入和它可能触发的校验值读回都是阻塞 I/O, 放到事件循环中会卡住其他范围。
+        任务被取消时等待写入结束再退出, 避免关闭写入目标后还有线程在写。
+        """
+        future = loop.run_in_executor(
+            None, functools.partial(fw.write, chunk=chunk, offset=offset)
+        )
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait([future])
+            raise
+
+    async def _fetch_range(
+        self,
+        session,
+        fw,
+        start: int,
+        end: int,
+        chunk_size: int,
+        max_retries: int,
+        progress,
+    ) -> bool:
+        """下载一个范围, 失败时按指数退避重试"""
+        aiohttp = _import_aiohttp()
+        loop = asyncio.get_running_loop()
+        curser = start
+        range_started = time.monotonic()
+        events = self.events
+        state = None
+        if events is not None:
+            state = RangeState(start, end, fw)
+            events.on_range_start(state)
+        for attempt in range(max_retries + 1):
+            headers = {"Range": f"bytes={curser}-{end}"}
+            if self._if_range():
+                headers["If-Range"] = self._if_range()
+            headers.update(self.headers)
+            started = time.monotonic()
+            first_byte = True
+            try:
+                async with session.get(self.request_url, headers=headers) as resp:
+                    # 416 表示范围请求无效, 可能已经下载完成
+                    if resp.status == 416:
+                        if state is not None:
+                            events.on_range_done(state, True)
+                        return True
+                    resp.raise_for_status()
+                    # 续传时收到完整内容, 说明远端文件已经改变
+                    if resp.status == 200 and self._if_range():
+                        raise ResourceChangedError(
+                            f"{self.url} changed since the download started"
+                        )
+                    async for chunk in resp.content.iter_chunked(chunk_size):
+                        if first_byte:
+                            first_byte = False
+                            TIME_TO_FIRST_BYTE.observe(
+                                time.monotonic() - started, direction="download"
+                            )
+                        size = await self._write(loop, fw, chunk, curser)
+                        if state is not None:
+                            state.downloaded += size
+                            events.on_chunk(state, curser, size)
+                        curser += size
+                        progress.update(size)
+                        BYTES.inc(size, direction="download")
+                finished = time.monotonic()
+                REQUEST_DURATION.observe(finished - started, direction="download")
+                if curser > start and finished > range_started:
+                    WORKER_THROUGHPUT.observe(
+                        (curser - start) / (finished - range_started)
+                    )
+                if state is not None:
+                    events.on_range_done(state, True)
+                return True
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(
+                    f"Download attempt {attempt + 1} for range {curser}-{end} failed: {e}"
+                )
+                if attempt == max_retries:
+                    logger.error(
+                        f"Download failed after {max_retries + 1} attempts: {curser}-{end}"
+                    )
+                    if state is not None:
+                        events.on_range_done(state, False, e)
+                    return False
+                RETRIES.inc(cause=retry_cause(e))
+                if state is not None:
+                    events.on_retry(state, attempt + 1, e)
+                # 指数退避
+                await asyncio.sleep(2**attempt)
+        return False
+
+    @emits_complete
+    async def adownload(
+        self,
+        worker_num: int = 5,
+        prefix: str = "",
+        overwrite: bool = False,
+        max_retries: int = 3,
+        chunk_size: int = 2 * 1024 * 1024,
+        sink: Union[str, Sink] = "file",
+        preallocate: Optional[str] = None,
+        checksum=None,
+        verify: bool = True,
+        *args,
+        **kwargs,
+    ) -> bool:
+        """执行异步下载
+
+        Args:
+            worker_num: 最大并发连接数
+            prefix: 进度条前缀
+            overwrite: 是否覆盖已存在的文件
+            max_retries: 每个范围的最大重试次数
+            chunk_size: 单次读取的最大字节数
+            sink: 写入目标, file/pwrite/mmap/memory/null 或 Sink 实例
+            preallocate: 预分配策略, fallocate/sparse/none, 默认取 DownloadConfig.preallocate
+            checksum: 期望的校验值, 如 "sha256:<hex>"
+            verify: 未给出 checksum 时是否使用响应头中的校验值
+
+        Returns:
+            bool: 下载是否成功
+        """
+        aiohttp = _import_aiohttp()
+        try:
+            if overwrite and self.journal is not None:
+                self._discard_journal()
+
+            writes_file = self._writes_file(sink)
+            # 检查本地文件是否已是最新版本, 存在续传日志说明上次下载没有完成
+            if writes_file and self.journal is None and self.is_up_to_date(overwrite):
+                logger.info(f"File {self.filepath} is up to date, skipping download.")
+                return True
+            # 读写缓存涉及整文件的复制和哈希, 放到线程池中执行
+            loop = asyncio.get_running_loop()
+            if (
+                writes_file
+                and self.journal is None
+                and await loop.run_in_executor(None, self._restore_from_cache)
+            ):
+                return True
+
+            # 确保目录存在
+            if writes_file:
+                os.makedirs(
+                    os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True
+                )
+
+            progress = ProgressRenderer(
+                path=self.filepath,
+                total=self.filesize,
+                prefix=f"{prefix}|{self.blocks_num}|",
+            ).start()
+            connector = aiohttp.TCPConnector(
+                limit=worker_num, limit_per_host=worker_num
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=None, sock_connect=self.timeout, sock_read=60
+            )
+            try:
+                with self._open_sink(sink, preallocate) as fw:
+                    fw.digest = self._create_digest(
+                        checksum, verify, fw.read if fw.readable else None
+                    )
+                    self._prefill(fw)
+                    async with aiohttp.ClientSession(
+                        connector=connector, timeout=timeout
+                    ) as session:
+                        tasks = []
+                        for index, start, end, done in self._pending_ranges(fw):
+                            if done > 0:
+                                progress.update(done)
+                            if start > end:
+                                continue
+                            tasks.append(
+                                asyncio.ensure_future(
+                                    self._fetch_range(
+                                        session,
+                                        fw,
+                                        start,
+                                        end,
+                                        chunk_size,
+                                        max_retries,
+                                        progress,
+                                    )
+                                )
+                            )
+                        try:
+                            results = await asyncio.gather(*tasks)
+                        except BaseException:
+                            # 任一范围失败(如远端文件改变)时取消其余请求
+                            for task in tasks:
+                                task.cancel()
+                            await asyncio.gather(*tasks, return_exceptions=True)
+                            raise
+                    success = all(results)
+                    corrupted = success and not await loop.run_in_executor(
+                        None, self._verify_digest, fw.digest
+                    )
+                    # 未完成时保留续传记录, 校验失败时数据作废, 记录也随之删除
+                    fw.close(complete=success)
+                if corrupted:
+                    if writes_file:
+                        self._discard_corrupted()
+                    return False
+                if success and writes_file:
+                    self._save_metadata()
+                    await loop.run_in_executor(None, self._save_to_cache)
+                return success
+            finally:
+                progress.close()
+
+        except ResourceChangedError as e:
+            # 远端文件已改变, 已下载的数据作废, 重新下载
+            logger.warning(f"{e}, restarting")
+            self._discard_journal()
+            return await self.adownload(
+                worker_num=worker_num,
+                prefix=prefix,
+                overwrite=True,
+                max_retries=max_retries,
+                chunk_size=chunk_size,
+                sink=sink,
+                preallocate=preallocate,
+                checksum=checksum,
+                verify=verify,
+            )
+        except Exception as e:
+            logger.error(f"Unexpected error during async download: {e}")
+            return False
+
+    def download(self, *args, **kwargs) -> bool:
+        """在新的事件循环中执行异步下载"""
+        return asyncio.run(self.adownload(*args, **kwargs))
+
+
+async def adownload(
+    url: str,
+    filepath: str,
+    overwrite: bool = False,
+    worker_num: int = 5,
+    block_size: int = 100,
+    prefix: str = "",
+    max_retries: int = 3,
+    checksum=None,
+    *args,
+    **kwargs,
+) -> bool:
+    """异步多连接下载文件
+
+    Args:
+        url: 下载链接
+        filepath: 保存路径
+        overwrite: 是否覆盖已存在的文件
+        worker_num: 最大并发连接数
+        block_size: 块大小(MB)
+        prefix: 进度条前缀
+        max_retries: 最大重试次数
+        checksum: 期望的校验值, 如 "sha256:<hex>", 为空时使用响应头中的校验值
+
+    Returns:
+        bool: 下载是否成功
+    """
+    try:
+        # 初始化时的文件信息探测是同步请求, 放到线程池中避免阻塞事件循环
+        loop = asyncio.get_running_loop()
+        downloader = await loop.run_in_executor(
+            None,
+            functools.partial(
+                AsyncMultiDownloader,
+                url=url,
+                filepath=filepath,
+                overwrite=overwrite,
+                block_size=block_size,
+                *args,
+                **kwargs,
+            ),
+        )
+        return await downloader.adownload(
+            worker_num=worker_num,
+            prefix=prefix,
+            overwrite=overwrite,
+            max_retries=max_retries,
+            checksum=checksum,
+        )
+    except Exception as e:
+        logger.error(f"Async download failed: {e}")
+        return False
@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+import errno
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+from funlog import getLogger
+
+from ..config import get_config
+from .metadata import same_version
+
+logger = getLogger("funget")
+
+
+LINK_MODES = ("auto", "hardlink", "copy")
+
+# linux/fs.h 中的 FICLONE, 在支持的文件系统(btrfs/xfs 等)上共享数据块
+FICLONE = 0x40049409
+
+
+def default_cache_dir() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "nltget", "cache")
+
+
+def file_digest(filepath: str, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件内容的 sha256"""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as fr:
+        for data in iter(lambda: fr.read(chunk_size), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+
+def _copy_range(fr, fw, size: int):
+    """优先用 copy_file_range 在内核中复制, 不支持时退化为普通读写"""
+    copied = 0
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is not None:
+        try:
+            while copied < size:
+                n = copy_file_range(fr.fileno(), fw.fileno(), size - copied)
+                if n == 0:
+                    break
+                copied += n
+            if copied >= size:
+                return
+        except OSError as e:
+            if e.errno not in (
+                errno.EXDEV,
+                errno.ENOSYS,
+                errno.EOPNOTSUPP,
+                errno.EINVAL,
+            ):
+                raise
+    fr.seek(copied)
+    fw.seek(copied)
+    shutil.copyfileobj(fr, fw, 1024 * 1024)
+
+
+def clone_file(src: str, dst: str, link: str = "auto") -> str:
+    """把 src 的内容放到 dst, 先写入同目录下的临时文件再原子地替换 dst
+
+    Args:
+        src: 源文件
+        dst: 目标文件
+        link: auto 依次尝试 reflink、copy_file_range 和普通复制; hardlink 优先创建硬链接,
+            跨文件系统时退化为 auto; copy 不使用 reflink
+
+    Returns:
+        str: 实际使用的方式, hardlink/reflink/copy
+    """
+    if link not in LINK_MODES:
+        raise ValueError(f"Unknown link mode: {link}, expected one of {LINK_MODES}")
+    directory = os.path.dirname(os.path.abspath(dst))
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, f".{os.path.basename(dst)}.{uuid.uuid4().hex}.tmp")
+    method = None
+    try:
+        if link == "hardlink":
+            try:
+                os.link(src, tmp)
+                method = "hardlink"
+            except OSError as e:
+                logger.debug(f"Hardlink {src} failed: {e}, falling back to copy")
+        if method is None:
+            with open(src, "rb") as fr, open(tmp, "wb") as fw:
+                if link != "copy" and _reflink(fr.fileno(), fw.fileno()):
+                    method = "reflink"
+                else:
+                    _copy_range(fr, fw, os.fstat(fr.fileno()).st_size)
+                    method = "copy"
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+    return method
+
+
+@dataclass
+class CacheEntry:
+    """缓存索引中一个 URL 对应的内容"""
+
+    url: str
+    digest: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    size: int
+    updated: float = 0.0
+
+    def matches(
+        self, etag: Optional[str], last_modified: Optional[str], size: int
+    ) -> bool:
+        """远端文件是否与缓存的是同一个版本"""
+        if size > 0 and size != self.size:
+            return False
+        return same_version(self.etag, self.last_modified, etag, last_modified)
+
+
+class DownloadCache:
+    """按内容寻址的本地下载缓存
+
+    下载完成的文件以 sha256 为名保存在 objects 目录下, 内容相同的文件只保存一份;
+    index.db 记录 URL 到内容的映射和远端文件的 ETag/Last-Modified。再次下载同一个 URL
+    且远端文件未改变时, 直接从缓存生成目标文件, 不再请求数据。
+    索引是 WAL 模式的 sqlite, 每次操作使用独立的连接, 缓存文件先写临时文件再原子地改名,
+    多个线程和进程可以共用同一个缓存目录。超过 max_size 时按最近访问时间淘汰。
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_size: int = 0,
+        link: str = "auto",
+        timeout: float = 30.0,
+    ):
+        """
+        :param directory: 缓存目录, 默认为 ~/.cache/nltget/cache
+        :param max_size: 缓存的最大字节数, 0 表示不限制
+        :param link: 命中时生成目标文件的方式, 见 clone_file; hardlink 时目标文件与缓存
+            共用同一份数据, 不能原地修改
+        :param timeout: 索引被其他进程锁定时的等待时间(秒)
+        """
+        if link not in LINK_MODES:
+            raise ValueError(f"Unknown link mode: {link}, expected one of {LINK_MODES}")
+        self.directory = os.path.abspath(directory or default_cache_dir())
+        self.max_size = max_size
+        self.link = link
+        self.timeout = timeout
+        self.objects_dir = os.path.join(self.directory, "objects")
+        self.index_path = os.path.join(self.directory, "index.db")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS objects (
+                    digest TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS urls (
+                    url TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    size INTEGER NOT NULL,
+                    updated REAL NOT NULL
+                )
+                """
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # 自行管理事务, 写操作用 BEGIN IMMEDIATE 尽早取得写锁
+        return sqlite3.connect(
+            self.index_path, timeout=self.timeout, isolation_level=None
+        )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT url, digest, etag, last_modified, size, updated "
+                "FROM urls WHERE url = ?",
+                (url,),
+            ).fetchone()
+        finally:
+            conn.close()
+        return CacheEntry(*row) if row else None
+
+    def lookup(
+        self,
+        url: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        size: int = 0,
+    ) -> Optional[CacheEntry]:
+        """查找远端文件当前版本的缓存, 校验信息不一致时视为未命中"""
+        entry = self.get(url)
+        if entry is None or not entry.matches(etag, last_modified, size):
+            return None
+        return entry
+
+    def fetch(
+        self,
+        url: str,
+        filepath: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        size: int = 0,
+    ) -> bool:
+        """命中缓存时生成目标文件
+
+        Returns:
+            bool: 是否命中缓存
+        """
+        entry = self.lookup(url, etag, last_modified, size)
+        if entry is None:
+            return False
+        path = self.object_path(entry.digest)
+        try:
+            if os.path.getsize(path) != entry.size:
+                raise OSError(errno.EIO, f"Corrupted cache object {path}")
+            method = clone_file(path, filepath, self.link)
+        except OSError as e:
+            # 缓存文件已被其他进程淘汰或已损坏
+            logger.warning(f"Cache object of {url} unavailable: {e}")
+            self._forget([entry.digest])
+            return False
+        self._touch(entry.digest)
+        logger.info(f"Cache hit for {url}, {filepath} created by {method}")
+        return True
+
+    def store(
+        self,
+        url: str,
+        filepath: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        digest: Optional[str] = None,
+    ) -> Optional[str]:
+        """把下载完成的文件放入缓存, 没有校验信息时无法判断远端是否改变, 不缓存
+
+        Args:
+            digest: 下载时已经算出的 sha256, 为空时读取文件计算
+
+        Returns:
+            Optional[str]: 文件内容的 sha256, 未缓存时返回 None
+        """
+        if not etag and not last_modified:
+            return None
+        digest = digest or file_digest(filepath)
+        size = os.path.getsize(filepath)
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            # 不使用硬链接, 避免之后修改目标文件时改动缓存内容
+            clone_file(filepath, path, "auto")
+            os.chmod(path, 0o444)
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?)", (digest, size, now)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?, ?)",
+                (url, digest, etag, last_modified, size, now),
+            )
+        if self.max_size > 0:
+            self.evict()
+        return digest
+
+    def _touch(self, digest: str):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE objects SET accessed = ? WHERE digest = ?",
+                (time.time(), digest),
+            )
+
+    def _forget(self, digests: List[str]):
+        """从索引中删除内容及引用它的 URL, 提交后再删除缓存文件"""
+        if not digests:
+            return
+        with self._transaction() as conn:
+            for digest in digests:
+                conn.execute("DELETE FROM urls WHERE digest = ?", (digest,))
+                conn.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+        for digest in digests:
+            try:
+                os.remove(self.object_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def evict(self, max_size: Optional[int] = None) -> List[str]:
+        """按最近访问时间淘汰缓存, 直到总大小不超过 max_size
+
+        Args:
+            max_size: 保留的最大字节数, 为空时使用 self.max_size
+
+        Returns:
+            List[str]: 被淘汰的内容的 sha256
+        """
+        max_size = self.max_size if max_size is None else max_size
+        removed = []
+        with self._transaction() as conn:
+            total = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM objects"
+            ).fetchone()[0]
+            if total <= max_size:
+                return removed
+            for digest, size in conn.execute(
+                "SELECT digest, size FROM objects ORDER BY accessed"
+            ).fetchall():
+                if total <= max_size:
+                    break
+                removed.append(digest)
+                total -= size
+            for digest in removed:
+                conn.execute("DELETE FROM urls WHERE digest = ?", (digest,))
+                conn.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+        for digest in removed:
+            try:
+                os.remove(self.object_path(digest))
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info(f"Evicted {len(removed)} objects from cache {self.directory}")
+        return removed
+
+    def clear(self):
+        """清空缓存"""
+        self.evict(0)
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._connect()
+        try:
+            objects, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects"
+            ).fetchone()
+            urls = conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+        finally:
+            conn.close()
+        return {"objects": objects, "urls": urls, "size": size}
+
+
+def resolve_cache(cache=None) -> Optional[DownloadCache]:
+    """取得下载缓存
+
+    Args:
+        cache: DownloadCache 实例、缓存目录或 True(默认目录),
+            为空时使用 DownloadConfig.cache_dir, 未配置时不使用缓存
+
+    Returns:
+        Optional[DownloadCache]: 下载缓存, 未启用时返回 None
+    """
+    if isinstance(cache, DownloadCache):
+        return cache
+    if cache is None:
+        cache = get_config().download.cache_dir
+    if not cache:
+        return None
+    return DownloadCache(
+        None if cache is True else cache,
+        max_size=get_config().download.cache_max_size,
+    )
@@ -1,8 +1,17 @@
 # -*- coding: utf-8 -*-
+from typing import Optional
+
 from funlog import getLogger
 
+from funget.config import get_config
+from funget.download.cache import resolve_cache
+from funget.download.extract import download_extract
+from funget.download.metadata import resolve_metadata
 from funget.download.multi import MultiDownloader
+from funget.download.pool import SessionPool
+from funget.download.probe import RemoteInfo
 from funget.download.single import SingleDownloader
+from funget.download.tune import AutoTuner
 
 logger = getLogger("funget")
 
@@ -13,11 +22,13 @@ def download(
     multi: bool = None,
     overwrite: bool = False,
     prefix: str = "",
-    chunk_size: int = 2048,
-    worker_num: int = 5,
+    chunk_size: Optional[int] = None,
+    worker_num: Optional[int] = None,
     capacity: int = 100,
-    block_size: int = 100,
+    block_size: Optional[int] = None,
     max_retries: int = 3,
+    tuner: Optional[AutoTuner] = None,
+    extract: Optional[str] = None,
     *args,
     **kwargs,
 ) -> bool:
@@ -29,56 +40,117 @@ def download(
         multi: 是否使用多线程下载，None表示自动选择
         overwrite: 是否覆盖已存在的文件
         prefix: 进度条前缀
-        chunk_size: 数据块大小(字节)，仅用于单线程下载
-        worker_num: 工作线程数，仅用于多线程下载
+        chunk_size: 数据块大小(字节)，None表示自动选择
+        worker_num: 工作线程数，仅用于多线程下载，None表示自动选择
         capacity: 队列容量，仅用于多线程下载
-        block_size: 块大小(MB)，仅用于多线程下载
+        block_size: 块大小(MB)，仅用于多线程下载，None表示自动选择
         max_retries: 最大重试次数
+        tuner: 自动调优器，为空时使用默认参数的 AutoTuner；
+            DownloadConfig.auto_tune 为假时不调优，按 auto_multi_threshold 选择下载方式
+        extract: 边下载边解压的方式，gzip/xz/zstd/tar/zip，auto 表示按地址后缀推断；
+            设置后压缩包本身不落盘，filepath 为解压后的文件（gzip/xz/zstd）或解包目录（tar/zip）
 
     Returns:
         bool: 下载是否成功
     """
+    pool = SessionPool(max_retries=max_retries)
     try:
-        # 如果没有指定下载方式，自动选择
-        if multi is None:
-            # 创建一个临时的多线程下载器来检查是否支持范围请求
-            temp_downloader = MultiDownloader(
-                url=url, filepath=filepath, overwrite=overwrite, *args, **kwargs
-            )
+        # 有下载记录时探测请求附带条件请求头, 远端未改变时返回 304
+        metadata = resolve_metadata(kwargs.pop("metadata", None))
+        headers = dict(kwargs.get("headers") or {})
+        # 解压后的内容与远端文件不同, 不使用下载记录的条件请求
+        if metadata is not None and not extract:
+            headers.update(metadata.conditional_headers(url, filepath))
+        cache = resolve_cache(kwargs.pop("cache", None))
 
-            # 根据文件大小和服务器支持情况自动选择
-            file_size = temp_downloader.filesize
-            supports_range = temp_downloader.check_available()
+        # 只发送一次探测请求, 结果和连接由后续的下载器复用
+        info = RemoteInfo.probe(
+            url,
+            session=pool.session,
+            headers=headers,
+            timeout=kwargs.get("timeout", 30),
+            auth=kwargs.get("auth"),
+        )
 
-            # 文件大小大于10MB且支持范围请求时使用多线程
-            multi = file_size > 10 * 1024 * 1024 and supports_range
+        # 根据文件大小和探测测得的往返时间、吞吐量选择下载方式和参数, 调用方指定的参数优先
+        config = get_config().download
+        if config.auto_tune:
+            tuned = (tuner or AutoTuner()).tune(info)
+            logger.info(f"Auto-tuned download of {url}: {tuned}")
+            if multi is None:
+                multi = tuned.multi
+            chunk_size = chunk_size or tuned.chunk_size
+            worker_num = worker_num or tuned.worker_num
+            block_size = block_size or tuned.block_size
+        else:
+            tuned = None
+            if multi is None:
+                multi = info.size > config.auto_multi_threshold and info.accept_ranges
+                logger.info(
+                    f"Auto-selected {'multi-thread' if multi else 'single-thread'} download "
+                    f"(file size: {info.size:,} bytes, range support: {info.accept_ranges})"
+                )
+            chunk_size = chunk_size or 2048
+            worker_num = worker_num or 5
+            block_size = block_size or 100
 
-            logger.info(
-                f"Auto-selected {'multi-thread' if multi else 'single-thread'} download "
-                f"(file size: {file_size:,} bytes, range support: {supports_range})"
+        if extract:
+            return download_extract(
+                url,
+                filepath,
+                mode=extract,
+                worker_num=worker_num if multi else 1,
+                block_size=block_size,
+                # 与下载文件时一致, chunk_size 参数只用于单线程
+                chunk_size=(tuned.chunk_size if tuned else 256 * 1024)
+                if multi
+                else chunk_size,
+                headers=kwargs.get("headers"),
+                max_retries=max_retries,
+                pool=pool,
+                info=info,
             )
-
         if multi:
             loader = MultiDownloader(
                 url=url,
                 filepath=filepath,
                 overwrite=overwrite,
                 block_size=block_size,
+                pool=pool,
+                info=info,
+                metadata=metadata,
+                cache=cache,
                 *args,
                 **kwargs,
             )
+            # chunk_size 参数只用于单线程下载, 多线程下载只使用调优得到的读取大小
+            options = {}
+            if tuned is not None:
+                loader.stats["tune"] = tuned.to_dict()
+                options["chunk_size"] = tuned.chunk_size
             return loader.download(
                 prefix=prefix,
                 worker_num=worker_num,
                 capacity=capacity,
                 max_retries=max_retries,
                 *args,
+                **options,
                 **kwargs,
             )
         else:
             loader = SingleDownloader(
-                url=url, filepath=filepath, overwrite=overwrite, *args, **kwargs
+                url=url,
+                filepath=filepath,
+                overwrite=overwrite,
+                pool=pool,
+                info=info,
+                metadata=metadata,
+                cache=cache,
+                *args,
+                **kwargs,
             )
+            if tuned is not None:
+                loader.stats["tune"] = tuned.to_dict()
             return loader.download(
                 prefix=prefix, chunk_size=chunk_size, *args, **kwargs
             )
@@ -86,3 +158,5 @@ def download(
     except Exception as e:
         logger.error(f"Download failed: {e}")
         return False
+    finally:
+        pool.close()
@@ -4,9 +4,14 @@ from typing import Any, Dict, Optional
 
 import requests
 from funlog import getLogger
-from requests.adapters import HTTPAdapter
 from requests.auth import HTTPDigestAuth
-from urllib3.util.retry import Retry
+
+from .cache import DownloadCache, resolve_cache
+from .digest import ChecksumError, StreamDigest, choose_algorithm, parse_checksum
+from .events import DownloadEvents
+from .metadata import FileMetadata, MetadataStore, resolve_metadata
+from .pool import SessionPool
+from .probe import RemoteInfo
 
 logger = getLogger("funget")
 
@@ -24,6 +29,12 @@ class Downloader:
         max_retries: int = 3,
         timeout: int = 30,
         auth: Optional[HTTPDigestAuth] = None,
+        shared_pool: bool = False,
+        pool: Optional[SessionPool] = None,
+        info: Optional[RemoteInfo] = None,
+        metadata: Optional[MetadataStore] = None,
+        cache: Optional[DownloadCache] = None,
+        events: Optional[DownloadEvents] = None,
         *args,
         **kwargs,
     ):
@@ -34,50 +45,229 @@ class Downloader:
         self.overwrite = overwrite
         self.max_retries = max_retries
         self.timeout = timeout
+        self.shared_pool = shared_pool
+        # 调用方传入的连接池由调用方负责关闭
+        self._external_pool = pool
+        # 下载记录, 启用后通过条件请求跳过未改变的文件
+        self.metadata = resolve_metadata(metadata)
+        # 下载缓存, 启用后远端文件未改变时直接从缓存生成目标文件
+        self.cache = resolve_cache(cache)
+        # 下载过程的事件钩子, 见 DownloadEvents
+        self.events = events
+        self.stats: Dict[str, Any] = {}  # 最近一次下载的统计信息
+        # 最近一次下载计算出的校验值和期望的校验值, {算法: 十六进制}
+        self.digests: Dict[str, str] = {}
+        self._expected_digests: Dict[str, str] = {}
+        # 远端文件的校验信息, 探测文件大小时获取
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        # 探测结果, 传入时不再发送探测请求
+        self.info: Optional[RemoteInfo] = None
         self._session = self._create_session()  # 先创建 session
-        self.filesize = filesize or self.__get_size()  # 然后获取文件大小
+        if info is not None:
+            self._set_info(info)
+            self.filesize = filesize or info.size
+        else:
+            self.filesize = filesize or self.__get_size()  # 然后获取文件大小
         self.filename = os.path.basename(self.filepath)
 
     def _create_session(self) -> requests.Session:
-        """创建带有重试策略的会话"""
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=self.max_retries,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET", "OPTIONS"],
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        return session
+        """创建带有重试策略的会话
+
+        shared_pool 为 True 时使用进程级按主机共享的连接池, 多个下载之间复用连接;
+        传入 pool 时直接使用该连接池。
+        """
+        if self._external_pool is not None:
+            self._pool = self._external_pool
+        elif self.shared_pool:
+            self._pool = SessionPool.shared(self.url, max_retries=self.max_retries)
+        else:
+            self._pool = SessionPool(max_retries=self.max_retries)
+        return self._pool.session
 
     def download(self, *args, **kwargs) -> bool:
         """下载文件的抽象方法"""
         raise NotImplementedError("Subclasses must implement download method")
 
-    def __get_size(self) -> int:
-        """获取文件大小"""
+    def refresh(self) -> int:
+        """重新探测远端文件的大小和校验信息"""
+        self.info = None
+        self.filesize = self.__get_size()
+        return self.filesize
+
+    def _set_info(self, info: RemoteInfo):
+        if info.not_modified:
+            # 304 响应不含文件大小, 沿用上次下载的记录
+            record = self._metadata_record()
+            if record is not None:
+                info.size = info.size or record.size
+                info.etag = info.etag or record.etag
+                info.last_modified = info.last_modified or record.last_modified
+        self.info = info
+        self.etag = info.etag
+        self.last_modified = info.last_modified
+        if self.events is not None:
+            self.events.on_probe(self, info)
+
+    def _metadata_record(self) -> Optional[FileMetadata]:
+        if self.metadata is None:
+            return None
+        return self.metadata.get(self.url, self.filepath)
+
+    def is_up_to_date(self, overwrite: Optional[bool] = None) -> bool:
+        """本地文件是否已是远端的最新版本, 为真时跳过下载
+
+        有下载记录时以 ETag/Last-Modified 为准: 条件请求返回 304 或校验信息一致时跳过,
+        即使 overwrite 为真; 大小相同但内容已改变的文件会重新下载。
+        没有记录时退回到比较本地文件和远端文件的大小, overwrite 为真时总是重新下载。
+        """
+        overwrite = self.overwrite if overwrite is None else overwrite
+        if self.info is not None and self.info.not_modified:
+            return True
+        record = self._metadata_record()
+        if record is not None:
+            return record.local_unchanged() and record.matches(
+                self.etag, self.last_modified, self.filesize
+            )
+        return (
+            not overwrite
+            and os.path.exists(self.filepath)
+            and os.path.getsize(self.filepath) == self.filesize
+        )
+
+    def _save_metadata(self, blocks=None):
+        """下载成功后记录远端文件的校验信息和本地文件的状态
+
+        Args:
+            blocks: 分块校验值, 见 BlockManifest.to_dict
+        """
+        if self.metadata is None:
+            return
         try:
-            # 首先尝试 HEAD 请求
-            resp = self._session.head(
-                self.url, headers=self.headers, timeout=self.timeout
+            self.metadata.put(
+                self.url, self.filepath, self.etag, self.last_modified, blocks=blocks
+            )
+        except Exception as e:
+            logger.warning(f"Failed to save metadata of {self.filepath}: {e}")
+
+    def _create_digest(
+        self, checksum=None, verify: bool = True, reader=None
+    ) -> Optional[StreamDigest]:
+        """创建边写入边计算的校验值, 不需要校验时返回 None
+
+        Args:
+            checksum: 调用方给出的校验值, 见 parse_checksum
+            verify: 没有给出 checksum 时是否使用响应头中的校验值
+            reader: 读回已写入数据的函数, 见 StreamDigest
+        """
+        expected = parse_checksum(checksum)
+        strict = bool(expected)
+        if not expected and verify and self.info is not None:
+            expected = dict(self.info.digests)
+        self._expected_digests = expected
+        algorithms = set()
+        algorithm = choose_algorithm(expected, strict=strict)
+        if algorithm is not None:
+            algorithms.add(algorithm)
+        if self.cache is not None:
+            # 缓存以 sha256 寻址, 下载时一并计算, 放入缓存时不必再读一遍文件
+            algorithms.add("sha256")
+        if not algorithms:
+            return None
+        return StreamDigest(algorithms, self.filesize, reader=reader)
+
+    def _verify_digest(self, digest: Optional[StreamDigest]) -> bool:
+        """计算并校验下载的数据, 与期望的校验值不一致时返回 False"""
+        self.digests = {}
+        if digest is None:
+            return True
+        try:
+            self.digests = digest.hexdigests()
+        except ChecksumError as e:
+            if self._expected_digests:
+                logger.error(f"Failed to verify {self.filepath}: {e}")
+                return False
+            logger.warning(f"Failed to compute digest of {self.filepath}: {e}")
+            return True
+        for algorithm, expected in self._expected_digests.items():
+            actual = self.digests.get(algorithm)
+            if actual is not None and actual != expected:
+                logger.error(
+                    f"Checksum mismatch for {self.filepath}: "
+                    f"{algorithm} expected {expected}, got {actual}"
+                )
+                return False
+        return True
+
+    def _discard_corrupted(self):
+        """删除校验失败的文件, 下次重新下载"""
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+        if self.metadata is not None:
+            self.metadata.remove(self.url, self.filepath)
+
+    def _restore_from_cache(self) -> bool:
+        """缓存中有远端文件的当前版本时直接生成目标文件, 不再请求数据
+
+        Returns:
+            bool: 是否命中缓存
+        """
+        if self.cache is None:
+            return False
+        try:
+            hit = self.cache.fetch(
+                self.url,
+                self.filepath,
+                etag=self.etag,
+                last_modified=self.last_modified,
+                size=self.filesize,
             )
-            resp.raise_for_status()
-            size = int(resp.headers.get("content-length", 0))
-            if size > 0:
-                return size
         except Exception as e:
-            logger.warning(f"HEAD request failed: {e}, trying GET request")
+            logger.warning(f"Failed to read cache of {self.url}: {e}")
+            return False
+        if hit:
+            self._save_metadata()
+        return hit
+
+    def _save_to_cache(self):
+        """下载成功后把文件放入缓存"""
+        if self.cache is None:
+            return
+        try:
+            self.cache.store(
+                self.url,
+                self.filepath,
+                self.etag,
+                self.last_modified,
+                digest=self.digests.get("sha256"),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to cache {self.filepath}: {e}")
+
+    @property
+    def request_url(self) -> str:
+        """实际请求的地址, 探测时跟随了重定向则直接使用最终地址"""
+        return self.info.final_url if self.info is not None else self.url
+
+    def __get_size(self) -> int:
+        """通过一次范围请求探测文件大小、范围请求支持和校验信息
 
+        有下载记录时附带条件请求头, 远端文件未改变时服务器直接返回 304。
+        """
+        headers = dict(self.headers)
+        if self.metadata is not None:
+            headers.update(self.metadata.conditional_headers(self.url, self.filepath))
         try:
-            # 如果 HEAD 请求失败，尝试 GET 请求
-            resp = self._session.get(
-                self.url, stream=True, headers=self.headers, timeout=self.timeout
+            self._set_info(
+                RemoteInfo.probe(
+                    self.url,
+                    session=self._session,
+                    headers=headers,
+                    timeout=self.timeout,
+                    auth=self.auth,
+                )
             )
-            resp.raise_for_status()
-            size = int(resp.headers.get("content-length", 0))
-            return size
+            return self.info.size
         except Exception as e:
             logger.error(f"Failed to get file size: {e}")
             return 0
@@ -93,7 +283,9 @@ class Downloader:
         }
 
     def validate_url(self) -> bool:
-        """验证 URL 是否有效"""
+        """验证 URL 是否有效, 已经探测成功时不再发送请求"""
+        if self.info is not None:
+            return True
         try:
             resp = self._session.head(
                 self.url, headers=self.headers, timeout=self.timeout, auth=self.auth
@@ -104,5 +296,9 @@ class Downloader:
 
     def __del__(self):
         """清理资源"""
-        if hasattr(self, "_session"):
+        if (
+            hasattr(self, "_session")
+            and not self.shared_pool
+            and self._external_pool is None
+        ):
             self._session.close()
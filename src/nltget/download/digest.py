@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+import base64
+import binascii
+import hashlib
+import zlib
+from threading import Lock
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Union
+
+from funlog import getLogger
+
+logger = getLogger("funget")
+
+
+# CRC 可以按范围分别计算后再合并, 乱序到达的数据不需要读回; 校验时优先使用
+CRC_ALGORITHMS = ("crc32c", "crc32")
+_PREFERENCE = ("crc32c", "crc32", "md5", "sha256", "sha1", "sha512")
+
+_ALIASES = {
+    "crc32c": "crc32c",
+    "crc32": "crc32",
+    "md5": "md5",
+    "sha": "sha1",
+    "sha-1": "sha1",
+    "sha1": "sha1",
+    "sha-256": "sha256",
+    "sha256": "sha256",
+    "sha-512": "sha512",
+    "sha512": "sha512",
+}
+
+_DIGEST_SIZES = {
+    "crc32c": 4,
+    "crc32": 4,
+    "md5": 16,
+    "sha1": 20,
+    "sha256": 32,
+    "sha512": 64,
+}
+
+
+class ChecksumError(Exception):
+    """下载的数据与校验值不一致, 或无法计算校验值"""
+
+
+def _import_crc32c() -> Callable:
+    try:
+        import crc32c
+    except ImportError:
+        raise ImportError(
+            "crc32c checksums require the crc32c package, "
+            "install it with: pip install nltget[crc32c]"
+        )
+    return crc32c.crc32c
+
+
+def _crc_function(algorithm: str) -> Callable:
+    if algorithm == "crc32":
+        return zlib.crc32
+    return _import_crc32c()
+
+
+def available(algorithm: str) -> bool:
+    """当前环境能否计算该校验值"""
+    algorithm = normalize_algorithm(algorithm)
+    if algorithm == "crc32c":
+        try:
+            _import_crc32c()
+        except ImportError:
+            return False
+        return True
+    return algorithm == "crc32" or algorithm in hashlib.algorithms_available
+
+
+def normalize_algorithm(name: str) -> str:
+    name = name.strip().lower()
+    return _ALIASES.get(name, name)
+
+
+class CrcCombiner:
+    """不读取数据, 由 crc(A)、crc(B) 和 B 的长度得到 crc(A + B)
+
+    与 zlib 的 crc32_combine 算法相同, 在 GF(2) 上用 x^(8*len) mod P 乘以 crc(A),
+    计算量只与长度的二进制位数有关。poly 为反射形式的生成多项式。
+    """
+
+    def __init__(self, poly: int):
+        self.poly = poly
+        # x^(2^k) mod P, x^1 在反射表示中为 1 << 30
+        self._x2n = [1 << 30]
+        for _ in range(31):
+            self._x2n.append(self._multmodp(self._x2n[-1], self._x2n[-1]))
+
+    def _multmodp(self, a: int, b: int) -> int:
+        m = 1 << 31
+        p = 0
+        while True:
+            if a & m:
+                p ^= b
+                if (a & (m - 1)) == 0:
+                    break
+            m >>= 1
+            b = (b >> 1) ^ self.poly if b & 1 else b >> 1
+        return p
+
+    def _x2nmodp(self, n: int, k: int) -> int:
+        p = 1 << 31  # x^0
+        while n:
+            if n & 1:
+                p = self._multmodp(self._x2n[k & 31], p)
+            n >>= 1
+            k += 1
+        return p
+
+    def combine(self, crc1: int, crc2: int, len2: int) -> int:
+        return self._multmodp(self._x2nmodp(len2, 3), crc1) ^ crc2
+
+
+_COMBINERS = {"crc32": CrcCombiner(0xEDB88320), "crc32c": CrcCombiner(0x82F63B78)}
+
+
+class StreamDigest:
+    """边写入边计算整个文件的校验值
+
+    多线程下载时各范围的数据乱序到达。CRC 按连续写入的区间分别计算, 结束时按偏移合并,
+    不需要额外读取; md5/sha256 等只能按顺序计算, 紧接已计算位置的数据在写入时直接计算,
+    乱序到达的数据由推进到该位置的线程从写入目标读回, 与下载同时进行,
+    不必在下载完成后再完整读一遍文件。续传前已写入的数据在结束时读回计算。
+    """
+
+    def __init__(
+        self,
+        algorithms: Iterable[str],
+        size: int = 0,
+        reader: Optional[Callable[[int, int], bytes]] = None,
+        read_size: int = 4 * 1024 * 1024,
+    ):
+        """
+        :param algorithms: 校验算法, crc32/crc32c 或 hashlib 支持的算法
+        :param size: 文件大小, 未知时为 0
+        :param reader: 读回已写入数据的函数 reader(offset, size), 为空时只能计算看到的数据
+        :param read_size: 每次读回的最大字节数
+        """
+        self.algorithms = sorted({normalize_algorithm(name) for name in algorithms})
+        self.size = max(0, size)
+        self.reader = reader
+        self.read_size = read_size
+        self._crc = {
+            name: _crc_function(name)
+            for name in self.algorithms
+            if name in CRC_ALGORITHMS
+        }
+        self._ordered = {
+            name: hashlib.new(name)
+            for name in self.algorithms
+            if name not in CRC_ALGORITHMS
+        }
+        self._lock = Lock()
+        # CRC 按连续区间计算, 以结束位置为键: [起始位置, {算法: crc}]
+        self._segments: Dict[int, list] = {}
+        # 顺序算法已计算到的位置, 以及已经写入但尚未计算的区间
+        self._frontier = 0
+        self._pending: Dict[int, int] = {}
+        self._pending_ends: Dict[int, int] = {}
+        self._busy = False
+        self._result: Optional[Dict[str, str]] = None
+
+    def update(self, chunk, offset: int):
+        """记录写入 offset 处的数据, 可以被多个线程同时调用"""
+        size = len(chunk)
+        if size == 0:
+            return
+        if self._crc:
+            with self._lock:
+                segment = self._segments.pop(offset, None)
+            if segment is None:
+                segment = [offset, {name: 0 for name in self._crc}]
+            values = segment[1]
+            for name, fn in self._crc.items():
+                values[name] = fn(chunk, values[name])
+            with self._lock:
+                self._segments[offset + size] = segment
+        if self._ordered:
+            self._update_ordered(chunk, offset)
+
+    def _update_ordered(self, chunk, offset: int):
+        with self._lock:
+            if self._busy or offset != self._frontier:
+                self._add_pending(offset, offset + len(chunk))
+                return
+            self._busy = True
+        self._hash(chunk)
+        self._catch_up(offset + len(chunk))
+
+    def _add_pending(self, start: int, end: int):
+        previous = self._pending_ends.pop(start, None)
+        if previous is not None:
+            start = previous
+        self._pending[start] = end
+        self._pending_ends[end] = start
+
+    def _catch_up(self, position: int):
+        """推进计算位置, 把紧接其后已写入的数据读回计算, 没有后续数据时交出推进权"""
+        while True:
+            with self._lock:
+                self._frontier = position
+                end = self._pending.get(position)
+                if end is None or self.reader is None:
+                    self._busy = False
+                    return
+                del self._pending[position]
+                del self._pending_ends[end]
+            for data in self._read(position, end):
+                self._hash(data)
+            position = end
+
+    def _hash(self, data):
+        for hasher in self._ordered.values():
+            hasher.update(data)
+
+    def _read(self, start: int, end: int) -> Iterator[bytes]:
+        if self.reader is None:
+            raise ChecksumError(
+                f"Cannot read back bytes {start}-{end} to compute digest"
+            )
+        while start < end:
+            data = self.reader(start, min(self.read_size, end - start))
+            if not data:
+                raise ChecksumError(f"Unexpected end of data at {start}")
+            yield data
+            start += len(data)
+
+    def _crc_of(self, name: str, start: int, end: int) -> int:
+        fn = self._crc[name]
+        value = 0
+        for data in self._read(start, end):
+            value = fn(data, value)
+        return value
+
+    def _finish_crc(self, size: int) -> Dict[str, int]:
+        """按偏移合并各区间的 CRC, 没有看到的区间读回计算"""
+        segments = sorted(
+            (start, end, values) for end, (start, values) in self._segments.items()
+        )
+        if any(a[1] > b[0] for a, b in zip(segments, segments[1:])):
+            # 区间重叠说明有数据被重复写入, 直接读回整个文件
+            return {name: self._crc_of(name, 0, size) for name in self._crc}
+        result = {name: 0 for name in self._crc}
+        position = 0
+        for start, end, values in segments + [(size, size, None)]:
+            for name, combiner in ((n, _COMBINERS[n]) for n in self._crc):
+                if start > position:
+                    gap = self._crc_of(name, position, start)
+                    result[name] = combiner.combine(result[name], gap, start - position)
+                if values is not None:
+                    result[name] = combiner.combine(
+                        result[name], values[name], end - start
+                    )
+            position = max(position, end)
+        return result
+
+    def hexdigests(self) -> Dict[str, str]:
+        """所有数据写入后计算校验值, 结果为 {算法: 十六进制}
+
+        Raises:
+            ChecksumError: 有数据既没有看到也无法读回
+        """
+        if self._result is not None:
+            return self._result
+        with self._lock:
+            ends = list(self._segments) + list(self._pending) + [self._frontier]
+        size = self.size or max(ends + list(self._pending.values()))
+        result = {}
+        if self._crc:
+            for name, value in self._finish_crc(size).items():
+                result[name] = f"{value & 0xFFFFFFFF:08x}"
+        if self._ordered:
+            if self._frontier < size:
+                for data in self._read(self._frontier, size):
+                    self._hash(data)
+                self._frontier = size
+            for name, hasher in self._ordered.items():
+                result[name] = hasher.hexdigest()
+        self._result = result
+        return result
+
+
+def _decode(algorithm: str, value: str) -> Optional[str]:
+    """把 base64 或十六进制的校验值统一为十六进制"""
+    value = value.strip().strip(":").strip('"')
+    size = _DIGEST_SIZES.get(algorithm)
+    if size is not None and len(value) == size * 2:
+        try:
+            bytes.fromhex(value)
+            return value.lower()
+        except ValueError:
+            pass
+    try:
+        raw = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    if size is not None and len(raw) != size:
+        return None
+    return raw.hex()
+
+
+def _parse_list(header: Optional[str]) -> Iterator[tuple]:
+    for item in (header or "").split(","):
+        name, sep, value = item.partition("=")
+        if sep:
+            yield normalize_algorithm(name), value
+
+
+def parse_digest_headers(
+    headers: Mapping[str, str], partial: bool = False
+) -> Dict[str, str]:
+    """从响应头中取得整个文件的校验值
+
+    支持 Digest(RFC 3230)、Repr-Digest(RFC 9530)、x-goog-hash 和 Content-MD5。
+    Content-MD5/Content-Digest 描述的是本次响应的内容, 范围请求的响应(partial)中不使用。
+
+    Returns:
+        Dict[str, str]: {算法: 十六进制校验值}
+    """
+    sources = [
+        headers.get("Digest"),
+        headers.get("Repr-Digest"),
+        headers.get("x-goog-hash"),
+    ]
+    if not partial:
+        sources.append(headers.get("Content-Digest"))
+        if headers.get("Content-MD5"):
+            sources.append(f"md5={headers.get('Content-MD5')}")
+    digests = {}
+    for header in sources:
+        for algorithm, value in _parse_list(header):
+            if algorithm not in _DIGEST_SIZES:
+                continue
+            decoded = _decode(algorithm, value)
+            if decoded is not None:
+                digests.setdefault(algorithm, decoded)
+    return digests
+
+
+def parse_checksum(checksum: Union[str, Mapping[str, str], None]) -> Dict[str, str]:
+    """解析调用方给出的校验值, 如 "sha256:<hex>" 或 {"md5": "<hex 或 base64>"}"""
+    if not checksum:
+        return {}
+    if isinstance(checksum, str):
+        name, sep, value = checksum.partition(":")
+        if not sep:
+            name, sep, value = checksum.partition("=")
+        if not sep:
+            raise ValueError(
+                f"Checksum must look like 'sha256:<hex>', got {checksum!r}"
+            )
+        checksum = {name: value}
+    result = {}
+    for name, value in checksum.items():
+        algorithm = normalize_algorithm(name)
+        decoded = _decode(algorithm, value)
+        if decoded is None:
+            raise ValueError(f"Invalid {algorithm} checksum: {value!r}")
+        result[algorithm] = decoded
+    return result
+
+
+def choose_algorithm(
+    expected: Mapping[str, str], strict: bool = False
+) -> Optional[str]:
+    """从可用于校验的算法中选出代价最小的一个
+
+    Args:
+        expected: 期望的校验值
+        strict: 为真时即使都无法计算也返回一个, 由创建 StreamDigest 时报错
+
+    Returns:
+        Optional[str]: 选中的算法, 没有可用的算法时返回 None
+    """
+    names: List[str] = sorted(
+        expected,
+        key=lambda name: (
+            _PREFERENCE.index(name) if name in _PREFERENCE else len(_PREFERENCE)
+        ),
+    )
+    for name in names:
+        if available(name):
+            return name
+    if names:
+        logger.debug(f"No available algorithm to verify {names}")
+        return names[0] if strict else None
+    return None
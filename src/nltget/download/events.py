@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+import functools
+import inspect
+import json
+import os
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+from funlog import getLogger
+
+logger = getLogger("funget")
+
+
+class DownloadEvents:
+    """下载生命周期的事件钩子
+
+    子类只需覆盖关心的方法, 通过 Downloader/Worker/WorkerFactory 的 events 参数传入。
+    未传入时各处只做一次 None 判断, 不产生额外开销。
+    钩子在下载线程中同步调用, 应尽快返回; 钩子抛出的异常会中断对应的请求。
+
+    worker 为 Worker, 不经过 Worker 的请求为 RangeState。
+    """
+
+    def on_probe(self, downloader, info):
+        """取得远端文件信息(RemoteInfo)后调用"""
+
+    def on_range_start(self, worker):
+        """一个范围开始下载时调用, 重试不会再次调用"""
+
+    def on_chunk(self, worker, offset: int, size: int):
+        """每写入一块数据后调用"""
+
+    def on_retry(self, worker, attempt: int, error: BaseException):
+        """请求失败即将重试时调用, attempt 为失败的是第几次尝试"""
+
+    def on_range_done(
+        self, worker, success: bool, error: Optional[BaseException] = None
+    ):
+        """一个范围结束时调用"""
+
+    def on_complete(self, downloader, success: bool):
+        """一次下载结束时调用, 失败后重新下载的递归调用只触发一次"""
+
+
+class RangeState:
+    """不经过 Worker 的范围请求(asyncio 引擎、单线程下载)在事件中的表示
+
+    fileobj 与 Worker.fileobj 相同, 为数据的写入目标, 钩子据此区分同时进行的多个下载;
+    不经过写入目标的下载传入下载器本身。
+    """
+
+    __slots__ = ("range_start", "range_end", "downloaded", "fileobj")
+
+    def __init__(self, range_start: int, range_end: int, fileobj=None):
+        self.range_start = range_start
+        self.range_end = range_end
+        self.downloaded = 0
+        self.fileobj = fileobj
+
+
+class EventGroup(DownloadEvents):
+    """按顺序把事件分发给多个钩子"""
+
+    def __init__(self, *events: DownloadEvents):
+        self.events = list(events)
+
+    def on_probe(self, downloader, info):
+        for events in self.events:
+            events.on_probe(downloader, info)
+
+    def on_range_start(self, worker):
+        for events in self.events:
+            events.on_range_start(worker)
+
+    def on_chunk(self, worker, offset: int, size: int):
+        for events in self.events:
+            events.on_chunk(worker, offset, size)
+
+    def on_retry(self, worker, attempt: int, error: BaseException):
+        for events in self.events:
+            events.on_retry(worker, attempt, error)
+
+    def on_range_done(
+        self, worker, success: bool, error: Optional[BaseException] = None
+    ):
+        for events in self.events:
+            events.on_range_done(worker, success, error)
+
+    def on_complete(self, downloader, success: bool):
+        for events in self.events:
+            events.on_complete(downloader, success)
+
+
+def combine_events(*events: Optional[DownloadEvents]) -> Optional[DownloadEvents]:
+    """合并多个钩子, 全部为空时返回 None"""
+    events = [item for item in events if item is not None]
+    if not events:
+        return None
+    if len(events) == 1:
+        return events[0]
+    return EventGroup(*events)
+
+
+def emits_complete(func):
+    """下载方法结束时触发 on_complete, 方法内重新下载的递归调用只触发一次"""
+
+    def enter(self) -> bool:
+        if self.events is None or getattr(self, "_completing", False):
+            return False
+        self._completing = True
+        return True
+
+    def leave(self, success):
+        self._completing = False
+        self.events.on_complete(self, bool(success))
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(self, *args, **kwargs):
+            if not enter(self):
+                return await func(self, *args, **kwargs)
+            success = False
+            try:
+                success = await func(self, *args, **kwargs)
+                return success
+            finally:
+                leave(self, success)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not enter(self):
+            return func(self, *args, **kwargs)
+        success = False
+        try:
+            success = func(self, *args, **kwargs)
+            return success
+        finally:
+            leave(self, success)
+
+    return wrapper
+
+
+class _Trace:
+    """一次下载的时间线"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+        # 范围对象 -> [轨道, 开始时间, 上一块数据的时间]
+        self.ranges: Dict[int, List[float]] = {}
+        self.free: List[int] = []
+        self.lanes = 0
+        self.downloaded = 0
+
+    def now(self) -> float:
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def add(self, phase: str, name: str, tid: int, ts: float, **fields):
+        event = {"ph": phase, "name": name, "pid": os.getpid(), "tid": tid, "ts": ts}
+        event.update(fields)
+        self.events.append(event)
+
+
+class TraceExporter(DownloadEvents):
+    """把下载写成 Chrome trace 格式的时间线, 可以用 chrome://tracing 或 Perfetto 打开
+
+    每个同时进行的范围占一条轨道: 范围是一段切片, 其中每个数据块是一段子切片,
+    长度为等待这块数据的时间, 连接卡顿即很长的子切片; 重试是轨道上的瞬时事件,
+    轨道上的空白即空闲的线程。另有一条已下载字节数的计数轨道。
+
+    同一个导出器可以同时用于多个下载(如 DownloadManager 的 events), 事件按写入的文件区分,
+    每个下载结束时单独写出一个 trace。
+
+    Example:
+        downloader = MultiDownloader(url, filepath, events=TraceExporter("trace.json"))
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        :param path: 输出路径, 为空时写到下载文件旁的 <文件名>.trace.json;
+            可以包含 {name}, 替换为下载文件名, 同时导出多个下载时避免互相覆盖
+        """
+        self.path = path
+        self._lock = Lock()
+        # 下载 -> 时间线, 以写入的文件路径区分, 没有路径时以写入目标对象区分
+        self._traces: Dict[Any, _Trace] = {}
+
+    @staticmethod
+    def _key(target) -> Any:
+        return getattr(target, "filepath", None) or id(target)
+
+    def _trace(self, worker) -> _Trace:
+        """范围所属下载的时间线, 调用方需持有锁"""
+        key = self._key(getattr(worker, "fileobj", None) or worker)
+        trace = self._traces.get(key)
+        if trace is None:
+            trace = self._traces[key] = _Trace()
+        return trace
+
+    def on_probe(self, downloader, info):
+        with self._lock:
+            trace = self._traces.setdefault(self._key(downloader), _Trace())
+            trace.add("i", "probe", 0, trace.now(), s="t", args=info.to_dict())
+
+    def on_range_start(self, worker):
+        with self._lock:
+            trace = self._trace(worker)
+            now = trace.now()
+            if trace.free:
+                lane = min(trace.free)
+                trace.free.remove(lane)
+            else:
+                trace.lanes += 1
+                lane = trace.lanes
+            trace.ranges[id(worker)] = [lane, now, now]
+
+    def on_chunk(self, worker, offset: int, size: int):
+        with self._lock:
+            trace = self._trace(worker)
+            state = trace.ranges.get(id(worker))
+            if state is None:
+                return
+            now = trace.now()
+            trace.add(
+                "X",
+                "chunk",
+                state[0],
+                state[2],
+                dur=now - state[2],
+                args={"offset": offset, "size": size},
+            )
+            state[2] = now
+            trace.downloaded += size
+            trace.add("C", "downloaded", 0, now, args={"bytes": trace.downloaded})
+
+    def on_retry(self, worker, attempt: int, error: BaseException):
+        with self._lock:
+            trace = self._trace(worker)
+            state = trace.ranges.get(id(worker))
+            trace.add(
+                "i",
+                "retry",
+                state[0] if state else 0,
+                trace.now(),
+                s="t",
+                args={"attempt": attempt, "error": str(error)},
+            )
+            if state is not None:
+                # 重试前的等待不算作等待数据的时间
+                state[2] = trace.now()
+
+    def on_range_done(
+        self, worker, success: bool, error: Optional[BaseException] = None
+    ):
+        with self._lock:
+            trace = self._trace(worker)
+            state = trace.ranges.pop(id(worker), None)
+            if state is None:
+                return
+            lane, start = int(state[0]), state[1]
+            args = {"success": success, "bytes": getattr(worker, "downloaded", None)}
+            if error is not None:
+                args["error"] = str(error)
+            trace.add(
+                "X",
+                f"range {worker.range_start}-{worker.range_end}",
+                lane,
+                start,
+                dur=trace.now() - start,
+                args=args,
+            )
+            trace.free.append(lane)
+
+    def on_complete(self, downloader, success: bool):
+        filepath = downloader.filepath
+        if self.path is None:
+            path = f"{filepath}.trace.json"
+        else:
+            path = self.path.format(name=os.path.basename(filepath))
+        with self._lock:
+            # 探测以下载器区分, 范围以写入目标区分, 写入内存等没有路径的目标时两者不同
+            keys = {self._key(downloader)}
+            sink = getattr(downloader, "sink", None)
+            if sink is not None:
+                keys.add(self._key(sink))
+            traces = [self._traces.pop(key) for key in keys if key in self._traces]
+            if not traces:
+                return
+            trace = min(traces, key=lambda item: item.origin)
+            for other in traces:
+                if other is trace:
+                    continue
+                shift = (other.origin - trace.origin) * 1e6
+                for event in other.events:
+                    event["ts"] += shift
+                trace.events.extend(other.events)
+                trace.lanes = max(trace.lanes, other.lanes)
+            trace.add("i", "complete", 0, trace.now(), s="g", args={"success": success})
+            names = [
+                {
+                    "ph": "M",
+                    "name": "thread_name",
+                    "pid": os.getpid(),
+                    "tid": lane,
+                    "args": {"name": f"range lane {lane}" if lane else "download"},
+                }
+                for lane in range(trace.lanes + 1)
+            ]
+            data = {
+                "traceEvents": names + trace.events,
+                "displayTimeUnit": "ms",
+                "otherData": {"url": downloader.url, "filepath": filepath},
+            }
+        try:
+            with open(path, "w") as fw:
+                json.dump(data, fw)
+            logger.info(f"Wrote download trace to {path}")
+        except OSError as e:
+            logger.warning(f"Failed to write download trace {path}: {e}")
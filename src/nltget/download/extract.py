@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import lzma
+import os
+import os.path
+import shutil
+import struct
+import tarfile
+import zlib
+from typing import BinaryIO, Optional
+from urllib.parse import urlsplit
+
+from funlog import getLogger
+
+from .pool import SessionPool
+from .probe import RemoteInfo
+from .stream import RemoteStream
+
+logger = getLogger("funget")
+
+
+EXTRACT_MODES = ("gzip", "xz", "zstd", "tar", "zip")
+# 按地址后缀推断解压方式, 长的后缀在前
+_SUFFIXES = (
+    (".tar.gz", "tar"),
+    (".tgz", "tar"),
+    (".tar.xz", "tar"),
+    (".txz", "tar"),
+    (".tar.bz2", "tar"),
+    (".tar.zst", "tar"),
+    (".tar", "tar"),
+    (".zip", "zip"),
+    (".gz", "gzip"),
+    (".xz", "xz"),
+    (".zst", "zstd"),
+)
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+_LOCAL_HEADER = b"PK\x03\x04"
+_DATA_DESCRIPTOR = b"PK\x07\x08"
+_CENTRAL_DIRECTORY = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06")
+
+
+def detect_mode(url: str) -> Optional[str]:
+    """按地址路径的后缀推断解压方式, 无法推断时返回 None"""
+    path = urlsplit(url).path.lower()
+    for suffix, mode in _SUFFIXES:
+        if path.endswith(suffix):
+            return mode
+    return None
+
+
+def _import_zstandard():
+    """按需导入 zstandard, 未安装时给出安装提示"""
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(
+            "zstd extraction requires zstandard, install it with `pip install nltget[zstd]`"
+        ) from e
+    return zstandard
+
+
+def decompress_reader(mode: str, fileobj: BinaryIO) -> BinaryIO:
+    """把压缩数据流包装为解压后的只读流
+
+    Args:
+        mode: gzip/xz/zstd
+        fileobj: 按顺序读取的压缩数据
+
+    Returns:
+        BinaryIO: 解压后的数据流
+    """
+    if mode == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if mode == "xz":
+        return lzma.LZMAFile(fileobj)
+    if mode == "zstd":
+        return _import_zstandard().ZstdDecompressor().stream_reader(fileobj)
+    raise ValueError(f"Unknown compression: {mode}, expected one of gzip/xz/zstd")
+
+
+def _safe_path(directory: str, name: str) -> str:
+    """归档内的路径落在目标目录之外时抛出 ValueError"""
+    root = os.path.abspath(directory)
+    path = os.path.abspath(os.path.join(root, name))
+    if os.path.isabs(name) or os.path.commonpath([root, path]) != root:
+        raise ValueError(f"Unsafe path in archive: {name}")
+    return path
+
+
+def extract_tar(fileobj: BinaryIO, directory: str) -> int:
+    """按顺序解包 tar 流, gzip/bz2/xz/zstd 压缩由开头的魔数识别
+
+    Returns:
+        int: 解出的文件数
+    """
+    reader = io.BufferedReader(fileobj) if not hasattr(fileobj, "peek") else fileobj
+    if reader.peek(4)[:4] == _ZSTD_MAGIC:
+        reader = decompress_reader("zstd", reader)
+    count = 0
+    with tarfile.open(fileobj=reader, mode="r|*") as tar:
+        for member in tar:
+            _safe_path(directory, member.name)
+            if hasattr(tarfile, "data_filter"):
+                tar.extract(member, directory, filter="data")
+            else:
+                tar.extract(member, directory)
+            count += member.isfile()
+    return count
+
+
+class _ZipStream:
+    """顺序解析 zip 的本地文件头, 不需要读取文件末尾的中央目录
+
+    支持 stored 和 deflate 两种压缩方式和 zip64; 带数据描述符的 stored 条目只有本地文件头中
+    给出了大小时才能流式解出。
+    """
+
+    def __init__(self, fileobj: BinaryIO, chunk_size: int = 256 * 1024):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self._pending = b""
+
+    def _read(self, size: int) -> bytes:
+        """读取至多 size 字节, 优先取回退的数据"""
+        if self._pending:
+            data, self._pending = self._pending[:size], self._pending[size:]
+            return data
+        return self.fileobj.read(size)
+
+    def _read_exact(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self._read(size - len(data))
+            if not chunk:
+                raise EOFError(
+                    f"Truncated zip stream, expected {size} bytes, got {len(data)}"
+                )
+            data += chunk
+        return data
+
+    def _copy(self, size: int, fw, crc: int) -> int:
+        """把 size 字节原样写出, 返回 CRC32"""
+        while size > 0:
+            chunk = self._read(min(size, self.chunk_size))
+            if not chunk:
+                raise EOFError("Truncated zip stream")
+            size -= len(chunk)
+            crc = zlib.crc32(chunk, crc)
+            fw.write(chunk)
+        return crc
+
+    def _inflate(self, fw, crc: int) -> int:
+        """解压一个 deflate 流直到其结束, 多读的数据留给下一个条目, 返回 CRC32"""
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        while not decompressor.eof:
+            chunk = self._read(self.chunk_size)
+            if not chunk:
+                raise EOFError("Truncated zip stream")
+            data = decompressor.decompress(chunk)
+            crc = zlib.crc32(data, crc)
+            fw.write(data)
+        self._pending = decompressor.unused_data + self._pending
+        return crc
+
+    def extract(self, directory: str) -> int:
+        """解出全部条目, 返回解出的文件数"""
+        count = 0
+        while True:
+            name = self.extract_entry(directory)
+            if name is None:
+                return count
+            count += not name.endswith("/")
+
+    def extract_entry(
+        self, directory: str, compressed_size: Optional[int] = None
+    ) -> Optional[str]:
+        """解出下一个条目
+
+        Args:
+            directory: 解包目录
+            compressed_size: 中央目录中记录的压缩后大小, 给出时不依赖本地文件头和数据描述符
+
+        Returns:
+            Optional[str]: 条目名称, 已到达中央目录或数据末尾时返回 None
+        """
+        signature = self._read(4)
+        if len(signature) < 4 or signature in _CENTRAL_DIRECTORY:
+            return None
+        if signature != _LOCAL_HEADER:
+            raise ValueError(f"Unexpected zip signature: {signature!r}")
+        (
+            _,
+            flags,
+            method,
+            _,
+            _,
+            crc,
+            local_size,
+            _,
+            name_size,
+            extra_size,
+        ) = struct.unpack("<HHHHHIIIHH", self._read_exact(26))
+        name = self._read_exact(name_size).decode("utf-8" if flags & 0x800 else "cp437")
+        extra = self._read_exact(extra_size)
+        zip64 = self._zip64(extra, local_size)
+        if compressed_size is None:
+            compressed_size = local_size if zip64 is None else zip64
+        if flags & 0x1:
+            raise ValueError(f"Encrypted zip entry is not supported: {name}")
+        if method not in (0, 8):
+            raise ValueError(f"Unsupported zip compression method {method}: {name}")
+        descriptor = bool(flags & 0x8)
+        if method == 0 and descriptor and compressed_size == 0 and not self._empty():
+            raise ValueError(
+                f"Stored zip entry with data descriptor cannot be streamed: {name}"
+            )
+
+        path = _safe_path(directory, name)
+        if name.endswith("/"):
+            os.makedirs(path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as fw:
+                if method == 0:
+                    actual = self._copy(compressed_size, fw, 0)
+                else:
+                    actual = self._inflate(fw, 0)
+        if descriptor:
+            crc = self._descriptor(zip64 is not None)
+        if not name.endswith("/") and actual != crc:
+            raise ValueError(f"CRC mismatch in zip entry: {name}")
+        return name
+
+    @staticmethod
+    def _zip64(extra: bytes, compressed_size: int) -> Optional[int]:
+        """从 zip64 扩展字段中取出压缩后大小, 没有该字段时返回 None"""
+        position = 0
+        while position + 4 <= len(extra):
+            tag, size = struct.unpack("<HH", extra[position : position + 4])
+            if tag == 0x0001:
+                values = extra[position + 4 : position + 4 + size]
+                # 依次为原始大小和压缩后大小, 只有本地文件头中为 0xFFFFFFFF 的字段才会出现
+                if compressed_size == 0xFFFFFFFF and len(values) >= 16:
+                    return struct.unpack("<Q", values[8:16])[0]
+                return compressed_size
+            position += 4 + size
+        return None
+
+    def _empty(self) -> bool:
+        """紧接着是带签名的数据描述符, 即条目内容为空"""
+        head = self._read_exact(4)
+        self._pending = head + self._pending
+        return head == _DATA_DESCRIPTOR
+
+    def _descriptor(self, zip64: bool) -> int:
+        """读取数据描述符, 返回其中的 CRC32"""
+        head = self._read_exact(4)
+        if head == _DATA_DESCRIPTOR:
+            head = self._read_exact(4)
+        self._read_exact(16 if zip64 else 8)
+        return struct.unpack("<I", head)[0]
+
+
+def extract_zip(fileobj: BinaryIO, directory: str, chunk_size: int = 256 * 1024) -> int:
+    """按顺序解出 zip 流中的全部条目
+
+    Returns:
+        int: 解出的文件数
+    """
+    return _ZipStream(fileobj, chunk_size).extract(directory)
+
+
+def extract_stream(
+    fileobj: BinaryIO, target: str, mode: str, chunk_size: int = 256 * 1024
+):
+    """把顺序读取的数据流按 mode 解压或解包
+
+    Args:
+        fileobj: 按顺序读取的数据
+        target: gzip/xz/zstd 时为输出文件, tar/zip 时为解包目录
+        mode: 解压方式, 见 EXTRACT_MODES
+        chunk_size: 每次写出的字节数
+
+    Returns:
+        int: gzip/xz/zstd 时为写出的字节数, tar/zip 时为解出的文件数
+    """
+    if mode == "tar":
+        os.makedirs(target, exist_ok=True)
+        return extract_tar(fileobj, target)
+    if mode == "zip":
+        os.makedirs(target, exist_ok=True)
+        return extract_zip(fileobj, target, chunk_size)
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    with decompress_reader(mode, fileobj) as reader, open(target, "wb") as fw:
+        shutil.copyfileobj(reader, fw, chunk_size)
+        return fw.tell()
+
+
+def download_extract(
+    url: str,
+    target: str,
+    mode: str = "auto",
+    worker_num: int = 4,
+    block_size: int = 4,
+    chunk_size: int = 256 * 1024,
+    headers=None,
+    max_retries: int = 3,
+    pool: Optional[SessionPool] = None,
+    info: Optional[RemoteInfo] = None,
+) -> bool:
+    """边下载边解压, 只写出解压后的内容, 压缩包本身不落盘
+
+    worker_num 大于 1 且服务器支持范围请求时并行下载各范围, 按顺序交给解压器(见 RemoteStream),
+    否则用一个流式请求顺序读取。
+
+    Args:
+        url: 下载链接
+        target: gzip/xz/zstd 时为输出文件, tar/zip 时为解包目录
+        mode: 解压方式, gzip/xz/zstd/tar/zip, auto 时按地址后缀推断
+        worker_num: 并行下载的线程数, 为 1 时单线程下载
+        block_size: 并行下载时每个范围的大小(MB)
+        chunk_size: 每次读取的字节数
+        headers: 额外的请求头
+        max_retries: 最大重试次数
+        pool: 共享的连接池
+        info: 已有的探测结果
+
+    Returns:
+        bool: 下载和解压是否成功
+    """
+    if mode == "auto":
+        mode = detect_mode(url)
+        if mode is None:
+            logger.error(
+                f"Cannot infer extract mode from {url}, expected one of {EXTRACT_MODES}"
+            )
+            return False
+    if mode not in EXTRACT_MODES:
+        logger.error(f"Unknown extract mode: {mode}, expected one of {EXTRACT_MODES}")
+        return False
+    try:
+        with RemoteStream(
+            url,
+            worker_num=worker_num,
+            block_size=block_size,
+            chunk_size=chunk_size,
+            headers=headers,
+            max_retries=max_retries,
+            pool=pool,
+            info=info,
+        ) as stream:
+            reader = io.BufferedReader(stream, buffer_size=chunk_size)
+            result = extract_stream(reader, target, mode, chunk_size)
+            logger.info(
+                f"Extracted {url} ({mode}) to {target}: "
+                f"{result:,} {'files' if mode in ('tar', 'zip') else 'bytes'} "
+                f"from {stream.position:,} downloaded bytes"
+            )
+        return True
+    except Exception as e:
+        logger.error(f"Extract download failed: {e}")
+        if mode not in ("tar", "zip") and os.path.isfile(target):
+            os.remove(target)
+        return False
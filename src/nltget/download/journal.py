@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from funlog import getLogger
+
+from .manifest import BlockManifest
+
+logger = getLogger("funget")
+
+JOURNAL_VERSION = 2
+# 版本 1 没有分块校验值, 续传时直接信任已写入的区间
+SUPPORTED_VERSIONS = (1, 2)
+
+
+def _sync_directory(directory: str):
+    """刷写目录项, 让改名在断电后仍然有效; 不支持打开目录的平台(如 Windows)直接跳过"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class DownloadJournal:
+    """断点续传日志
+
+    以 ``{filepath}.nltget`` 的形式保存在目标文件旁边, 记录下载地址、校验信息
+    (ETag/Last-Modified/大小)、分块计划、已经写入的字节区间和按块计算的校验值。
+    中断后重新下载时据此跳过探测请求和已完成的区间, 并通过 If-Range 确认远端文件未变;
+    有校验值时先校验已写入的块, 只重新下载损坏或未写满的块。
+    """
+
+    suffix = ".nltget"
+
+    def __init__(
+        self,
+        filepath: str,
+        url: str,
+        size: int,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        ranges: Optional[List[List[int]]] = None,
+        done: Optional[List[List[int]]] = None,
+        manifest: Optional[BlockManifest] = None,
+    ):
+        """
+        :param filepath: 目标文件路径
+        :param url: 下载地址
+        :param size: 文件大小
+        :param etag: 远端文件的 ETag
+        :param last_modified: 远端文件的 Last-Modified
+        :param ranges: 分块计划, 每项为闭区间 [start, end]
+        :param done: 已写入的区间, 每项为左闭右开 [start, end]
+        :param manifest: 分块校验值, 为空时续传不校验已写入的数据
+        """
+        self.filepath = filepath
+        self.url = url
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.ranges = ranges or []
+        self.done = done or []
+        self.manifest = manifest
+
+    @property
+    def path(self) -> str:
+        return f"{self.filepath}{self.suffix}"
+
+    @property
+    def if_range(self) -> Optional[str]:
+        """If-Range 请求头的取值, 弱 ETag 不能用于 If-Range, 退而使用 Last-Modified"""
+        if self.etag and not self.etag.startswith("W/"):
+            return self.etag
+        return self.last_modified
+
+    @property
+    def done_size(self) -> int:
+        return sum(end - start for start, end in self.done)
+
+    def matches(self, url: str, size: Optional[int] = None) -> bool:
+        """日志是否属于同一个下载"""
+        if self.url != url:
+            return False
+        return size is None or size <= 0 or self.size == size
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": JOURNAL_VERSION,
+            "url": self.url,
+            "size": self.size,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "ranges": self.ranges,
+            "done": self.done,
+            "blocks": self.manifest.to_dict() if self.manifest is not None else None,
+            "updated": time.time(),
+        }
+
+    def save(self):
+        """原子地写入日志文件: 写入临时文件并刷到磁盘后再改名替换, 断电后不会留下半个日志"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fw:
+            json.dump(self.to_dict(), fw, separators=(",", ":"))
+            fw.flush()
+            os.fsync(fw.fileno())
+        os.replace(tmp_path, self.path)
+        _sync_directory(os.path.dirname(os.path.abspath(self.path)))
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @classmethod
+    def load(cls, filepath: str) -> Optional["DownloadJournal"]:
+        """读取目标文件旁的日志, 不存在、损坏或目标文件已丢失时返回 None"""
+        path = f"{filepath}{cls.suffix}"
+        if not os.path.exists(path):
+            return None
+        if not os.path.exists(filepath):
+            logger.warning(f"Journal {path} found but {filepath} is missing, ignoring")
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as fr:
+                data = json.load(fr)
+            if data.get("version") not in SUPPORTED_VERSIONS:
+                raise ValueError(f"unsupported version {data.get('version')}")
+            size = int(data["size"])
+            blocks = data.get("blocks")
+            return cls(
+                filepath=filepath,
+                url=data["url"],
+                size=size,
+                etag=data.get("etag"),
+                last_modified=data.get("last_modified"),
+                ranges=data.get("ranges"),
+                done=data.get("done"),
+                manifest=BlockManifest.from_dict(size, blocks) if blocks else None,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to load journal {path}, ignoring: {e}")
+            return None
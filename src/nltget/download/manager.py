@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from queue import Empty, Queue
+from threading import Condition, Lock, Thread
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import unquote, urlsplit
+
+from funlog import getLogger
+
+from .cache import resolve_cache
+from .digest import ChecksumError
+from .events import DownloadEvents
+from .metadata import resolve_metadata
+from .multi import MultiDownloader
+from .pool import SessionPool
+from .single import SingleDownloader
+from .sink import Sink
+from .work import ResourceChangedError, Worker
+
+logger = getLogger("funget")
+
+
+@dataclass
+class DownloadResult:
+    """单个文件的下载结果"""
+
+    url: str
+    filepath: str
+    success: bool
+    size: int = 0
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+
+class _Job:
+    """一个文件的下载任务, 探测之后拆分为一个或多个范围请求"""
+
+    def __init__(self, url: str, filepath: str):
+        self.url = url
+        self.filepath = filepath
+        self.host = urlsplit(url).netloc
+        self.started = time.monotonic()
+        self.downloader: Optional[MultiDownloader] = None
+        self.sink: Optional[Sink] = None
+        self.workers: List[Worker] = []
+        self.failed: List[Worker] = []
+        self.pending = 0
+        self.retried = False
+        self.error: Optional[Exception] = None
+
+
+class DownloadManager:
+    """批量下载管理器
+
+    所有文件共用一组线程和一个连接池, 线程数即全局同时进行的请求数上限,
+    每个主机同时进行的请求数不超过 per_host。不超过 multi_threshold 的小文件用一个请求下载,
+    大文件按 block_size 拆分成多个范围, 与其他文件的请求在同一个调度队列中按主机轮转执行;
+    已经开始的文件的范围请求优先于尚未探测的文件, 尽快完成并产出结果。
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 16,
+        per_host: int = 4,
+        block_size: int = 16,
+        multi_threshold: int = 10 * 1024 * 1024,
+        overwrite: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+        max_retries: int = 3,
+        chunk_size: int = 2 * 1024 * 1024,
+        preallocate: Optional[str] = None,
+        metadata=None,
+        cache=None,
+        events: Optional[DownloadEvents] = None,
+    ):
+        """
+        :param max_connections: 全局并发连接数, 即工作线程数
+        :param per_host: 每个主机的并发连接数
+        :param block_size: 大文件的块大小(MB)
+        :param multi_threshold: 超过该字节数的文件才拆分为多个范围
+        :param overwrite: 是否覆盖已存在的文件
+        :param headers: 请求头
+        :param max_retries: 每个请求的最大重试次数
+        :param chunk_size: 单次读取的最大字节数
+        :param preallocate: 预分配策略, 为空时使用 DownloadConfig.preallocate
+        :param metadata: 下载记录, 见 resolve_metadata, 启用后跳过远端未改变的文件
+        :param cache: 下载缓存, 见 resolve_cache, 命中时直接从缓存生成目标文件
+        :param events: 事件钩子, 见 DownloadEvents, 对所有文件生效
+        """
+        self.max_connections = max(1, max_connections)
+        self.per_host = max(1, min(per_host, self.max_connections))
+        self.block_size = block_size
+        self.multi_threshold = multi_threshold
+        self.overwrite = overwrite
+        self.headers = headers or {}
+        self.max_retries = max_retries
+        self.chunk_size = chunk_size
+        self.preallocate = preallocate
+        self.metadata = resolve_metadata(metadata)
+        self.cache = resolve_cache(cache)
+        self.events = events
+        # 空闲连接按主机缓存, 缓存的主机数乘以每主机连接数不超过全局上限
+        self._pool = SessionPool(
+            pool_size=self.per_host,
+            max_retries=max_retries,
+            pool_connections=max(1, self.max_connections // self.per_host),
+        )
+        # 以主机为键的待执行任务队列, 按插入顺序轮转
+        self._queues: "OrderedDict[str, Deque[Callable[[], None]]]" = OrderedDict()
+        self._host_active: Dict[str, int] = {}
+        self._cond = Condition()
+        self._job_lock = Lock()
+        self._threads: List[Thread] = []
+        self._results: "Queue[DownloadResult]" = Queue()
+        self._jobs: List[_Job] = []
+        # 已提交但结果尚未被 as_completed 取走的文件数
+        self._pending = 0
+        self._closed = False
+        self._cancelled = False
+
+    def start(self) -> "DownloadManager":
+        with self._cond:
+            while len(self._threads) < self.max_connections:
+                thread = Thread(target=self._worker, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def submit(self, url: str, filepath: Optional[str] = None, directory: str = "."):
+        """提交一个文件, filepath 为空时以 URL 中的文件名保存到 directory 下"""
+        if self._closed:
+            raise RuntimeError("DownloadManager is closed")
+        if not filepath:
+            filename = unquote(os.path.basename(urlsplit(url).path)) or "index.html"
+            filepath = os.path.join(directory, filename)
+        job = _Job(url, os.path.abspath(filepath))
+        with self._job_lock:
+            self._jobs.append(job)
+            self._pending += 1
+        self.start()
+        self._push(job.host, lambda: self._probe(job))
+
+    def as_completed(self) -> Iterator[DownloadResult]:
+        """按完成顺序产出已提交文件中尚未取走的下载结果, 取完后返回"""
+        while not self._cancelled:
+            with self._job_lock:
+                if self._pending <= 0:
+                    return
+            try:
+                result = self._results.get(timeout=0.1)
+            except Empty:
+                continue
+            with self._job_lock:
+                self._pending -= 1
+            yield result
+
+    def download_many(
+        self,
+        urls: Iterable[Union[str, Tuple[str, str]]],
+        directory: str = ".",
+    ) -> Iterator[DownloadResult]:
+        """批量下载, 每个文件完成后立即产出结果
+
+        Args:
+            urls: 下载链接, 或 (下载链接, 保存路径) 元组
+            directory: 未指定保存路径时的保存目录
+
+        Returns:
+            Iterator[DownloadResult]: 按完成顺序产出的下载结果
+        """
+        for item in urls:
+            if isinstance(item, str):
+                self.submit(item, directory=directory)
+            else:
+                self.submit(item[0], item[1], directory=directory)
+        yield from self.as_completed()
+
+    def _push(self, host: str, task: Callable[[], None], urgent: bool = False):
+        """加入任务, urgent 的任务排在该主机队列的最前面"""
+        with self._cond:
+            queue = self._queues.setdefault(host, deque())
+            if urgent:
+                queue.appendleft(task)
+            else:
+                queue.append(task)
+            self._cond.notify()
+
+    def _take(self) -> Optional[Tuple[str, Callable[[], None]]]:
+        """取出下一个所在主机仍有空闲连接的任务, 调用方需持有锁"""
+        for host in list(self._queues):
+            if self._host_active.get(host, 0) >= self.per_host:
+                continue
+            queue = self._queues[host]
+            task = queue.popleft()
+            if queue:
+                # 轮转到队尾, 让其他主机的任务也有机会执行
+                self._queues.move_to_end(host)
+            else:
+                del self._queues[host]
+            self._host_active[host] = self._host_active.get(host, 0) + 1
+            return host, task
+        return None
+
+    def _worker(self):
+        """工作线程主循环"""
+        while True:
+            with self._cond:
+                item = self._take()
+                while item is None:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    item = self._take()
+            host, task = item
+            try:
+                task()
+            except Exception as e:
+                logger.error(f"Unexpected error in download manager: {e}")
+            finally:
+                with self._cond:
+                    self._host_active[host] -= 1
+                    self._cond.notify_all()
+
+    def _probe(self, job: _Job):
+        """探测文件大小和范围请求支持, 拆分为范围请求"""
+        try:
+            downloader = MultiDownloader(
+                url=job.url,
+                filepath=job.filepath,
+                overwrite=self.overwrite,
+                headers=self.headers,
+                max_retries=self.max_retries,
+                block_size=self.block_size,
+                pool=self._pool,
+                metadata=self.metadata,
+                cache=self.cache,
+                events=self.events,
+            )
+            job.downloader = downloader
+
+            if downloader.journal is None and downloader.is_up_to_date():
+                logger.info(f"File {job.filepath} is up to date, skipping download.")
+                self._finish(job, True)
+                return
+            if downloader.journal is None and downloader._restore_from_cache():
+                self._finish(job, True)
+                return
+
+            os.makedirs(os.path.dirname(job.filepath), exist_ok=True)
+            if downloader.filesize <= 0:
+                # 大小未知时无法按范围写入, 直接用一个请求下载
+                logger.warning(f"Unknown size of {job.url}, using single request")
+                single = SingleDownloader(
+                    url=job.url,
+                    filepath=job.filepath,
+                    overwrite=True,
+                    headers=self.headers,
+                    max_retries=self.max_retries,
+                    pool=self._pool,
+                    info=downloader.info,
+                    metadata=self.metadata,
+                    cache=self.cache,
+                    events=self.events,
+                )
+                # 单线程下载自己触发 on_complete
+                self._finish(
+                    job, single.download(chunk_size=self.chunk_size), notify=False
+                )
+                return
+
+            if downloader.filesize <= self.multi_threshold:
+                downloader.blocks_num = 1
+            job.sink = downloader._open_sink("file", self.preallocate).open()
+            # 响应头中有校验值时边写入边计算, 完成后校验
+            job.sink.digest = downloader._create_digest(reader=job.sink.read)
+            downloader._prefill(job.sink)
+            ranges = [
+                (start, end)
+                for _, start, end, _ in downloader._pending_ranges(job.sink)
+                if start <= end
+            ]
+        except Exception as e:
+            logger.error(f"Failed to start download of {job.url}: {e}")
+            if job.sink is not None:
+                job.sink.close(complete=False)
+            self._finish(job, False, e)
+            return
+
+        if not ranges:
+            self._complete(job)
+            return
+
+        workers = [
+            Worker(
+                url=downloader.request_url,
+                fileobj=job.sink,
+                range_start=start,
+                range_end=end,
+                headers=self.headers,
+                chunk_size=self.chunk_size,
+                max_retries=self.max_retries,
+                session=self._pool.session,
+                if_range=downloader._if_range(),
+                events=self.events,
+            )
+            for start, end in ranges
+        ]
+        self._schedule(job, workers)
+
+    def _schedule(self, job: _Job, workers: List[Worker]):
+        with self._job_lock:
+            job.pending += len(workers)
+            job.workers.extend(workers)
+        # 逆序插到队首, 执行时仍按范围顺序
+        for worker in reversed(workers):
+            self._push(
+                job.host, lambda worker=worker: self._run(job, worker), urgent=True
+            )
+
+    def _run(self, job: _Job, worker: Worker):
+        """执行一个范围请求, 文件的最后一个范围结束时收尾"""
+        success = False
+        if not self._cancelled:
+            try:
+                success = worker.run()
+            except Exception as e:
+                job.error = e
+        with self._job_lock:
+            if not success:
+                job.failed.append(worker)
+            job.pending -= 1
+            if job.pending > 0:
+                return
+        self._complete(job)
+
+    def _complete(self, job: _Job):
+        changed = isinstance(job.error, ResourceChangedError)
+        if job.failed and not job.retried and not changed and not self._cancelled:
+            # 失败的范围重试一次
+            job.retried = True
+            failed, job.failed = job.failed, []
+            logger.warning(f"Retrying {len(failed)} failed ranges of {job.url}")
+            self._schedule(job, failed)
+            return
+
+        success = not job.failed
+        corrupted = success and not job.downloader._verify_digest(job.sink.digest)
+        job.sink.close(complete=success)
+        if corrupted:
+            job.downloader._discard_corrupted()
+            self._finish(job, False, ChecksumError(f"Checksum mismatch for {job.url}"))
+            return
+        if success:
+            job.downloader._save_metadata()
+            job.downloader._save_to_cache()
+        if changed and job.downloader.journal is not None:
+            # 远端文件已改变, 续传日志作废, 下次重新下载
+            job.downloader.journal.remove()
+        self._finish(job, success, job.error if not success else None)
+
+    def _finish(
+        self,
+        job: _Job,
+        success: bool,
+        error: Optional[Exception] = None,
+        notify: bool = True,
+    ):
+        size = job.downloader.filesize if job.downloader is not None else 0
+        if notify and self.events is not None and job.downloader is not None:
+            try:
+                self.events.on_complete(job.downloader, success)
+            except Exception as e:
+                logger.error(f"Event hook failed for {job.url}: {e}")
+        self._results.put(
+            DownloadResult(
+                url=job.url,
+                filepath=job.filepath,
+                success=success,
+                size=size,
+                elapsed=time.monotonic() - job.started,
+                error=str(error) if error is not None else None,
+            )
+        )
+        with self._job_lock:
+            self._jobs.remove(job)
+        self._pool.record_metrics()
+
+    def stats(self):
+        """连接池统计, 见 SessionPool.stats"""
+        return self._pool.stats()
+
+    def cancel(self):
+        """取消所有未完成的下载"""
+        self._cancelled = True
+        with self._cond:
+            self._queues.clear()
+        with self._job_lock:
+            for job in self._jobs:
+                for worker in job.workers:
+                    worker.cancel()
+
+    def close(self):
+        """等待已提交的任务结束后关闭线程和连接池"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        # 被取消的文件保留续传日志
+        with self._job_lock:
+            jobs, self._jobs = self._jobs, []
+        for job in jobs:
+            if job.sink is not None:
+                job.sink.close(complete=False)
+        self._pool.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.cancel()
+        self.close()
+        return False
+
+
+def download_many(
+    urls: Iterable[Union[str, Tuple[str, str]]],
+    directory: str = ".",
+    max_connections: int = 16,
+    per_host: int = 4,
+    *args,
+    **kwargs,
+) -> Iterator[DownloadResult]:
+    """批量下载文件, 所有文件共用一组线程和连接
+
+    Args:
+        urls: 下载链接, 或 (下载链接, 保存路径) 元组
+        directory: 未指定保存路径时的保存目录
+        max_connections: 全局并发连接数
+        per_host: 每个主机的并发连接数
+        **kwargs: 其余参数见 DownloadManager
+
+    Returns:
+        Iterator[DownloadResult]: 按完成顺序产出的下载结果
+    """
+    with DownloadManager(
+        max_connections=max_connections, per_host=per_host, *args, **kwargs
+    ) as manager:
+        yield from manager.download_many(urls, directory=directory)
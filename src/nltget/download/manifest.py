@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from funlog import getLogger
+
+logger = getLogger("funget")
+
+
+class _BlockState:
+    """一个块的计算状态, 数据按顺序到达时直接计算, 否则在块写满后读回计算"""
+
+    __slots__ = ("hasher", "position", "written", "ordered", "lock")
+
+    def __init__(self, algorithm: str, start: int):
+        self.hasher = hashlib.new(algorithm)
+        self.position = start
+        self.written = 0
+        self.ordered = True
+        self.lock = Lock()
+
+
+class BlockManifest:
+    """按固定大小分块的校验值清单
+
+    随续传日志一起保存。下载时每个块写满即计算校验值; 续传时并行读取并校验已完成的块
+    (hashlib 和 os.pread 都会释放 GIL), 只重新下载损坏、缺失或未写满的块,
+    不必因为一个块被截断就重新下载整个文件。
+    """
+
+    min_block_size = 8 * 1024 * 1024
+    max_blocks = 4096
+
+    def __init__(
+        self,
+        size: int,
+        block_size: Optional[int] = None,
+        algorithm: str = "sha256",
+        hashes: Optional[Dict[int, str]] = None,
+    ):
+        """
+        :param size: 文件大小
+        :param block_size: 块大小, 为空时按文件大小选择, 块数不超过 max_blocks
+        :param algorithm: hashlib 支持的校验算法
+        :param hashes: 已经计算出的校验值, {块序号: 十六进制}
+        """
+        self.size = size
+        self.block_size = block_size or self.choose_block_size(size)
+        self.algorithm = algorithm
+        self.hashes: Dict[int, str] = dict(hashes or {})
+        # 读回已写入数据的函数 reader(offset, size), 由写入目标在打开时设置
+        self.reader: Optional[Callable[[int, int], bytes]] = None
+        self._states: Dict[int, _BlockState] = {}
+        self._lock = Lock()
+        hashlib.new(algorithm)
+
+    @classmethod
+    def choose_block_size(cls, size: int) -> int:
+        mb = 1024 * 1024
+        block_size = max(cls.min_block_size, -(-size // cls.max_blocks))
+        return -(-block_size // mb) * mb
+
+    @property
+    def blocks_num(self) -> int:
+        return -(-self.size // self.block_size) if self.size > 0 else 0
+
+    def block_range(self, index: int) -> Tuple[int, int]:
+        """块的左闭右开区间"""
+        start = index * self.block_size
+        return start, min(start + self.block_size, self.size)
+
+    def update(self, chunk, offset: int):
+        """记录写入 offset 处的数据, 块写满时计算其校验值"""
+        view = memoryview(chunk)
+        while len(view) > 0 and offset < self.size:
+            index = offset // self.block_size
+            start, end = self.block_range(index)
+            piece = view[: end - offset]
+            with self._lock:
+                state = self._states.get(index)
+                if state is None:
+                    state = self._states[index] = _BlockState(self.algorithm, start)
+            with state.lock:
+                if state.ordered and offset == state.position:
+                    state.hasher.update(piece)
+                    state.position += len(piece)
+                else:
+                    state.ordered = False
+                state.written += len(piece)
+                full = state.written >= end - start
+            if full:
+                self._finish(index, state)
+            offset += len(piece)
+            view = view[len(piece) :]
+
+    def _finish(self, index: int, state: _BlockState):
+        with self._lock:
+            self._states.pop(index, None)
+        if state.ordered:
+            value = state.hasher.hexdigest()
+        elif self.reader is not None:
+            value = self._hash_block(index, self.reader)
+        else:
+            value = None
+        if value is None:
+            # 无法读回时不记录, 续传时该块会被重新下载
+            return
+        with self._lock:
+            self.hashes[index] = value
+
+    def _hash_block(
+        self, index: int, reader: Callable[[int, int], bytes]
+    ) -> Optional[str]:
+        start, end = self.block_range(index)
+        hasher = hashlib.new(self.algorithm)
+        while start < end:
+            data = reader(start, min(4 * 1024 * 1024, end - start))
+            if not data:
+                return None
+            hasher.update(data)
+            start += len(data)
+        return hasher.hexdigest()
+
+    def verify(
+        self,
+        reader: Callable[[int, int], bytes],
+        done: List[List[int]],
+        max_workers: Optional[int] = None,
+    ) -> List[List[int]]:
+        """并行校验已写入的块
+
+        Args:
+            reader: 读取已写入数据的函数
+            done: 续传日志中已写入的区间, 左闭右开
+            max_workers: 校验线程数, 默认为 CPU 核数
+
+        Returns:
+            List[List[int]]: 校验通过的区间; 未写满、没有校验值或校验失败的块都不包含在内
+        """
+        candidates = []
+        for start, end in done:
+            first = -(-start // self.block_size)
+            for index in range(first, self.blocks_num):
+                if self.block_range(index)[1] > end:
+                    break
+                if index in self.hashes:
+                    candidates.append(index)
+
+        max_workers = max_workers or min(32, os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(
+                executor.map(lambda index: self._hash_block(index, reader), candidates)
+            )
+
+        verified: List[List[int]] = []
+        hashes: Dict[int, str] = {}
+        corrupted = 0
+        for index, value in zip(candidates, results):
+            if value != self.hashes[index]:
+                corrupted += 1
+                continue
+            hashes[index] = value
+            start, end = self.block_range(index)
+            if verified and verified[-1][1] == start:
+                verified[-1][1] = end
+            else:
+                verified.append([start, end])
+        # 只保留校验通过的块, 其余的块重新下载时重新计算
+        with self._lock:
+            self.hashes = hashes
+
+        done_size = sum(end - start for start, end in done)
+        verified_size = sum(end - start for start, end in verified)
+        logger.info(
+            f"Verified {len(candidates) - corrupted}/{self.blocks_num} blocks, "
+            f"{corrupted} corrupted, re-fetching {done_size - verified_size:,} bytes "
+            f"of previously written data"
+        )
+        return verified
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            hashes = {str(index): value for index, value in self.hashes.items()}
+        return {
+            "block_size": self.block_size,
+            "algorithm": self.algorithm,
+            "hashes": hashes,
+        }
+
+    @classmethod
+    def from_dict(cls, size: int, data: Dict[str, Any]) -> "BlockManifest":
+        return cls(
+            size=size,
+            block_size=int(data["block_size"]),
+            algorithm=data.get("algorithm", "sha256"),
+            hashes={
+                int(index): value for index, value in data.get("hashes", {}).items()
+            },
+        )
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from funlog import getLogger
+
+from ..config import get_config
+
+logger = getLogger("funget")
+
+
+def default_metadata_path() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "nltget", "metadata.db")
+
+
+def same_version(
+    etag: Optional[str],
+    last_modified: Optional[str],
+    other_etag: Optional[str],
+    other_last_modified: Optional[str],
+) -> bool:
+    """两组校验信息是否指向远端文件的同一个版本, 无法判断时返回 False"""
+    # 弱 ETag 只能说明语义相同, 不能保证字节一致
+    if etag and other_etag and not etag.startswith("W/"):
+        return etag == other_etag
+    if last_modified and other_last_modified:
+        return last_modified == other_last_modified
+    return False
+
+
+@dataclass
+class FileMetadata:
+    """一次成功下载的记录"""
+
+    url: str
+    filepath: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    size: int
+    mtime: float
+    updated: float = 0.0
+    # 分块校验值, 见 BlockManifest.to_dict, 本地文件损坏时据此只修复损坏的块
+    blocks: Optional[Dict[str, Any]] = None
+
+    def local_unchanged(self) -> bool:
+        """本地文件是否仍是下载完成时的状态"""
+        try:
+            stat = os.stat(self.filepath)
+        except OSError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime == self.mtime
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """条件请求头, 远端文件未改变时服务器返回 304"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def matches(
+        self, etag: Optional[str], last_modified: Optional[str], size: int
+    ) -> bool:
+        """远端文件是否与记录的是同一个版本"""
+        if size > 0 and size != self.size:
+            return False
+        return same_version(self.etag, self.last_modified, etag, last_modified)
+
+
+class MetadataStore:
+    """下载记录
+
+    以 (url, filepath) 为键, 在 sqlite 中记录成功下载时远端文件的 ETag/Last-Modified/大小
+    和本地文件的 mtime。再次下载同一文件时据此发送 If-None-Match/If-Modified-Since,
+    服务器返回 304 即跳过下载; 远端文件改变时即使大小相同也会重新下载。
+    每次操作使用独立的连接, 可以在多个线程和进程间共用同一个数据库文件。
+    """
+
+    def __init__(self, path: Optional[str] = None, timeout: float = 30.0):
+        """
+        :param path: 数据库文件路径, 默认为 ~/.cache/nltget/metadata.db
+        :param timeout: 数据库被其他进程锁定时的等待时间(秒)
+        """
+        self.path = path or default_metadata_path()
+        self.timeout = timeout
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS files (
+                        url TEXT NOT NULL,
+                        filepath TEXT NOT NULL,
+                        etag TEXT,
+                        last_modified TEXT,
+                        size INTEGER NOT NULL,
+                        mtime REAL NOT NULL,
+                        updated REAL NOT NULL,
+                        blocks TEXT,
+                        PRIMARY KEY (url, filepath)
+                    )
+                    """
+                )
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(files)")}
+                if "blocks" not in columns:
+                    conn.execute("ALTER TABLE files ADD COLUMN blocks TEXT")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=self.timeout)
+
+    def get(self, url: str, filepath: str) -> Optional[FileMetadata]:
+        filepath = os.path.abspath(filepath)
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT url, filepath, etag, last_modified, size, mtime, updated, blocks "
+                "FROM files WHERE url = ? AND filepath = ?",
+                (url, filepath),
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        blocks = json.loads(row[7]) if row[7] else None
+        return FileMetadata(*row[:7], blocks=blocks)
+
+    def put(
+        self,
+        url: str,
+        filepath: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        blocks: Optional[Dict[str, Any]] = None,
+    ) -> Optional[FileMetadata]:
+        """记录一次成功的下载, 没有任何校验信息时不记录"""
+        if not etag and not last_modified:
+            self.remove(url, filepath)
+            return None
+        filepath = os.path.abspath(filepath)
+        stat = os.stat(filepath)
+        record = FileMetadata(
+            url=url,
+            filepath=filepath,
+            etag=etag,
+            last_modified=last_modified,
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            updated=time.time(),
+            blocks=blocks,
+        )
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO files "
+                    "(url, filepath, etag, last_modified, size, mtime, updated, blocks) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        record.url,
+                        record.filepath,
+                        record.etag,
+                        record.last_modified,
+                        record.size,
+                        record.mtime,
+                        record.updated,
+                        json.dumps(blocks) if blocks else None,
+                    ),
+                )
+        finally:
+            conn.close()
+        return record
+
+    def remove(self, url: str, filepath: str):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "DELETE FROM files WHERE url = ? AND filepath = ?",
+                    (url, os.path.abspath(filepath)),
+                )
+        finally:
+            conn.close()
+
+    def conditional_headers(self, url: str, filepath: str) -> Dict[str, str]:
+        """本地文件仍是上次下载的状态时返回条件请求头, 否则返回空字典"""
+        record = self.get(url, filepath)
+        if record is None or not record.local_unchanged():
+            return {}
+        return record.conditional_headers()
+
+
+def resolve_metadata(metadata=None) -> Optional[MetadataStore]:
+    """取得下载记录
+
+    Args:
+        metadata: MetadataStore 实例、数据库路径或 True(默认路径),
+            为空时使用 DownloadConfig.metadata_path, 未配置时不记录
+
+    Returns:
+        Optional[MetadataStore]: 下载记录, 未启用时返回 None
+    """
+    if isinstance(metadata, MetadataStore):
+        return metadata
+    if metadata is None:
+        metadata = get_config().download.metadata_path
+    if not metadata:
+        return None
+    return MetadataStore(None if metadata is True else metadata)
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+import requests
+from funlog import getLogger
+
+from .probe import RemoteInfo
+
+logger = getLogger("funget")
+
+
+class Mirror:
+    """同一文件的一个镜像地址及其传输统计"""
+
+    def __init__(self, url: str, info: Optional[RemoteInfo] = None):
+        """
+        :param url: 镜像地址
+        :param info: 镜像的探测结果, 为空时表示尚未探测
+        """
+        self.url = url
+        self.info = info
+        # 按请求统计的单连接吞吐量(字节/秒), 指数加权平均, 0 表示尚未测得
+        self.throughput = info.throughput if info is not None else 0.0
+        self.active = 0
+        self.requests = 0
+        self.samples = 0
+        self.bytes = 0
+        self.failures = 0
+        # 连续失败次数, 成功一次即清零
+        self.errors = 0
+        self.disabled: Optional[str] = None
+
+    @property
+    def request_url(self) -> str:
+        """实际请求的地址, 探测时跟随了重定向则使用最终地址"""
+        return self.info.final_url if self.info is not None else self.url
+
+    @property
+    def if_range(self) -> Optional[str]:
+        return self.info.if_range if self.info is not None else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "throughput": self.throughput,
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "failures": self.failures,
+            "disabled": self.disabled,
+        }
+
+
+class MirrorSet:
+    """在多个镜像之间分配范围请求
+
+    每个请求开始时选择 (进行中的请求数 + 1) / 吞吐量 最小的镜像, 同时进行的请求数与各镜像
+    测得的吞吐量成正比, 越快的镜像分到越多的范围; 尚未测得吞吐量的镜像按当前最快的计算,
+    保证每个镜像都会被试用。连续失败 max_errors 次, 或在 min_samples 次请求后吞吐量仍低于
+    最快镜像的 lag_ratio 倍的镜像不再使用, 但至少保留一个。
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        max_errors: int = 3,
+        lag_ratio: float = 0.1,
+        min_samples: int = 2,
+        smoothing: float = 0.3,
+        min_sample_size: int = 64 * 1024,
+    ):
+        """
+        :param urls: 镜像地址, 第一个为主地址
+        :param max_errors: 连续失败该次数后不再使用该镜像
+        :param lag_ratio: 吞吐量低于最快镜像的该倍数时不再使用该镜像
+        :param min_samples: 判断镜像是否落后前至少需要的请求数
+        :param smoothing: 吞吐量指数加权平均中新样本的权重
+        :param min_sample_size: 传输量不足该字节数的请求不计入吞吐量
+        """
+        self.mirrors = [Mirror(url) for url in dict.fromkeys(urls)]
+        self.max_errors = max_errors
+        self.lag_ratio = lag_ratio
+        self.min_samples = min_samples
+        self.smoothing = smoothing
+        self.min_sample_size = min_sample_size
+        self.probed = False
+        self._lock = Lock()
+
+    @property
+    def available(self) -> List[Mirror]:
+        return [mirror for mirror in self.mirrors if mirror.disabled is None]
+
+    def probe(
+        self,
+        size: int,
+        etag: Optional[str] = None,
+        info: Optional[RemoteInfo] = None,
+        session: Optional[requests.Session] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: int = 30,
+        auth=None,
+    ) -> List[Mirror]:
+        """并行探测各镜像, 大小或 ETag 与主地址不一致、不支持范围请求的镜像不再使用
+
+        Args:
+            size: 文件大小
+            etag: 主地址的 ETag, 镜像给出不同的 ETag 时视为不同的文件
+            info: 主地址的探测结果, 传入时不再探测主地址
+            session: 发送请求的会话
+            headers: 额外的请求头
+            timeout: 超时时间(秒)
+            auth: 认证信息
+
+        Returns:
+            List[Mirror]: 可用的镜像
+        """
+
+        def check(mirror: Mirror):
+            if mirror is self.mirrors[0] and info is not None:
+                mirror.info = info
+            else:
+                try:
+                    mirror.info = RemoteInfo.probe(
+                        mirror.url,
+                        session=session,
+                        headers=headers,
+                        timeout=timeout,
+                        auth=auth,
+                        probe_size=64 * 1024,
+                    )
+                except requests.exceptions.RequestException as e:
+                    mirror.disabled = f"probe failed: {e}"
+                    return
+            mirror.throughput = mirror.throughput or mirror.info.throughput
+            if not mirror.info.accept_ranges:
+                mirror.disabled = "no range support"
+            elif mirror.info.size != size:
+                mirror.disabled = f"size {mirror.info.size} != {size}"
+            elif etag and mirror.info.etag and mirror.info.etag != etag:
+                mirror.disabled = f"etag {mirror.info.etag} != {etag}"
+
+        with ThreadPoolExecutor(max_workers=len(self.mirrors)) as executor:
+            list(executor.map(check, self.mirrors))
+        for mirror in self.mirrors:
+            if mirror.disabled is not None:
+                logger.warning(f"Mirror {mirror.url} disabled: {mirror.disabled}")
+        if not self.available:
+            # 全部不可用时仍使用主地址, 由正常的重试和校验处理
+            self.mirrors[0].disabled = None
+        self.probed = True
+        return self.available
+
+    def acquire(self) -> Mirror:
+        """为一个请求选择镜像, 请求结束后须调用 release"""
+        with self._lock:
+            mirrors = self.available
+            best = max((mirror.throughput for mirror in mirrors), default=0.0) or 1.0
+            mirror = min(
+                mirrors, key=lambda item: (item.active + 1) / (item.throughput or best)
+            )
+            mirror.active += 1
+            mirror.requests += 1
+            return mirror
+
+    def release(
+        self,
+        mirror: Mirror,
+        size: int,
+        elapsed: float,
+        error: Optional[Exception] = None,
+    ):
+        """记录一个请求的结果
+
+        Args:
+            mirror: acquire 返回的镜像
+            size: 本次请求写入的字节数
+            elapsed: 本次请求的耗时(秒)
+            error: 请求失败时的异常
+        """
+        with self._lock:
+            mirror.active -= 1
+            mirror.bytes += size
+            if error is not None:
+                mirror.failures += 1
+                mirror.errors += 1
+                if mirror.errors >= self.max_errors:
+                    self._disable(
+                        mirror, f"{mirror.errors} consecutive errors: {error}"
+                    )
+                return
+            mirror.errors = 0
+            if size < self.min_sample_size or elapsed <= 0:
+                return
+            sample = size / elapsed
+            if mirror.samples == 0:
+                mirror.throughput = sample
+            else:
+                mirror.throughput += self.smoothing * (sample - mirror.throughput)
+            mirror.samples += 1
+            self._drop_laggards()
+
+    def _drop_laggards(self):
+        """停用吞吐量远低于最快镜像的镜像, 调用方需持有锁"""
+        measured = [
+            mirror for mirror in self.available if mirror.samples >= self.min_samples
+        ]
+        if len(measured) < 2:
+            return
+        best = max(mirror.throughput for mirror in measured)
+        for mirror in measured:
+            if mirror.throughput < best * self.lag_ratio:
+                self._disable(
+                    mirror,
+                    f"lagging at {mirror.throughput / 1024 / 1024:.2f}MB/s "
+                    f"vs {best / 1024 / 1024:.2f}MB/s",
+                )
+
+    def _disable(self, mirror: Mirror, reason: str):
+        """停用一个镜像, 至少保留一个可用的镜像, 调用方需持有锁"""
+        if mirror.disabled is not None or len(self.available) <= 1:
+            return
+        mirror.disabled = reason
+        logger.warning(f"Mirror {mirror.url} disabled: {reason}")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """各镜像的请求数、字节数、吞吐量和停用原因"""
+        with self._lock:
+            return [mirror.to_dict() for mirror in self.mirrors]
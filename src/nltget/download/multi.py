@@ -1,23 +1,91 @@
 # -*- coding: utf-8 -*-
 import os
 import os.path
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
-import requests
-from funfile import ConcurrentFile
-from funfile.compress.utils import file_tqdm_bar
 from funlog import getLogger
 
+from ..config import get_config
+from .adaptive import AdaptiveConcurrency
 from .core import Downloader
-from .work import Worker, WorkerFactory
+from .events import DownloadEvents, combine_events, emits_complete
+from .journal import DownloadJournal
+from .manifest import BlockManifest
+from .mirror import MirrorSet
+from .progress import ProgressRenderer
+from .sink import FileSink, Sink, create_sink
+from .work import ResourceChangedError, Worker, WorkerFactory
 
 logger = getLogger("funget")
 
 
+class _RangeProgress(DownloadEvents):
+    """把 Worker 写入的数据汇总到进度条, 并统计已完成的块"""
+
+    def __init__(self, progress: ProgressRenderer, description: str):
+        self.progress = progress
+        self.description = description
+        # Worker -> 块序号, 拆分出的 Worker 不计入
+        self.indexes: Dict[int, int] = {}
+        self.finished = set()
+
+    def finish(self, index: int):
+        self.finished.add(index)
+        if self.progress.enabled:
+            self.progress.set_description(self.description.format(len(self.finished)))
+
+    def on_chunk(self, worker, offset: int, size: int):
+        self.progress.update(size)
+
+    def on_range_done(self, worker, success: bool, error=None):
+        index = self.indexes.get(id(worker))
+        if success and index is not None:
+            self.finish(index)
+
+
 class MultiDownloader(Downloader):
-    def __init__(self, block_size: int = 50, min_block_size: int = 1, *args, **kwargs):
+    def __init__(
+        self,
+        block_size: int = 50,
+        min_block_size: int = 1,
+        mirrors: Optional[List[str]] = None,
+        *args,
+        **kwargs,
+    ):
+        # 存在续传日志时直接使用其中记录的文件信息, 不再重复探测
+        self.journal: Optional[DownloadJournal] = None
+        url, filepath = kwargs.get("url"), kwargs.get("filepath")
+        if url and filepath and not kwargs.get("overwrite"):
+            journal = DownloadJournal.load(filepath)
+            if journal is not None and journal.matches(url, kwargs.get("filesize")):
+                self.journal = journal
+                kwargs["filesize"] = journal.size
+
         super(MultiDownloader, self).__init__(*args, **kwargs)
+        self.block_size = block_size
+        self.min_block_size = min_block_size
+        # 最近一次下载使用的写入目标, 内存写入时可从中取得数据
+        self.sink: Optional[Sink] = None
+        # 同一文件的其他镜像地址, 范围请求按各镜像的吞吐量分配
+        self.mirrors: Optional[MirrorSet] = None
+        if mirrors:
+            self.mirrors = MirrorSet([self.url] + list(mirrors))
+
+        if self.journal is not None:
+            self.etag = self.journal.etag
+            self.last_modified = self.journal.last_modified
+            self.accept_ranges = True
+            self.blocks_num = max(1, len(self.journal.ranges))
+            logger.info(
+                f"Resuming {self.filename} from journal: "
+                f"{self.journal.done_size:,}/{self.filesize:,} bytes downloaded"
+            )
+            return
+
+        self._plan_blocks()
 
+    def _plan_blocks(self):
+        """根据文件大小和服务器是否支持范围请求计算块数"""
         # 确保文件大小有效
         if self.filesize <= 0:
             logger.warning(
@@ -26,8 +94,8 @@ class MultiDownloader(Downloader):
             self.blocks_num = 1
         else:
             # 计算块数，但确保每个块至少有 min_block_size MB
-            block_size_bytes = block_size * 1024 * 1024
-            min_block_size_bytes = min_block_size * 1024 * 1024
+            block_size_bytes = self.block_size * 1024 * 1024
+            min_block_size_bytes = self.min_block_size * 1024 * 1024
 
             self.blocks_num = max(
                 1,
@@ -37,7 +105,8 @@ class MultiDownloader(Downloader):
                 ),
             )
 
-        if not self.check_available():
+        self.accept_ranges = self.check_available()
+        if not self.accept_ranges:
             logger.info(
                 f"{self.filename} does not support range requests, using single thread download."
             )
@@ -45,6 +114,8 @@ class MultiDownloader(Downloader):
 
     def __get_range(self) -> List[Tuple[int, int]]:
         """计算下载范围列表"""
+        if self.journal is not None and self.journal.ranges:
+            return [(start, end) for start, end in self.journal.ranges]
         if self.blocks_num <= 1:
             return [(0, self.filesize - 1)]
 
@@ -53,13 +124,10 @@ class MultiDownloader(Downloader):
 
         for i in range(self.blocks_num):
             start = i * size
-            if i > 0:
-                start += 1  # 避免重叠
-
             if i == self.blocks_num - 1:
                 end = self.filesize - 1  # 最后一块包含剩余所有字节
             else:
-                end = start + size
+                end = start + size - 1
 
             # 确保范围有效
             if start <= end:
@@ -69,6 +137,186 @@ class MultiDownloader(Downloader):
 
         return range_list
 
+    def _pending_ranges(self, fw) -> List[Tuple[int, int, int, int]]:
+        """结合已写入的记录计算待下载的范围
+
+        一个块中间有未写入的空洞时(如修复时只有个别分块校验失败), 每个空洞对应一项。
+
+        Args:
+            fw: 写入器, 通过其写入记录判断哪些数据已经下载过
+
+        Returns:
+            List[Tuple[int, int, int, int]]: (块序号, 起始位置, 结束位置, 已下载字节数),
+                起始位置大于结束位置表示该块已经下载完成; 同一块的多项中只有第一项计入已下载字节数
+        """
+        written = fw.written
+        pending = []
+        for index, (start, end) in enumerate(self.__get_range()):
+            gaps = []
+            position = start
+            for record_start, record_end in written:
+                if record_end <= position or record_start > end:
+                    continue
+                if record_start > position:
+                    gaps.append((position, record_start - 1))
+                position = max(position, record_end)
+                if position > end:
+                    break
+            if position <= end:
+                gaps.append((position, end))
+            done = (end - start + 1) - sum(
+                gap_end - gap_start + 1 for gap_start, gap_end in gaps
+            )
+            if not gaps:
+                pending.append((index, end + 1, end, done))
+                continue
+            for i, (gap_start, gap_end) in enumerate(gaps):
+                pending.append((index, gap_start, gap_end, done if i == 0 else 0))
+        return pending
+
+    @staticmethod
+    def _writes_file(sink: Union[str, Sink]) -> bool:
+        """写入目标是否落盘, 只有落盘的写入目标才需要检查已有文件和记录续传日志"""
+        if isinstance(sink, Sink):
+            return isinstance(sink, FileSink)
+        return sink in ("file", "pwrite", "mmap")
+
+    def _open_sink(
+        self, sink: Union[str, Sink] = "file", preallocate: Optional[str] = None
+    ) -> Sink:
+        """创建写入目标, 落盘且支持范围请求时用续传日志记录进度
+
+        Args:
+            sink: 写入目标名称或 Sink 实例
+            preallocate: 预分配策略, 为空时使用 DownloadConfig.preallocate
+        """
+        if isinstance(sink, Sink) or not self._writes_file(sink):
+            self.sink = create_sink(sink, size=max(0, self.filesize))
+            return self.sink
+        if sink == "mmap" and self.filesize <= 0:
+            logger.warning(
+                f"Unknown size of {self.filename}, falling back to file sink"
+            )
+            sink = "file"
+
+        journal = None
+        if self.accept_ranges:
+            if self.journal is None:
+                self.journal = DownloadJournal(
+                    filepath=self.filepath,
+                    url=self.url,
+                    size=self.filesize,
+                    etag=self.etag,
+                    last_modified=self.last_modified,
+                    ranges=[[start, end] for start, end in self.__get_range()],
+                    manifest=self._new_manifest(),
+                )
+            journal = self.journal
+        if preallocate is None:
+            preallocate = get_config().download.preallocate
+        self.sink = create_sink(
+            sink, self.filepath, self.filesize, journal, preallocate=preallocate
+        )
+        return self.sink
+
+    def _new_manifest(self) -> Optional[BlockManifest]:
+        """按 DownloadConfig.block_hash 创建分块校验值清单, none 或大小未知时不创建"""
+        algorithm = get_config().download.block_hash
+        if not algorithm or algorithm == "none" or self.filesize <= 0:
+            return None
+        return BlockManifest(self.filesize, algorithm=algorithm)
+
+    def _repair_journal(self) -> Optional[DownloadJournal]:
+        """本地文件在上次下载完成后被改动或损坏时, 按记录的分块校验值只重新下载损坏的块
+
+        需要启用下载记录, 且远端文件仍是记录的版本。
+        """
+        record = self._metadata_record()
+        if (
+            record is None
+            or not record.blocks
+            or not self.accept_ranges
+            or not os.path.exists(self.filepath)
+            or not record.matches(self.etag, self.last_modified, self.filesize)
+        ):
+            return None
+        logger.info(f"Repairing {self.filepath} with recorded block checksums")
+        return DownloadJournal(
+            filepath=self.filepath,
+            url=self.url,
+            size=self.filesize,
+            etag=self.etag,
+            last_modified=self.last_modified,
+            ranges=[[start, end] for start, end in self.__get_range()],
+            done=[[0, self.filesize]],
+            manifest=BlockManifest.from_dict(self.filesize, record.blocks),
+        )
+
+    def _save_metadata(self, blocks=None):
+        """记录下载信息时一并保存分块校验值"""
+        if (
+            blocks is None
+            and self.journal is not None
+            and self.journal.manifest is not None
+        ):
+            blocks = self.journal.manifest.to_dict()
+        super(MultiDownloader, self)._save_metadata(blocks)
+
+    def _prefill(self, fw: Sink) -> int:
+        """把探测时收到的文件开头写入写入目标, 这部分不再重复请求
+
+        Returns:
+            int: 写入的字节数
+        """
+        info = self.info
+        if info is None or not info.head or info.size != self.filesize:
+            return 0
+        # 续传时探测到的文件须与日志记录的是同一个版本
+        if self.journal is not None and self.journal.if_range != info.if_range:
+            return 0
+        # 不支持范围请求时只能整体下载, 除非探测时已经拿到了完整内容
+        if not (self.accept_ranges or info.complete):
+            return 0
+        if any(start <= 0 < end for start, end in fw.written):
+            return 0
+        return fw.write(info.head, 0)
+
+    def _probe_mirrors(self) -> Optional[MirrorSet]:
+        """首次使用镜像前核对各镜像的大小和 ETag, 不支持范围请求时不使用镜像"""
+        if self.mirrors is None or not self.accept_ranges or self.filesize <= 0:
+            return None
+        if not self.mirrors.probed:
+            info = (
+                self.info
+                if self.info is not None and self.info.size == self.filesize
+                else None
+            )
+            self.mirrors.probe(
+                size=self.filesize,
+                etag=self.etag,
+                info=info,
+                session=self._session,
+                headers=self.headers,
+                timeout=self.timeout,
+                auth=self.auth,
+            )
+        return self.mirrors
+
+    def _if_range(self) -> Optional[str]:
+        return self.journal.if_range if self.journal is not None else None
+
+    def _discard_journal(self):
+        """丢弃续传日志并重新探测远端文件"""
+        if self.journal is not None:
+            self.journal.remove()
+            self.journal = None
+        self.refresh()
+        self._plan_blocks()
+        if self.mirrors is not None:
+            # 远端文件已改变, 重新核对各镜像
+            self.mirrors = MirrorSet([mirror.url for mirror in self.mirrors.mirrors])
+
+    @emits_complete
     def download(
         self,
         worker_num: int = 5,
@@ -76,24 +324,72 @@ class MultiDownloader(Downloader):
         prefix: str = "",
         overwrite: bool = False,
         max_retries: int = 3,
+        adaptive: Optional[bool] = None,
+        max_worker_num: Optional[int] = None,
+        sink: Union[str, Sink] = "file",
+        preallocate: Optional[str] = None,
+        checksum=None,
+        verify: bool = True,
+        chunk_size: int = 2 * 1024 * 1024,
+        hedge: bool = False,
         *args,
         **kwargs,
     ) -> bool:
-        """执行多线程下载"""
+        """执行多线程下载
+
+        adaptive 为 True 时从较少的线程开始, 根据吞吐量和限流响应在 1 到
+        max_worker_num 之间动态调整并发数, 此时忽略 worker_num。两者为空时取
+        DownloadConfig.adaptive 和 DownloadConfig.max_worker_num。
+
+        sink 指定写入目标: file/pwrite 通过 os.pwrite 写文件, mmap 通过内存映射写文件,
+        memory 写入内存(完成后通过 self.sink.getvalue() 取得数据), null 丢弃数据,
+        也可以直接传入 Sink 实例。
+
+        preallocate 为写入文件前预留空间的策略(fallocate/sparse/none), 默认取
+        DownloadConfig.preallocate; 磁盘空间不足时在启动任何 Worker 之前失败。
+
+        checksum 为期望的校验值, 如 "sha256:<hex>"; 未给出且 verify 为真时使用响应头
+        (Digest/Repr-Digest/x-goog-hash 等)中的校验值。校验值在写入时计算, 不一致时删除文件
+        并返回 False, 计算结果保存在 self.digests 中。
+
+        chunk_size 为每个 Worker 单次读取和写入的字节数。
+
+        hedge 为 True 时, 任务队列为空后空闲线程为吞吐量远低于中位数的范围发出对冲请求,
+        两个请求中先完成的一方中断另一方, 见 WorkerFactory; 对冲会重复下载落后范围剩余的数据,
+        默认关闭。
+
+        构造时传入了 mirrors 时, 先核对各镜像的大小和 ETag, 之后每个范围请求按各镜像测得的
+        吞吐量选择地址, 失败或明显落后的镜像不再使用, 各镜像的统计见 self.stats["mirrors"]。
+        """
         try:
-            # 检查文件是否已存在且完整
+            config = get_config().download
+            if adaptive is None:
+                adaptive = config.adaptive
+            if max_worker_num is None:
+                max_worker_num = config.max_worker_num
+            if overwrite and self.journal is not None:
+                self._discard_journal()
+
+            writes_file = self._writes_file(sink)
+            # 检查本地文件是否已是最新版本, 存在续传日志说明上次下载没有完成
+            if writes_file and self.journal is None and self.is_up_to_date(overwrite):
+                logger.info(f"File {self.filepath} is up to date, skipping download.")
+                return True
+            # 缓存中有远端文件的当前版本时直接从缓存生成, 不再请求数据
+            if writes_file and self.journal is None and self._restore_from_cache():
+                return True
             if (
-                not overwrite
-                and os.path.exists(self.filepath)
-                and os.path.getsize(self.filepath) == self.filesize
+                writes_file
+                and self.journal is None
+                and not (overwrite or self.overwrite)
             ):
-                logger.info(
-                    f"File {self.filepath} already exists with correct size, skipping download."
-                )
-                return True
+                self.journal = self._repair_journal()
 
             # 确保目录存在
-            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+            if writes_file:
+                os.makedirs(
+                    os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True
+                )
 
             prefix = prefix if prefix else ""
             range_list = self.__get_range()
@@ -102,90 +398,137 @@ class MultiDownloader(Downloader):
                 logger.error("No valid download ranges calculated")
                 return False
 
-            success_files = []
-            pbar = file_tqdm_bar(
+            progress = ProgressRenderer(
                 path=self.filepath,
                 total=self.filesize,
                 prefix=f"{prefix}|0/{self.blocks_num}|",
+            ).start()
+            tracker = _RangeProgress(
+                progress,
+                f"{prefix}|{{}}/{self.blocks_num}|{os.path.basename(self.filepath)}",
             )
 
-            def update_pbar(total, curser, current):
-                try:
-                    pbar.update(current)
-                    pbar.refresh()
-                except Exception as e:
-                    logger.warning(f"Progress bar update failed: {e}")
+            controller = None
+            if adaptive:
+                controller = AdaptiveConcurrency(
+                    initial=min(4, max_worker_num), maximum=max_worker_num
+                )
+
+            # 所有 Worker 共用下载器的连接池, 连接数与线程数一致
+            self._pool.ensure_size(max_worker_num if adaptive else worker_num)
+            mirrors = self._probe_mirrors()
 
+            changed = corrupted = False
             try:
-                with ConcurrentFile(self.filepath, "wb") as fw:
+                with self._open_sink(sink, preallocate) as fw:
+                    fw.digest = self._create_digest(
+                        checksum, verify, fw.read if fw.readable else None
+                    )
+                    self._prefill(fw)
                     with WorkerFactory(
-                        worker_num=worker_num, capacity=capacity, timeout=30
+                        worker_num=worker_num,
+                        capacity=capacity,
+                        timeout=30,
+                        controller=controller,
+                        events=combine_events(tracker, self.events),
+                        hedge=hedge,
                     ) as pool:
-                        for index, (start, end) in enumerate(range_list):
-                            # 检查是否已经下载过这个范围
-                            original_start = start
-                            for record in fw._writen_data:
-                                if record[0] <= start <= record[1]:
-                                    downloaded_bytes = start - original_start
-                                    start = record[1] + 1
-                                    if downloaded_bytes > 0:
-                                        pbar.update(downloaded_bytes)
-                                    break
+                        for index, start, end, done in self._pending_ranges(fw):
+                            if done > 0:
+                                progress.update(done)
 
                             if start > end:
-                                success_files.append(index)
-                                pbar.set_description(
-                                    desc=f"{prefix}|{len(success_files)}/{self.blocks_num}|{os.path.basename(self.filepath)}"
-                                )
+                                tracker.finish(index)
                                 continue
 
-                            def finish_callback(worker: Worker, *args, **kwargs):
-                                success_files.append(index)
-                                pbar.set_description(
-                                    desc=f"{prefix}|{len(success_files)}/{self.blocks_num}|{os.path.basename(self.filepath)}"
-                                )
-
                             worker = Worker(
-                                url=self.url,
+                                url=self.request_url,
                                 range_start=start,
                                 range_end=end,
                                 fileobj=fw,
-                                update_callback=update_pbar,
-                                finish_callback=finish_callback,
                                 headers=self.headers,
+                                chunk_size=chunk_size,
                                 max_retries=max_retries,
+                                session=self._session,
+                                if_range=self._if_range(),
+                                mirrors=mirrors,
                             )
+                            tracker.indexes[id(worker)] = index
                             pool.submit(worker=worker)
 
-                        # 检查是否有失败的任务需要重试
+                        # 等待本轮任务结束, 失败的任务重试一次
+                        pool.wait_for_all_done()
                         failed_tasks = pool.get_failed_tasks()
-                        if failed_tasks:
+                        changed = any(
+                            isinstance(task.error, ResourceChangedError)
+                            for task in failed_tasks
+                        )
+                        if failed_tasks and not changed:
                             logger.warning(f"Retrying {len(failed_tasks)} failed tasks")
                             pool.retry_failed_tasks()
 
+                    success = not pool.get_failed_tasks()
+                    corrupted = success and not self._verify_digest(fw.digest)
+                    # 未完成时保留续传日志, 校验失败时数据作废, 日志也随之删除
+                    fw.close(complete=success)
+                self.stats.update(self._pool.stats())
+                self.stats.update(pool.stats())
+                if mirrors is not None:
+                    self.stats["mirrors"] = mirrors.stats()
+                self._pool.record_metrics()
+                logger.debug(f"Download stats: {self.stats}")
             except Exception as e:
                 logger.error(f"Download failed: {e}")
                 return False
             finally:
-                try:
-                    pbar.close()
-                except:
-                    pass
+                progress.close()
+
+            if corrupted:
+                if writes_file:
+                    self._discard_corrupted()
+                return False
+            if changed:
+                # 远端文件已改变, 已下载的数据作废, 重新下载
+                logger.warning(f"{self.url} changed since last download, restarting")
+                self._discard_journal()
+                return self.download(
+                    worker_num=worker_num,
+                    capacity=capacity,
+                    prefix=prefix,
+                    overwrite=True,
+                    max_retries=max_retries,
+                    adaptive=adaptive,
+                    max_worker_num=max_worker_num,
+                    sink=sink,
+                    preallocate=preallocate,
+                    checksum=checksum,
+                    verify=verify,
+                    chunk_size=chunk_size,
+                    hedge=hedge,
+                    *args,
+                    **kwargs,
+                )
+            if success and writes_file:
+                self._save_metadata()
+                self._save_to_cache()
+            return success
 
         except Exception as e:
             logger.error(f"Unexpected error during download: {e}")
             return False
 
     def check_available(self) -> bool:
-        """检查服务器是否支持范围请求"""
+        """检查服务器是否支持范围请求, 已经探测过时直接使用探测结果"""
         if self.blocks_num < 1:
             return False
+        if self.info is not None:
+            return self.info.accept_ranges
 
         try:
             headers = {"Range": "bytes=0-100"}
             headers.update(self.headers)
 
-            with requests.get(
+            with self._session.get(
                 self.url, stream=True, headers=headers, timeout=30
             ) as req:
                 # 206 表示部分内容，支持范围请求
@@ -206,7 +549,7 @@ class MultiDownloader(Downloader):
 
 
 def download(
-    url: str,
+    url: Union[str, List[str]],
     filepath: str,
     overwrite: bool = False,
     worker_num: int = 5,
@@ -214,13 +557,18 @@ def download(
     block_size: int = 100,
     prefix: str = "",
     max_retries: int = 3,
+    adaptive: Optional[bool] = None,
+    max_worker_num: Optional[int] = None,
+    sink: Union[str, Sink] = "file",
+    preallocate: Optional[str] = None,
+    checksum=None,
     *args,
     **kwargs,
 ) -> bool:
     """多线程下载文件
 
     Args:
-        url: 下载链接
+        url: 下载链接, 或同一文件的多个镜像地址, 第一个为主地址
         filepath: 保存路径
         overwrite: 是否覆盖已存在的文件
         worker_num: 工作线程数
@@ -228,11 +576,19 @@ def download(
         block_size: 块大小(MB)
         prefix: 进度条前缀
         max_retries: 最大重试次数
+        adaptive: 是否根据吞吐量自适应调整线程数, 默认取 DownloadConfig.adaptive
+        max_worker_num: 自适应模式下的最大线程数, 默认取 DownloadConfig.max_worker_num
+        sink: 写入目标, file/pwrite/mmap/memory/null 或 Sink 实例
+        preallocate: 预分配策略, fallocate/sparse/none, 默认取 DownloadConfig.preallocate
+        checksum: 期望的校验值, 如 "sha256:<hex>", 为空时使用响应头中的校验值
 
     Returns:
         bool: 下载是否成功
     """
     try:
+        if isinstance(url, (list, tuple)):
+            # 第一个地址为主地址, 其余为镜像
+            url, kwargs["mirrors"] = url[0], list(url[1:])
         downloader = MultiDownloader(
             url=url,
             filepath=filepath,
@@ -246,6 +602,11 @@ def download(
             capacity=capacity,
             prefix=prefix,
             max_retries=max_retries,
+            adaptive=adaptive,
+            max_worker_num=max_worker_num,
+            sink=sink,
+            preallocate=preallocate,
+            checksum=checksum,
             *args,
             **kwargs,
         )
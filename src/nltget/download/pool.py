@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from funlog import getLogger
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ..metrics import CONNECTIONS
+
+logger = getLogger("funget")
+
+
+class SessionPool:
+    """可共享的 HTTP 连接池
+
+    一个下载器及其所有 Worker 共用同一个 requests.Session, 保持连接 keep-alive,
+    不同的块之间复用已建立的 TCP/TLS 连接。连接池大小应不小于并发线程数,
+    否则多出来的连接用完即被丢弃。
+    """
+
+    # 进程级共享的连接池, 以 (scheme, host) 为键
+    _shared: Dict[Tuple[str, str], "SessionPool"] = {}
+    _shared_lock = Lock()
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        max_retries: int = 3,
+        pool_connections: int = 32,
+    ):
+        """
+        :param pool_size: 每个主机保持的最大连接数
+        :param max_retries: 连接与 5xx/429 响应的重试次数
+        :param pool_connections: 缓存的主机连接池数量
+        """
+        self.pool_size = 0
+        self.max_retries = max_retries
+        self.pool_connections = pool_connections
+        self.session = requests.Session()
+        self._lock = Lock()
+        self._adapter: Optional[HTTPAdapter] = None
+        # 替换掉的旧适配器的统计, 扩容后继续累加
+        self._retired = {"connections": 0, "requests": 0}
+        # 已计入运行指标的连接数, 见 record_metrics
+        self._recorded = {"connections": 0, "reused": 0}
+        self.ensure_size(pool_size)
+
+    def _mount(self, pool_size: int):
+        retry_strategy = Retry(
+            total=self.max_retries,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["HEAD", "GET", "OPTIONS"],
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=pool_size,
+            max_retries=retry_strategy,
+        )
+        old, self._adapter = self._adapter, adapter
+        if old is not None:
+            counts = self._count(old)
+            self._retired["connections"] += counts["connections"]
+            self._retired["requests"] += counts["requests"]
+            old.close()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.pool_size = pool_size
+
+    def ensure_size(self, pool_size: int) -> "SessionPool":
+        """保证连接池至少能容纳 pool_size 个并发连接"""
+        with self._lock:
+            if pool_size > self.pool_size:
+                self._mount(pool_size)
+        return self
+
+    @staticmethod
+    def _count(adapter: HTTPAdapter) -> Dict[str, int]:
+        connections = requests_ = 0
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            requests_ += pool.num_requests
+        return {"connections": connections, "requests": requests_}
+
+    def stats(self) -> Dict[str, Any]:
+        """连接统计
+
+        Returns:
+            Dict[str, Any]: connections 新建连接数, requests 请求数,
+                reused 复用连接的请求数, reuse_ratio 连接复用率
+        """
+        with self._lock:
+            counts = self._count(self._adapter)
+            connections = counts["connections"] + self._retired["connections"]
+            requests_ = counts["requests"] + self._retired["requests"]
+        reused = max(0, requests_ - connections)
+        return {
+            "pool_size": self.pool_size,
+            "connections": connections,
+            "requests": requests_,
+            "reused": reused,
+            "reuse_ratio": reused / requests_ if requests_ else 0.0,
+        }
+
+    def record_metrics(self):
+        """把上次记录以来新建和复用的连接数计入运行指标, 多个下载共用连接池时不会重复计数"""
+        stats = self.stats()
+        with self._lock:
+            opened = max(0, stats["connections"] - self._recorded["connections"])
+            reused = max(0, stats["reused"] - self._recorded["reused"])
+            self._recorded["connections"] += opened
+            self._recorded["reused"] += reused
+        if opened > 0:
+            CONNECTIONS.inc(opened, state="opened")
+        if reused > 0:
+            CONNECTIONS.inc(reused, state="reused")
+
+    def close(self):
+        self.record_metrics()
+        self.session.close()
+
+    @classmethod
+    def shared(
+        cls, url: str, pool_size: int = 10, max_retries: int = 3
+    ) -> "SessionPool":
+        """获取进程级共享的连接池, 同一主机的下载复用同一个连接池"""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        with cls._shared_lock:
+            pool = cls._shared.get(key)
+            if pool is None:
+                pool = cls(pool_size=pool_size, max_retries=max_retries)
+                cls._shared[key] = pool
+                logger.debug(f"Created shared session pool for {parts.netloc}")
+        return pool.ensure_size(pool_size)
+
+    @classmethod
+    def close_shared(cls):
+        """关闭所有进程级共享的连接池"""
+        with cls._shared_lock:
+            pools, cls._shared = list(cls._shared.values()), {}
+        for pool in pools:
+            pool.close()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+import re
+import time
+from typing import Any, Dict, Optional
+
+import requests
+from funlog import getLogger
+
+from .digest import parse_digest_headers
+
+logger = getLogger("funget")
+
+_CONTENT_RANGE = re.compile(r"bytes\s+(?:(\d+)-(\d+)|\*)/(\d+|\*)")
+
+
+class RemoteInfo:
+    """远端文件信息
+
+    由一次 ``GET Range: bytes=0-N`` 探测得到: 文件大小(Content-Range)、是否支持范围请求、
+    ETag/Last-Modified、响应头中的校验值以及重定向后的最终地址, 并保留响应中的前 N 个字节。
+    不超过 N 字节的小文件探测时即已取得完整内容, 下载器不必再发送请求。
+    同时记录收到响应头的耗时和读取这 N 个字节的速度, 作为往返时间和单连接吞吐量的估计。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        final_url: Optional[str] = None,
+        size: int = 0,
+        accept_ranges: bool = False,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        content_type: Optional[str] = None,
+        head: bytes = b"",
+        complete: bool = False,
+        not_modified: bool = False,
+        digests: Optional[Dict[str, str]] = None,
+        rtt: float = 0.0,
+        throughput: float = 0.0,
+    ):
+        """
+        :param url: 请求的地址
+        :param final_url: 重定向后的最终地址
+        :param size: 文件大小, 未知时为 0
+        :param accept_ranges: 是否支持范围请求
+        :param etag: 远端文件的 ETag
+        :param last_modified: 远端文件的 Last-Modified
+        :param content_type: 远端文件的 Content-Type
+        :param head: 探测时收到的文件开头的数据
+        :param complete: head 是否已经是完整的文件内容
+        :param not_modified: 条件请求返回 304, 远端文件与本地记录的版本相同
+        :param digests: 响应头中整个文件的校验值, {算法: 十六进制}
+        :param rtt: 发出探测请求到收到响应头的耗时(秒), 新建连接时包含建立连接的时间
+        :param throughput: 读取探测数据的速度(字节/秒), 未知时为 0
+        """
+        self.url = url
+        self.final_url = final_url or url
+        self.size = size
+        self.accept_ranges = accept_ranges
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+        self.head = head
+        self.complete = complete
+        self.not_modified = not_modified
+        self.digests = digests or {}
+        self.rtt = rtt
+        self.throughput = throughput
+
+    @classmethod
+    def probe(
+        cls,
+        url: str,
+        session: Optional[requests.Session] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: int = 30,
+        auth=None,
+        probe_size: int = 256 * 1024,
+    ) -> "RemoteInfo":
+        """用一个范围请求探测远端文件, 请求失败时抛出 requests 的异常
+
+        Args:
+            url: 下载地址
+            session: 发送请求的会话, 为空时使用 requests.get
+            headers: 额外的请求头, 可以包含 If-None-Match/If-Modified-Since
+            timeout: 超时时间(秒)
+            auth: 认证信息
+            probe_size: 探测请求的范围大小, 不超过该大小的文件探测时即取得完整内容
+
+        Returns:
+            RemoteInfo: 远端文件信息
+        """
+        request_headers = {"Range": f"bytes=0-{probe_size - 1}"}
+        request_headers.update(headers or {})
+        getter = session.get if session is not None else requests.get
+        started = time.monotonic()
+        with getter(
+            url, stream=True, headers=request_headers, timeout=timeout, auth=auth
+        ) as resp:
+            received = time.monotonic()
+            info = cls(
+                url=url,
+                final_url=resp.url,
+                etag=resp.headers.get("ETag"),
+                last_modified=resp.headers.get("Last-Modified"),
+                content_type=resp.headers.get("Content-Type"),
+                rtt=received - started,
+            )
+            total = cls._parse_total(resp.headers.get("Content-Range"))
+
+            if resp.status_code == 304:
+                info.not_modified = True
+                return info
+
+            if resp.status_code == 416:
+                # 空文件无法满足任何范围
+                info.accept_ranges = True
+                info.size = total or 0
+                info.complete = info.size == 0
+                return info
+
+            resp.raise_for_status()
+            info.digests = parse_digest_headers(
+                resp.headers, partial=resp.status_code == 206
+            )
+            if resp.status_code == 206:
+                info.accept_ranges = True
+                info.size = total or 0
+                info.head = resp.content
+            else:
+                # 服务器忽略了 Range, 返回完整内容, 只读取开头的 probe_size 字节
+                info.accept_ranges = (
+                    resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+                )
+                info.size = int(resp.headers.get("Content-Length", 0) or 0)
+                info.head = cls._read(resp, probe_size + 1)
+                if len(info.head) <= probe_size and not info.size:
+                    # 未给出长度但内容已经读完
+                    info.size = len(info.head)
+                info.head = info.head[:probe_size]
+            elapsed = time.monotonic() - received
+            if info.head and elapsed > 0:
+                info.throughput = len(info.head) / elapsed
+
+            if info.size > 0 and len(info.head) >= info.size:
+                info.head = info.head[: info.size]
+                info.complete = True
+            elif info.size == 0 and resp.status_code == 200 and not info.head:
+                info.complete = True
+        logger.debug(
+            f"Probed {url}: size={info.size}, ranges={info.accept_ranges}, "
+            f"head={len(info.head)}, complete={info.complete}, "
+            f"rtt={info.rtt * 1000:.1f}ms, throughput={info.throughput / 1024 / 1024:.1f}MB/s"
+        )
+        return info
+
+    @property
+    def if_range(self) -> Optional[str]:
+        """If-Range 请求头的取值, 弱 ETag 不能用于 If-Range, 退而使用 Last-Modified"""
+        if self.etag and not self.etag.startswith("W/"):
+            return self.etag
+        return self.last_modified
+
+    @staticmethod
+    def _parse_total(content_range: Optional[str]) -> Optional[int]:
+        match = _CONTENT_RANGE.match(content_range or "")
+        if match is None or match.group(3) == "*":
+            return None
+        return int(match.group(3))
+
+    @staticmethod
+    def _read(resp: requests.Response, limit: int) -> bytes:
+        """最多读取 limit 字节的响应内容"""
+        data = bytearray()
+        for chunk in resp.iter_content(chunk_size=64 * 1024):
+            data += chunk
+            if len(data) >= limit:
+                break
+        return bytes(data[:limit])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "final_url": self.final_url,
+            "size": self.size,
+            "accept_ranges": self.accept_ranges,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "content_type": self.content_type,
+            "head": len(self.head),
+            "complete": self.complete,
+            "not_modified": self.not_modified,
+            "digests": self.digests,
+            "rtt": self.rtt,
+            "throughput": self.throughput,
+        }
+
+    def __repr__(self):
+        return f"RemoteInfo({self.to_dict()})"
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import os.path
+import queue
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from funlog import getLogger
+
+from ..metrics import BYTES
+from .events import RangeState, combine_events, emits_complete
+from .multi import MultiDownloader, _RangeProgress
+from .pool import SessionPool
+from .progress import ProgressRenderer
+from .sink import Sink, _pwrite
+from .work import ResourceChangedError, Worker
+
+logger = getLogger("funget")
+
+
+class _ChannelSink(Sink):
+    """子进程中的写入目标, 通过 os.pwrite 直接写入目标文件, 每写入一块向父进程报告一次"""
+
+    def __init__(self, filepath: str, results, *args, **kwargs):
+        """
+        :param filepath: 文件路径, 由父进程创建并预分配
+        :param results: 向父进程报告进度的队列
+        """
+        super(_ChannelSink, self).__init__(*args, **kwargs)
+        self.filepath = filepath
+        self.results = results
+        self.task: Optional[int] = None
+        self._fd = None
+
+    def _open(self, resume: bool):
+        # 文件由父进程打开和截断, 子进程只写入, 不能截断
+        self._fd = os.open(self.filepath, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+
+    def _write(self, chunk, offset: int) -> int:
+        size = _pwrite(self._fd, chunk, offset)
+        self.results.put(("chunk", self.task, offset, size))
+        return size
+
+    def _close(self):
+        os.close(self._fd)
+        self._fd = None
+
+    def __repr__(self):
+        return f"_ChannelSink({self.filepath!r})"
+
+
+def _process_main(
+    filepath: str,
+    url: str,
+    headers: Dict[str, str],
+    chunk_size: int,
+    max_retries: int,
+    if_range: Optional[str],
+    tasks,
+    results,
+):
+    """子进程入口: 用自己的连接池依次下载任务队列中的范围, 收到 None 时退出
+
+    每个任务依次报告 ("start", 任务号), 若干 ("chunk", 任务号, 偏移, 字节数) 和
+    ("done", 任务号, 是否成功, 错误信息, 远端文件是否已改变)。
+    """
+    pool = SessionPool(pool_size=1, max_retries=max_retries)
+    with _ChannelSink(filepath, results) as fw:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, start, end = task
+            fw.task = task_id
+            results.put(("start", task_id))
+            try:
+                worker = Worker(
+                    url=url,
+                    range_start=start,
+                    range_end=end,
+                    fileobj=fw,
+                    headers=headers,
+                    chunk_size=chunk_size,
+                    max_retries=max_retries,
+                    session=pool.session,
+                    if_range=if_range,
+                )
+                success = worker.run()
+                results.put(("done", task_id, success, None, False))
+            except Exception as e:
+                changed = isinstance(e, ResourceChangedError)
+                results.put(
+                    ("done", task_id, False, f"{type(e).__name__}: {e}", changed)
+                )
+    pool.session.close()
+
+
+class ProcessMultiDownloader(MultiDownloader):
+    """多进程下载
+
+    TLS 解密和数据处理受 GIL 限制, 线程数增加后单进程的吞吐量不再上升。本引擎把范围分配给
+    多个子进程, 每个子进程有自己的连接, 通过 os.pwrite 直接写入同一个目标文件,
+    只通过队列向父进程报告写入的区间。父进程负责分块、续传日志、进度、校验值和事件,
+    行为与 MultiDownloader 一致; 需要计算校验值时父进程从文件读回子进程写入的数据。
+    """
+
+    @emits_complete
+    def download(
+        self,
+        worker_num: int = 4,
+        prefix: str = "",
+        overwrite: bool = False,
+        max_retries: int = 3,
+        preallocate: Optional[str] = None,
+        checksum=None,
+        verify: bool = True,
+        chunk_size: int = 2 * 1024 * 1024,
+        start_method: str = "spawn",
+        *args,
+        **kwargs,
+    ) -> bool:
+        """执行多进程下载
+
+        worker_num 为子进程数, 每个子进程同时下载一个范围。start_method 为
+        multiprocessing 的启动方式, 默认 spawn, 避免 fork 带走父进程中的连接和锁。
+        不支持 os.pwrite 的平台、大小未知或不支持范围请求时退化为多线程下载。
+        其余参数见 MultiDownloader.download; 进程之间不拆分范围, 也不发出对冲请求。
+        """
+        if not hasattr(os, "pwrite") or not self.accept_ranges or self.filesize <= 0:
+            logger.info(
+                f"Multi-process download unavailable for {self.filename}, using threads"
+            )
+            return super(ProcessMultiDownloader, self).download(
+                worker_num=worker_num,
+                prefix=prefix,
+                overwrite=overwrite,
+                max_retries=max_retries,
+                preallocate=preallocate,
+                checksum=checksum,
+                verify=verify,
+                chunk_size=chunk_size,
+                *args,
+                **kwargs,
+            )
+        try:
+            if overwrite and self.journal is not None:
+                self._discard_journal()
+
+            if self.journal is None and self.is_up_to_date(overwrite):
+                logger.info(f"File {self.filepath} is up to date, skipping download.")
+                return True
+            if self.journal is None and self._restore_from_cache():
+                return True
+            if self.journal is None and not (overwrite or self.overwrite):
+                self.journal = self._repair_journal()
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True)
+
+            prefix = prefix if prefix else ""
+            progress = ProgressRenderer(
+                path=self.filepath,
+                total=self.filesize,
+                prefix=f"{prefix}|0/{self.blocks_num}|",
+            ).start()
+            tracker = _RangeProgress(
+                progress,
+                f"{prefix}|{{}}/{self.blocks_num}|{os.path.basename(self.filepath)}",
+            )
+
+            changed = corrupted = False
+            try:
+                with self._open_sink("file", preallocate) as fw:
+                    fw.digest = self._create_digest(checksum, verify, fw.read)
+                    self._prefill(fw)
+                    tasks: List[Tuple[int, int, int]] = []
+                    for index, start, end, done in self._pending_ranges(fw):
+                        if done > 0:
+                            progress.update(done)
+                        if start > end:
+                            tracker.finish(index)
+                            continue
+                        tasks.append((index, start, end))
+
+                    options = dict(
+                        worker_num=worker_num,
+                        chunk_size=chunk_size,
+                        max_retries=max_retries,
+                        start_method=start_method,
+                    )
+                    failed, changed = self._run_tasks(fw, tasks, tracker, **options)
+                    if failed and not changed:
+                        # 失败的任务可能已写入一部分, 按写入记录重新计算后重试一次
+                        logger.warning(f"Retrying {failed} failed tasks")
+                        tasks = [
+                            (index, start, end)
+                            for index, start, end, _ in self._pending_ranges(fw)
+                            if start <= end
+                        ]
+                        failed, changed = self._run_tasks(fw, tasks, tracker, **options)
+
+                    success = not failed
+                    corrupted = success and not self._verify_digest(fw.digest)
+                    # 未完成时保留续传日志, 校验失败时数据作废, 日志也随之删除
+                    fw.close(complete=success)
+                logger.debug(f"Download stats: {self.stats}")
+            except Exception as e:
+                logger.error(f"Download failed: {e}")
+                return False
+            finally:
+                progress.close()
+
+            if corrupted:
+                self._discard_corrupted()
+                return False
+            if changed:
+                # 远端文件已改变, 已下载的数据作废, 重新下载
+                logger.warning(f"{self.url} changed since last download, restarting")
+                self._discard_journal()
+                return self.download(
+                    worker_num=worker_num,
+                    prefix=prefix,
+                    overwrite=True,
+                    max_retries=max_retries,
+                    preallocate=preallocate,
+                    checksum=checksum,
+                    verify=verify,
+                    chunk_size=chunk_size,
+                    start_method=start_method,
+                    *args,
+                    **kwargs,
+                )
+            if success:
+                self._save_metadata()
+                self._save_to_cache()
+            return success
+
+        except Exception as e:
+            logger.error(f"Unexpected error during download: {e}")
+            return False
+
+    def _run_tasks(
+        self,
+        fw: Sink,
+        tasks: List[Tuple[int, int, int]],
+        tracker: _RangeProgress,
+        worker_num: int,
+        chunk_size: int,
+        max_retries: int,
+        start_method: str,
+    ) -> Tuple[int, bool]:
+        """启动子进程下载一批范围, 在父进程中登记写入的区间、更新进度并触发事件
+
+        Args:
+            fw: 父进程的写入目标, 子进程写入的区间通过 record 登记
+            tasks: (块序号, 起始位置, 结束位置) 列表
+            tracker: 进度条和块计数
+
+        Returns:
+            Tuple[int, bool]: (失败的任务数, 远端文件是否已改变)
+        """
+        if not tasks:
+            return 0, False
+        events = combine_events(tracker, self.events)
+        context = multiprocessing.get_context(start_method)
+        task_queue, results = context.Queue(), context.Queue()
+        # 每个块剩余的任务数, 全部完成时块才算完成
+        remaining = Counter(index for index, _, _ in tasks)
+        states = [RangeState(start, end, fw) for _, start, end in tasks]
+        for task_id, (_, start, end) in enumerate(tasks):
+            task_queue.put((task_id, start, end))
+        process_num = max(1, min(worker_num, len(tasks)))
+        for _ in range(process_num):
+            task_queue.put(None)
+
+        processes = [
+            context.Process(
+                target=_process_main,
+                args=(
+                    self.filepath,
+                    self.request_url,
+                    self.headers,
+                    chunk_size,
+                    max_retries,
+                    self._if_range(),
+                    task_queue,
+                    results,
+                ),
+                daemon=True,
+            )
+            for _ in range(process_num)
+        ]
+        failed, changed, pending = 0, False, len(tasks)
+        try:
+            for process in processes:
+                process.start()
+            while pending:
+                try:
+                    message = results.get(timeout=1.0)
+                except queue.Empty:
+                    # 子进程异常退出时其任务不会再有结果, 本轮剩余的任务都算失败
+                    if any(process.exitcode not in (None, 0) for process in processes):
+                        logger.error(
+                            f"Download process exited unexpectedly, {pending} tasks lost"
+                        )
+                        failed += pending
+                        break
+                    continue
+                kind, task_id = message[0], message[1]
+                state = states[task_id]
+                if kind == "chunk":
+                    offset, size = message[2], message[3]
+                    fw.record(offset, size)
+                    state.downloaded += size
+                    BYTES.inc(size, direction="download")
+                    events.on_chunk(state, offset, size)
+                elif kind == "start":
+                    events.on_range_start(state)
+                else:
+                    pending -= 1
+                    success, error, task_changed = message[2], message[3], message[4]
+                    if success:
+                        index = tasks[task_id][0]
+                        remaining[index] -= 1
+                        if remaining[index] == 0:
+                            tracker.finish(index)
+                        events.on_range_done(state, True)
+                        continue
+                    failed += 1
+                    changed = changed or task_changed
+                    logger.warning(
+                        f"Range {state.range_start}-{state.range_end} failed: {error}"
+                    )
+                    events.on_range_done(state, False, RuntimeError(error))
+            if not failed:
+                for process in processes:
+                    process.join()
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            task_queue.close()
+            results.close()
+        return failed, changed
+
+
+def download(
+    url: str,
+    filepath: str,
+    overwrite: bool = False,
+    worker_num: int = 4,
+    block_size: int = 100,
+    prefix: str = "",
+    max_retries: int = 3,
+    preallocate: Optional[str] = None,
+    checksum=None,
+    *args,
+    **kwargs,
+) -> bool:
+    """多进程下载文件
+
+    Args:
+        url: 下载链接
+        filepath: 保存路径
+        overwrite: 是否覆盖已存在的文件
+        worker_num: 子进程数
+        block_size: 块大小(MB)
+        prefix: 进度条前缀
+        max_retries: 最大重试次数
+        preallocate: 预分配策略, fallocate/sparse/none, 默认取 DownloadConfig.preallocate
+        checksum: 期望的校验值, 如 "sha256:<hex>", 为空时使用响应头中的校验值
+
+    Returns:
+        bool: 下载是否成功
+    """
+    try:
+        downloader = ProcessMultiDownloader(
+            url=url,
+            filepath=filepath,
+            overwrite=overwrite,
+            block_size=block_size,
+            *args,
+            **kwargs,
+        )
+        return downloader.download(
+            worker_num=worker_num,
+            prefix=prefix,
+            max_retries=max_retries,
+            preallocate=preallocate,
+            checksum=checksum,
+        )
+    except Exception as e:
+        logger.error(f"Multi-process download failed: {e}")
+        return False
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from threading import Event, Lock, Thread, local
+from typing import List, Optional
+
+from funfile.compress.utils import file_tqdm_bar
+from funlog import getLogger
+
+from ..config import get_config
+
+logger = getLogger("funget")
+
+
+class ProgressCounter:
+    """按线程分片的计数器
+
+    每个线程只累加自己的分片, 写入时不加锁; 读取时把所有分片求和。
+    分片只在线程第一次计数时登记一次。
+    """
+
+    def __init__(self):
+        self._local = local()
+        self._slots: List[List[int]] = []
+        self._lock = Lock()
+
+    def add(self, value: int):
+        slot = getattr(self._local, "slot", None)
+        if slot is None:
+            slot = self._local.slot = [0]
+            with self._lock:
+                self._slots.append(slot)
+        slot[0] += value
+
+    @property
+    def value(self) -> int:
+        return sum(slot[0] for slot in list(self._slots))
+
+
+class ProgressRenderer:
+    """以固定帧率绘制进度条
+
+    Worker 只更新各自的计数分片, 由一个绘制线程按 fps 汇总后更新 tqdm,
+    下载线程不再争用 tqdm 的锁, 也不会每个数据块都重绘一次终端。
+    FungetConfig.progress_bar 为假时不创建进度条和绘制线程, 只保留计数。
+
+    Example:
+        with ProgressRenderer(path, total) as progress:
+            progress.update(size)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        total: int,
+        prefix: str = "",
+        fps: float = 5.0,
+        enabled: Optional[bool] = None,
+    ):
+        """
+        :param path: 下载的文件路径, 用于进度条的描述
+        :param total: 总字节数
+        :param prefix: 描述前缀
+        :param fps: 每秒绘制的次数
+        :param enabled: 是否显示进度条, 为空时取 FungetConfig.progress_bar
+        """
+        self.counter = ProgressCounter()
+        self.interval = 1.0 / fps
+        enabled = get_config().progress_bar if enabled is None else enabled
+        self._bar = (
+            file_tqdm_bar(path=path, total=total, prefix=prefix) if enabled else None
+        )
+        self._description: Optional[str] = None
+        self._rendered_description: Optional[str] = None
+        self._rendered = 0
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._bar is not None
+
+    @property
+    def value(self) -> int:
+        """已完成的字节数"""
+        return self.counter.value
+
+    def update(self, size: int):
+        self.counter.add(size)
+
+    def set_description(self, description: str):
+        """设置描述, 在下一帧绘制"""
+        self._description = description
+
+    def render(self):
+        """把计数和描述同步到进度条"""
+        if self._bar is None:
+            return
+        try:
+            description = self._description
+            if description is not None and description != self._rendered_description:
+                self._bar.set_description(description, refresh=False)
+                self._rendered_description = description
+            value = self.counter.value
+            if value != self._rendered:
+                self._bar.update(value - self._rendered)
+                self._rendered = value
+            self._bar.refresh()
+        except Exception as e:
+            logger.warning(f"Progress bar update failed: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.render()
+
+    def start(self) -> "ProgressRenderer":
+        if self._bar is not None and self._thread is None:
+            self._thread = Thread(target=self._run, name="funget-progress", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """停止绘制线程, 绘制最后一帧后关闭进度条"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._bar is not None:
+            self.render()
+            self._bar.close()
+            self._bar = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+import io
+from collections import OrderedDict
+from threading import Condition
+from typing import Any, Dict, List, Optional
+
+from funlog import getLogger
+
+from .events import DownloadEvents
+from .pool import SessionPool
+from .probe import RemoteInfo
+from .stream import _Block
+from .work import Worker, WorkerFactory
+
+logger = getLogger("funget")
+
+
+class _FetchEvents(DownloadEvents):
+    """范围请求结束时把数据放入缓存, 或记录失败"""
+
+    def __init__(self, remote: "RemoteFile"):
+        self.remote = remote
+
+    def on_range_done(self, worker, success: bool, error=None):
+        if worker.cancelled:
+            return
+        self.remote._done(worker.fileobj, success, error)
+
+
+class RemoteFile(io.RawIOBase):
+    """可随机读取的只读远端文件
+
+    文件按 block_size 对齐分块, 读到的块放入容量为 cache_blocks 的 LRU 缓存。一次读取缺少的块
+    按连续区间合并为范围请求, 每个请求最多 max_fetch_blocks 块, 由 WorkerFactory 并发下载;
+    连续顺序读取时额外预读后面的 readahead 块。zipfile、tarfile 或列式存储的读取器
+    只需读取其中的几 MB, 不必下载整个文件。缓存命中情况见 stats()。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        block_size: int = 256 * 1024,
+        cache_blocks: int = 64,
+        readahead: int = 4,
+        max_fetch_blocks: int = 16,
+        worker_num: int = 8,
+        headers: Optional[Dict[str, str]] = None,
+        max_retries: int = 3,
+        timeout: int = 30,
+        pool: Optional[SessionPool] = None,
+        info: Optional[RemoteInfo] = None,
+    ):
+        """
+        :param url: 下载地址, 服务器须支持范围请求
+        :param block_size: 缓存块大小(字节)
+        :param cache_blocks: 最多缓存的块数
+        :param readahead: 顺序读取时预读的块数, 0 表示不预读
+        :param max_fetch_blocks: 一个范围请求最多包含的块数
+        :param worker_num: 并发请求数
+        :param headers: 额外的请求头
+        :param max_retries: 每个范围的最大重试次数
+        :param timeout: 探测请求的超时时间(秒)
+        :param pool: 共享的连接池, 为空时自建
+        :param info: 已有的探测结果, 传入时不再探测
+        """
+        super(RemoteFile, self).__init__()
+        self.url = url
+        self.block_size = max(1, block_size)
+        self.cache_blocks = max(2, cache_blocks)
+        # 预读的块和正在读取的块一起不能超过缓存容量
+        self.readahead = min(max(0, readahead), self.cache_blocks // 2)
+        self.max_fetch_blocks = max(1, max_fetch_blocks)
+        self.headers = headers or {}
+        self.max_retries = max_retries
+        self.position = 0
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.fetched_bytes = 0
+        self.evictions = 0
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+        # 正在请求的块序号 -> 所在的范围缓冲
+        self._inflight: Dict[int, _Block] = {}
+        self._errors: Dict[int, BaseException] = {}
+        self._ready = Condition()
+        # 上一次读取结束的位置, 本次从这里开始视为顺序读取
+        self._last_end = 0
+        self._factory: Optional[WorkerFactory] = None
+        self._own_pool = pool is None
+        self._pool = (pool or SessionPool(max_retries=max_retries)).ensure_size(
+            worker_num
+        )
+        try:
+            self.info = info or RemoteInfo.probe(
+                url, session=self._pool.session, headers=self.headers, timeout=timeout
+            )
+            if not self.info.complete and not (
+                self.info.accept_ranges and self.info.size > 0
+            ):
+                raise IOError(
+                    f"{url} does not support range requests, cannot read randomly"
+                )
+        except BaseException:
+            self.close()
+            raise
+        self.size = self.info.size
+        # 探测时收到的开头直接放入缓存
+        head = self.info.head
+        for index in range(len(head) // self.block_size + 1):
+            start = index * self.block_size
+            end = min(start + self.block_size, self.size)
+            if start < end <= len(head):
+                self._cache[index] = head[start:end]
+        if not self.info.complete:
+            self._factory = WorkerFactory(
+                worker_num=worker_num,
+                capacity=max(worker_num, self.cache_blocks),
+                steal=False,
+                hedge=False,
+                events=_FetchEvents(self),
+            )
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self.position = position
+        return position
+
+    def _fetch(self, indexes: List[int]):
+        """请求尚未缓存、也不在请求中的块, 连续的块合并为一个范围请求, 调用方需持有锁"""
+        missing = [
+            index
+            for index in sorted(set(indexes))
+            if index not in self._cache and index not in self._inflight
+        ]
+        runs: List[List[int]] = []
+        for index in missing:
+            if (
+                runs
+                and index == runs[-1][-1] + 1
+                and len(runs[-1]) < self.max_fetch_blocks
+            ):
+                runs[-1].append(index)
+            else:
+                runs.append([index])
+        for run in runs:
+            start = run[0] * self.block_size
+            end = min((run[-1] + 1) * self.block_size, self.size) - 1
+            block = _Block(start, end, self._ready).open()
+            for index in run:
+                self._inflight[index] = block
+                self._errors.pop(index, None)
+            self.fetches += 1
+            self._factory.submit(
+                Worker(
+                    url=self.info.final_url,
+                    range_start=start,
+                    range_end=end,
+                    fileobj=block,
+                    headers=self.headers,
+                    chunk_size=min(end - start + 1, 1024 * 1024),
+                    max_retries=self.max_retries,
+                    session=self._pool.session,
+                    if_range=self.info.if_range,
+                )
+            )
+
+    def _done(self, block: _Block, success: bool, error: Optional[BaseException]):
+        """范围请求结束: 成功时按块放入缓存并淘汰最久未用的块"""
+        with self._ready:
+            indexes = [index for index, item in self._inflight.items() if item is block]
+            for index in indexes:
+                del self._inflight[index]
+                if not success:
+                    self._errors[index] = error or IOError(
+                        f"Failed to fetch {block.start}-{block.end} of {self.url}"
+                    )
+                    continue
+                start = index * self.block_size - block.start
+                self._cache[index] = bytes(
+                    block.buffer[start : start + self.block_size]
+                )
+                self._cache.move_to_end(index)
+            if success:
+                self.fetched_bytes += len(block.buffer)
+            while len(self._cache) > self.cache_blocks:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+            block.close()
+            self._ready.notify_all()
+
+    def _block(self, index: int) -> bytes:
+        """取得一个块, 不在缓存中时请求并等待, 调用方需持有锁"""
+        while True:
+            data = self._cache.get(index)
+            if data is not None:
+                self._cache.move_to_end(index)
+                return data
+            if index in self._errors:
+                raise IOError(f"Failed to read {self.url}: {self._errors.pop(index)}")
+            if index not in self._inflight:
+                self._fetch([index])
+            self._ready.wait(timeout=1.0)
+
+    def readinto(self, buffer) -> int:
+        """从当前位置读取, 尽量填满 buffer, 返回读到的字节数, 0 表示已到文件末尾"""
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        view = memoryview(buffer).cast("B")
+        end = min(self.position + len(view), self.size)
+        if end <= self.position:
+            return 0
+        first = self.position // self.block_size
+        last = (end - 1) // self.block_size
+        # 一次最多请求缓存容量一半的块, 避免还没读到就被淘汰
+        window = max(1, self.cache_blocks // 2)
+        sequential = self._last_end == self.position
+        written = 0
+        with self._ready:
+            # 按块统计: 读取开始时已在缓存中的为命中, 否则为未命中
+            cached = sum(1 for index in range(first, last + 1) if index in self._cache)
+            self.hits += cached
+            self.misses += last - first + 1 - cached
+            for index in range(first, last + 1):
+                if (index - first) % window == 0:
+                    stop = min(last, index + window - 1)
+                    upcoming = list(range(index, stop + 1))
+                    if sequential and stop == last:
+                        # 顺序读取时预读后面的块
+                        blocks = (self.size + self.block_size - 1) // self.block_size
+                        upcoming += range(
+                            last + 1, min(last + 1 + self.readahead, blocks)
+                        )
+                    self._fetch(upcoming)
+                data = self._block(index)
+                offset = self.position + written - index * self.block_size
+                size = min(len(data) - offset, end - self.position - written)
+                view[written : written + size] = data[offset : offset + size]
+                written += size
+        self.position += written
+        self._last_end = self.position
+        return written
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中/未命中次数、范围请求数、下载字节数、淘汰块数和当前缓存块数"""
+        with self._ready:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "fetches": self.fetches,
+                "fetched_bytes": self.fetched_bytes,
+                "evictions": self.evictions,
+                "cached_blocks": len(self._cache),
+            }
+
+    def close(self):
+        """停止进行中的请求并释放缓存"""
+        if self.closed:
+            return
+        if self._factory is not None:
+            self._factory.cancel()
+            self._factory.close()
+        self._cache.clear()
+        self._inflight.clear()
+        if self._own_pool:
+            self._pool.session.close()
+        super(RemoteFile, self).close()
+
+    def __repr__(self):
+        return f"RemoteFile({self.url!r}, size={getattr(self, 'size', 0)})"
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import os
+import os.path
+import shutil
+import tempfile
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+from funlog import getLogger
+
+from .extract import _ZipStream
+from .multi import _RangeProgress
+from .pool import SessionPool
+from .progress import ProgressRenderer
+from .remote import RemoteFile
+from .sink import FileSink
+from .work import Worker, WorkerFactory
+
+logger = getLogger("funget")
+
+
+class _MemberSink(FileSink):
+    """把远端文件中从 base 开始的范围写入临时文件的开头"""
+
+    def __init__(self, filepath: str, base: int, size: int):
+        super(_MemberSink, self).__init__(filepath, size)
+        self.base = base
+
+    def _write(self, chunk, offset: int) -> int:
+        return super(_MemberSink, self)._write(chunk, offset - self.base)
+
+
+def read_zip_directory(
+    remote: RemoteFile,
+) -> Tuple[Dict[str, zipfile.ZipInfo], Dict[str, Tuple[int, int]]]:
+    """通过范围请求读取 zip 末尾的中央目录, 计算每个条目在文件中的范围
+
+    条目的本地文件头、压缩数据和数据描述符紧挨在一起, 一直延续到下一个条目或中央目录之前,
+    本地文件头中的扩展字段长度可能与中央目录不同, 因此以下一个条目的起始位置作为结束位置。
+
+    Args:
+        remote: 远端 zip 文件
+
+    Returns:
+        Tuple[Dict[str, ZipInfo], Dict[str, Tuple[int, int]]]: 各条目的信息和 (起始位置, 结束位置)
+    """
+    with zipfile.ZipFile(remote) as archive:
+        infos = {info.filename: info for info in archive.infolist()}
+        start_dir = archive.start_dir
+    offsets = sorted({info.header_offset for info in infos.values()} | {start_dir})
+    following = {offset: offsets[i + 1] for i, offset in enumerate(offsets[:-1])}
+    ranges = {
+        name: (info.header_offset, following[info.header_offset] - 1)
+        for name, info in infos.items()
+    }
+    return infos, ranges
+
+
+def download_zip_members(
+    url: str,
+    members: List[str],
+    directory: str = ".",
+    worker_num: int = 8,
+    chunk_size: int = 1024 * 1024,
+    headers: Optional[Dict[str, str]] = None,
+    max_retries: int = 3,
+    prefix: str = "",
+) -> bool:
+    """只下载远端 zip 中指定的成员并在本地解压
+
+    先用范围请求读取文件末尾的中央目录, 再并行请求各成员的本地文件头和压缩数据,
+    大的成员由空闲线程拆分为多个范围; 数据暂存在目标目录下的临时文件中, 下载完成后解压到
+    directory, 保留成员在压缩包中的路径。支持 stored 和 deflate 两种压缩方式。
+
+    Args:
+        url: zip 文件地址, 服务器须支持范围请求
+        members: 要解出的成员名称, 与 ZipFile.namelist() 中的名称一致
+        directory: 解压目录
+        worker_num: 并发请求数
+        chunk_size: 每次读取的字节数
+        headers: 额外的请求头
+        max_retries: 最大重试次数
+        prefix: 进度条前缀
+
+    Returns:
+        bool: 所有成员是否都已解出
+    """
+    pool = SessionPool(max_retries=max_retries).ensure_size(worker_num)
+    workspace = None
+    try:
+        with RemoteFile(
+            url, block_size=64 * 1024, readahead=0, headers=headers, pool=pool
+        ) as remote:
+            infos, ranges = read_zip_directory(remote)
+            info = remote.info
+        missing = [name for name in members if name not in infos]
+        if missing:
+            logger.error(f"Members not found in {url}: {missing}")
+            return False
+        members = list(dict.fromkeys(members))
+        total = sum(ranges[name][1] - ranges[name][0] + 1 for name in members)
+        logger.info(
+            f"Fetching {len(members)} of {len(infos)} members from {url}: "
+            f"{total:,} of {info.size:,} bytes"
+        )
+
+        os.makedirs(directory, exist_ok=True)
+        workspace = tempfile.mkdtemp(prefix=".funget-zip-", dir=directory)
+        progress = ProgressRenderer(
+            path=url, total=total, prefix=f"{prefix}|0/{len(members)}|"
+        ).start()
+        tracker = _RangeProgress(
+            progress, f"{prefix}|{{}}/{len(members)}|{os.path.basename(url)}"
+        )
+        sinks = {}
+        try:
+            with WorkerFactory(worker_num=worker_num, events=tracker) as factory:
+                for index, name in enumerate(members):
+                    start, end = ranges[name]
+                    sink = _MemberSink(
+                        os.path.join(workspace, str(index)), start, end - start + 1
+                    ).open()
+                    sinks[name] = sink
+                    worker = Worker(
+                        url=info.final_url,
+                        range_start=start,
+                        range_end=end,
+                        fileobj=sink,
+                        headers=headers,
+                        chunk_size=chunk_size,
+                        max_retries=max_retries,
+                        session=pool.session,
+                        if_range=info.if_range,
+                    )
+                    tracker.indexes[id(worker)] = index
+                    factory.submit(worker)
+                factory.wait_for_all_done()
+                failed_tasks = factory.get_failed_tasks()
+                if failed_tasks:
+                    logger.warning(f"Retrying {len(failed_tasks)} failed tasks")
+                    factory.retry_failed_tasks()
+            if factory.get_failed_tasks():
+                return False
+        finally:
+            progress.close()
+            for sink in sinks.values():
+                sink.close()
+
+        for index, name in enumerate(members):
+            with open(os.path.join(workspace, str(index)), "rb") as fr:
+                _ZipStream(fr, chunk_size).extract_entry(
+                    directory, compressed_size=infos[name].compress_size
+                )
+        logger.info(f"Extracted {len(members)} members from {url} to {directory}")
+        return True
+    except Exception as e:
+        logger.error(f"Zip member download failed: {e}")
+        return False
+    finally:
+        if workspace is not None:
+            shutil.rmtree(workspace, ignore_errors=True)
+        pool.close()
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 import os
+import time
 
 import requests
-from funfile.compress.utils import file_tqdm_bar
 from nltlog import getLogger
 
+from ..metrics import BYTES, REQUEST_DURATION, TIME_TO_FIRST_BYTE
 from .core import Downloader
+from .events import RangeState, emits_complete
+from .progress import ProgressRenderer
 
 logger = getLogger("funget")
 
@@ -16,25 +19,32 @@ class SingleDownloader(Downloader):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+    @emits_complete
     def download(
-        self, prefix: str = "", chunk_size: int = 2048, *args, **kwargs
+        self,
+        prefix: str = "",
+        chunk_size: int = 2048,
+        checksum=None,
+        verify: bool = True,
+        *args,
+        **kwargs,
     ) -> bool:
-        """执行单线程下载"""
+        """执行单线程下载
+
+        checksum 为期望的校验值, 如 "sha256:<hex>"; 未给出且 verify 为真时使用响应头中的校验值。
+        校验值在写入时计算, 不一致时删除文件并返回 False。
+        """
         try:
             prefix = f"{prefix}--" if prefix else ""
 
             # 确保目录存在
-            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
-
-            # 检查文件是否已存在且完整
-            if (
-                not self.overwrite
-                and os.path.exists(self.filepath)
-                and os.path.getsize(self.filepath) == self.filesize
-            ):
-                logger.info(
-                    f"File {self.filepath} already exists with correct size, skipping download."
-                )
+            os.makedirs(os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True)
+
+            # 检查本地文件是否已是最新版本
+            if self.is_up_to_date():
+                logger.info(f"File {self.filepath} is up to date, skipping download.")
+                return True
+            if self._restore_from_cache():
                 return True
 
             # 验证 URL
@@ -47,45 +57,114 @@ class SingleDownloader(Downloader):
                 logger.warning("File size is 0 or unknown, proceeding with download")
 
             pbar = None
+            info = self.info
+            # 顺序写入, 校验值不需要读回数据
+            digest = self._create_digest(checksum, verify)
             try:
+                # 探测时已经取得完整内容, 不再发送请求
+                if info is not None and info.complete:
+                    with open(self.filepath, "wb") as file:
+                        file.write(info.head)
+                    if digest is not None:
+                        digest.update(info.head, 0)
+                    if not self._verify_digest(digest):
+                        self._discard_corrupted()
+                        return False
+                    self._save_metadata()
+                    self._save_to_cache()
+                    return True
+
+                # 支持范围请求时从探测收到的数据之后继续下载
+                offset = 0
+                headers = dict(self.headers)
+                if (
+                    info is not None
+                    and info.accept_ranges
+                    and info.head
+                    and info.size == self.filesize
+                ):
+                    offset = len(info.head)
+                    headers["Range"] = f"bytes={offset}-"
+                    if info.if_range:
+                        headers["If-Range"] = info.if_range
+
                 # 执行下载
+                started = time.monotonic()
                 resp = self._session.get(
-                    self.url,
+                    self.request_url,
                     stream=True,
-                    headers=self.headers,
+                    headers=headers,
                     timeout=self.timeout,
                     auth=self.auth,
                 )
                 resp.raise_for_status()
+                if resp.status_code != 206:
+                    # 服务器返回了完整内容
+                    offset = 0
 
                 # 验证响应
                 content_length = resp.headers.get("content-length")
-                if content_length and int(content_length) != self.filesize:
+                if content_length and int(content_length) + offset != self.filesize:
                     logger.warning(
-                        f"Content-Length mismatch: expected {self.filesize}, got {content_length}"
+                        f"Content-Length mismatch: expected {self.filesize - offset}, got {content_length}"
                     )
 
+                events = self.events
+                state = None
+                if events is not None:
+                    state = RangeState(offset, self.filesize - 1, self)
+                    events.on_range_start(state)
+
                 with open(self.filepath, "wb") as file:
-                    pbar = file_tqdm_bar(
+                    pbar = ProgressRenderer(
                         path=self.filepath,
                         total=self.filesize or int(content_length or 0),
                         prefix=f"{prefix}",
-                    )
+                    ).start()
 
                     downloaded_bytes = 0
+                    first_byte = True
+                    if offset:
+                        downloaded_bytes = file.write(info.head)
+                        if digest is not None:
+                            digest.update(info.head, 0)
+                        pbar.update(downloaded_bytes)
                     for data in resp.iter_content(chunk_size=chunk_size):
                         if data:  # 过滤空块
+                            if first_byte:
+                                first_byte = False
+                                TIME_TO_FIRST_BYTE.observe(
+                                    time.monotonic() - started, direction="download"
+                                )
                             bytes_written = file.write(data)
+                            BYTES.inc(bytes_written, direction="download")
+                            if digest is not None:
+                                digest.update(data, downloaded_bytes)
+                            if state is not None:
+                                state.downloaded += bytes_written
+                                events.on_chunk(state, downloaded_bytes, bytes_written)
                             downloaded_bytes += bytes_written
                             pbar.update(bytes_written)
 
+                REQUEST_DURATION.observe(
+                    time.monotonic() - started, direction="download"
+                )
+                self._pool.record_metrics()
+                if state is not None:
+                    events.on_range_done(state, True)
+
                 # 验证下载完整性
                 if self.filesize > 0 and downloaded_bytes != self.filesize:
                     logger.error(
                         f"Download incomplete: expected {self.filesize} bytes, got {downloaded_bytes} bytes"
                     )
                     return False
+                if not self._verify_digest(digest):
+                    self._discard_corrupted()
+                    return False
 
+                self._save_metadata()
+                self._save_to_cache()
                 return True
 
             except requests.exceptions.RequestException as e:
@@ -109,6 +188,7 @@ def download(
     overwrite: bool = False,
     prefix: str = "",
     chunk_size: int = 2048,
+    checksum=None,
     *args,
     **kwargs,
 ) -> bool:
@@ -120,6 +200,7 @@ def download(
         overwrite: 是否覆盖已存在的文件
         prefix: 进度条前缀
         chunk_size: 数据块大小(字节)
+        checksum: 期望的校验值, 如 "sha256:<hex>", 为空时使用响应头中的校验值
 
     Returns:
         bool: 下载是否成功
@@ -129,7 +210,7 @@ def download(
             url=url, filepath=filepath, overwrite=overwrite, *args, **kwargs
         )
         return downloader.download(
-            prefix=prefix, chunk_size=chunk_size, *args, **kwargs
+            prefix=prefix, chunk_size=chunk_size, checksum=checksum, *args, **kwargs
         )
     except Exception as e:
         logger.error(f"Single-threaded download failed: {e}")
@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+import errno
+import mmap
+import os
+import shutil
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Union
+
+from funlog import getLogger
+
+from .digest import StreamDigest
+from .journal import DownloadJournal
+
+logger = getLogger("funget")
+
+
+PREALLOCATE_STRATEGIES = ("fallocate", "sparse", "none")
+
+
+class DiskSpaceError(OSError):
+    """磁盘剩余空间不足以容纳要下载的文件"""
+
+    pass
+
+
+def check_disk_space(filepath: str, required: int):
+    """确认目标文件所在磁盘至少还有 required 字节可用, 否则抛出 DiskSpaceError"""
+    if required <= 0:
+        return
+    directory = os.path.dirname(os.path.abspath(filepath))
+    free = shutil.disk_usage(directory).free
+    if free < required:
+        raise DiskSpaceError(
+            errno.ENOSPC,
+            f"Not enough disk space for {filepath}: "
+            f"need {required:,} bytes, {free:,} bytes available",
+        )
+
+
+def preallocate(fd: int, size: int, strategy: str = "fallocate"):
+    """按策略为文件预留最终大小
+
+    Args:
+        fd: 已打开的文件描述符
+        size: 文件最终大小
+        strategy: fallocate 通过 posix_fallocate 实际分配磁盘块, 避免多线程分散写入造成碎片,
+            文件系统不支持时退化为 sparse; sparse 通过 ftruncate 设置文件大小, 生成稀疏文件;
+            none 不做任何处理
+    """
+    if strategy not in PREALLOCATE_STRATEGIES:
+        raise ValueError(
+            f"Unknown preallocate strategy: {strategy}, "
+            f"expected one of {PREALLOCATE_STRATEGIES}"
+        )
+    if strategy == "none" or size <= 0:
+        return
+    if strategy == "fallocate" and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise DiskSpaceError(
+                    errno.ENOSPC, f"Not enough disk space to allocate {size:,} bytes"
+                ) from e
+            if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP, errno.ENOSYS):
+                raise
+            logger.debug(f"posix_fallocate not supported ({e}), using ftruncate")
+    if os.fstat(fd).st_size < size:
+        os.ftruncate(fd, size)
+
+
+def _pwrite(fd: int, data, offset: int) -> int:
+    """按偏移写入全部数据, 处理部分写入的情况"""
+    view = memoryview(data)
+    written = 0
+    while written < len(view):
+        written += os.pwrite(fd, view[written:], offset + written)
+    return written
+
+
+class Sink:
+    """下载数据的写入目标
+
+    Worker 通过 ``write(chunk, offset)`` 按偏移写入, 多个线程可以同时写入不同的区间。
+    基类负责记录已写入的区间, 传入续传日志时按字节数和时间批量保存到日志中;
+    子类只需实现 ``_open``/``_write``/``_close``, 能读回已写入数据的子类实现 ``read``
+    并将 readable 设为 True。设置 digest 后写入的数据同时用于计算校验值;
+    续传日志带有分块校验值时写入的同时按块计算, 续传打开时先并行校验已写入的块。
+    """
+
+    readable = False
+
+    def __init__(
+        self,
+        journal: Optional[DownloadJournal] = None,
+        flush_size: int = 16 * 1024 * 1024,
+        flush_interval: float = 1.0,
+    ):
+        """
+        :param journal: 续传日志, 为空时不记录续传信息
+        :param flush_size: 累计写入多少字节后保存一次日志
+        :param flush_interval: 距上次保存超过多少秒后保存一次日志
+        """
+        self.journal = journal
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.closed = True
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        # 已写入的区间, 以结束位置为键、起始位置为值, 顺序写入时可以 O(1) 延长
+        self._segments: Dict[int, int] = {}
+        self._unflushed = 0
+        self._flushed_at = time.monotonic()
+        # 边写入边计算的校验值
+        self.digest: Optional[StreamDigest] = None
+
+    @property
+    def written(self) -> List[List[int]]:
+        """已写入的区间列表, 每项为左闭右开的 [start, end], 已排序合并"""
+        with self._lock:
+            segments = sorted([start, end] for end, start in self._segments.items())
+        merged: List[List[int]] = []
+        for start, end in segments:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def _open(self, resume: bool):
+        raise NotImplementedError("Subclasses must implement _open method")
+
+    def _write(self, chunk, offset: int) -> int:
+        raise NotImplementedError("Subclasses must implement _write method")
+
+    def _close(self):
+        pass
+
+    def _sync(self):
+        """把已写入的数据刷到磁盘, 落盘的子类需要实现"""
+        pass
+
+    def read(self, offset: int, size: int) -> bytes:
+        """读回已写入的数据"""
+        raise NotImplementedError(f"{self} does not support reading")
+
+    def open(self) -> "Sink":
+        """打开写入目标, 续传日志中有已写入的区间时保留已有内容"""
+        resume = self._can_resume()
+        manifest = self.journal.manifest if self.journal is not None else None
+        if manifest is not None and self.readable:
+            manifest.reader = self.read
+        self._open(resume)
+        if resume:
+            done = self.journal.done
+            if manifest is not None and self.readable:
+                # 只保留校验通过的块, 损坏或未写满的块重新下载
+                done = manifest.verify(self.read, done)
+            for start, end in done:
+                self._segments[end] = start
+        self.closed = False
+        if self.journal is not None:
+            self.flush()
+        return self
+
+    def _can_resume(self) -> bool:
+        return bool(self.journal and self.journal.done)
+
+    def write(self, chunk, offset: int) -> int:
+        """将数据写入指定偏移, 返回写入的字节数"""
+        if self.closed:
+            raise ValueError(f"write to closed sink: {self}")
+        size = self._write(chunk, offset)
+        if self.digest is not None or self.journal is not None:
+            data = chunk if size == len(chunk) else chunk[:size]
+            self._hash(data, offset)
+        self._account(offset, size)
+        return size
+
+    def record(self, offset: int, size: int) -> int:
+        """登记其他进程已经直接写入的区间, 需要计算校验值时读回这部分数据
+
+        Returns:
+            int: 登记的字节数
+        """
+        if self.closed:
+            raise ValueError(f"record to closed sink: {self}")
+        manifest = self.journal.manifest if self.journal is not None else None
+        if self.digest is not None or manifest is not None:
+            self._hash(self.read(offset, size), offset)
+        self._account(offset, size)
+        return size
+
+    def _hash(self, data, offset: int):
+        if self.digest is not None:
+            self.digest.update(data, offset)
+        if self.journal is not None and self.journal.manifest is not None:
+            self.journal.manifest.update(data, offset)
+
+    def _account(self, offset: int, size: int):
+        """记录已写入的区间, 累计到一定字节数或时间后保存续传日志"""
+        with self._lock:
+            start = self._segments.pop(offset, offset)
+            self._segments[offset + size] = start
+            self._unflushed += size
+            now = time.monotonic()
+            need_flush = self.journal is not None and (
+                self._unflushed >= self.flush_size
+                or now - self._flushed_at >= self.flush_interval
+            )
+            if need_flush:
+                self._unflushed = 0
+                self._flushed_at = now
+        if need_flush:
+            self.flush()
+
+    def flush(self):
+        """把已写入的区间保存到续传日志
+
+        先取得已写入的区间再把数据刷到磁盘, 最后写日志, 断电后日志记录的区间一定已经落盘。
+        """
+        if self.journal is None:
+            return
+        try:
+            with self._flush_lock:
+                done = self.written
+                self._sync()
+                self.journal.done = done
+                self.journal.save()
+        except Exception as e:
+            logger.warning(f"Failed to save journal: {e}")
+
+    def close(self, complete: bool = True):
+        """关闭写入目标, 下载完成时删除续传日志, 否则保存续传日志"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.journal is not None and not complete:
+            # 关闭前保存, 保存时需要刷写数据
+            self.flush()
+        self._close()
+        if self.journal is not None and complete:
+            self.journal.remove()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(complete=exc_type is None)
+        return False
+
+
+class FileSink(Sink):
+    """通过 os.pwrite 并发写入文件
+
+    各线程直接按偏移写入同一个文件描述符, 不加锁、不经过队列和后台线程,
+    写入返回即表示数据已交给内核。不支持 pwrite 的平台退化为加锁的 seek + write。
+    已知文件大小时, 打开后先检查磁盘空间并按 preallocate 策略预留空间。
+    """
+
+    readable = True
+
+    def __init__(
+        self,
+        filepath: str,
+        size: int = 0,
+        preallocate: str = "none",
+        *args,
+        **kwargs,
+    ):
+        """
+        :param filepath: 文件路径
+        :param size: 文件最终大小, 未知时为 0
+        :param preallocate: 预分配策略, fallocate/sparse/none
+        """
+        super(FileSink, self).__init__(*args, **kwargs)
+        if preallocate not in PREALLOCATE_STRATEGIES:
+            raise ValueError(
+                f"Unknown preallocate strategy: {preallocate}, "
+                f"expected one of {PREALLOCATE_STRATEGIES}"
+            )
+        self.filepath = filepath
+        self.size = max(0, size)
+        self.preallocate = preallocate
+        self._fd = None
+        self._seek_lock = Lock()
+
+    def _can_resume(self) -> bool:
+        return super()._can_resume() and os.path.exists(self.filepath)
+
+    def _open(self, resume: bool):
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if not resume:
+            flags |= os.O_TRUNC
+        self._fd = os.open(self.filepath, flags, 0o644)
+        try:
+            self._reserve()
+        except BaseException:
+            os.close(self._fd)
+            self._fd = None
+            if not resume:
+                os.remove(self.filepath)
+            raise
+
+    def _reserve(self):
+        """检查磁盘空间并预留文件大小, 空间不足时在下载开始前失败"""
+        if self.preallocate == "none" or self.size <= 0:
+            return
+        stat = os.fstat(self._fd)
+        # 续传时已分配的磁盘块不需要重复计算
+        allocated = getattr(stat, "st_blocks", 0) * 512 or stat.st_size
+        check_disk_space(self.filepath, self.size - allocated)
+        preallocate(self._fd, self.size, self.preallocate)
+
+    def _write(self, chunk, offset: int) -> int:
+        if hasattr(os, "pwrite"):
+            return _pwrite(self._fd, chunk, offset)
+        with self._seek_lock:
+            os.lseek(self._fd, offset, os.SEEK_SET)
+            return os.write(self._fd, chunk)
+
+    def read(self, offset: int, size: int) -> bytes:
+        if hasattr(os, "pread"):
+            return os.pread(self._fd, size, offset)
+        with self._seek_lock:
+            os.lseek(self._fd, offset, os.SEEK_SET)
+            return os.read(self._fd, size)
+
+    def _sync(self):
+        if hasattr(os, "fdatasync"):
+            os.fdatasync(self._fd)
+        else:
+            os.fsync(self._fd)
+
+    def _close(self):
+        os.close(self._fd)
+        self._fd = None
+
+    def __repr__(self):
+        return f"FileSink({self.filepath!r})"
+
+
+class MmapSink(FileSink):
+    """通过内存映射写入文件
+
+    打开时把文件扩展到最终大小并整体映射, 写入只是一次内存拷贝, 由内核负责回写。
+    需要事先知道文件大小。
+    """
+
+    def __init__(self, filepath: str, size: int, *args, **kwargs):
+        if size <= 0:
+            raise ValueError(f"MmapSink requires a positive size, got {size}")
+        super(MmapSink, self).__init__(filepath, size, *args, **kwargs)
+        self._mmap: Optional[mmap.mmap] = None
+
+    def _open(self, resume: bool):
+        super(MmapSink, self)._open(resume)
+        os.ftruncate(self._fd, self.size)
+        self._mmap = mmap.mmap(self._fd, self.size)
+
+    def _write(self, chunk, offset: int) -> int:
+        size = len(chunk)
+        self._mmap[offset : offset + size] = chunk
+        return size
+
+    def read(self, offset: int, size: int) -> bytes:
+        return self._mmap[offset : offset + size]
+
+    def _sync(self):
+        self._mmap.flush()
+
+    def _close(self):
+        self._mmap.flush()
+        self._mmap.close()
+        self._mmap = None
+        super(MmapSink, self)._close()
+
+    def __repr__(self):
+        return f"MmapSink({self.filepath!r})"
+
+
+class MemorySink(Sink):
+    """写入内存缓冲区, 适合小文件, 下载完成后通过 getvalue()/getbuffer() 取得数据"""
+
+    readable = True
+
+    def __init__(self, size: int = 0, *args, **kwargs):
+        super(MemorySink, self).__init__(*args, **kwargs)
+        self.size = max(0, size)
+        self._buffer = bytearray()
+        self._resize_lock = Lock()
+
+    def _open(self, resume: bool):
+        self._buffer = bytearray(self.size)
+
+    def _write(self, chunk, offset: int) -> int:
+        size = len(chunk)
+        if offset + size > len(self._buffer):
+            # 大小未知时按需扩容
+            with self._resize_lock:
+                if offset + size > len(self._buffer):
+                    self._buffer.extend(bytes(offset + size - len(self._buffer)))
+        self._buffer[offset : offset + size] = chunk
+        return size
+
+    def read(self, offset: int, size: int) -> bytes:
+        return bytes(self._buffer[offset : offset + size])
+
+    def getbuffer(self) -> memoryview:
+        return memoryview(self._buffer)
+
+    def getvalue(self) -> bytes:
+        return bytes(self._buffer)
+
+    def __repr__(self):
+        return f"MemorySink(size={self.size})"
+
+
+class NullSink(Sink):
+    """丢弃所有数据, 用于单纯测量网络吞吐"""
+
+    def _open(self, resume: bool):
+        pass
+
+    def _write(self, chunk, offset: int) -> int:
+        return len(chunk)
+
+    def __repr__(self):
+        return "NullSink()"
+
+
+SINKS = {
+    "file": FileSink,
+    "pwrite": FileSink,
+    "mmap": MmapSink,
+    "memory": MemorySink,
+    "null": NullSink,
+}
+
+
+def create_sink(
+    sink: Union[str, Sink],
+    filepath: Optional[str] = None,
+    size: int = 0,
+    journal: Optional[DownloadJournal] = None,
+    preallocate: str = "none",
+) -> Sink:
+    """按名称创建写入目标
+
+    Args:
+        sink: 写入目标名称 (file/pwrite/mmap/memory/null) 或已创建的 Sink
+        filepath: 文件路径, file/mmap 需要
+        size: 文件大小, mmap 需要, memory 用于预分配
+        journal: 续传日志, 仅文件类写入目标使用
+        preallocate: 文件类写入目标的预分配策略, fallocate/sparse/none
+
+    Returns:
+        Sink: 尚未打开的写入目标
+    """
+    if isinstance(sink, Sink):
+        return sink
+    if sink not in SINKS:
+        raise ValueError(f"Unknown sink: {sink}, expected one of {sorted(SINKS)}")
+    if sink in ("file", "pwrite"):
+        return FileSink(filepath, size, preallocate, journal=journal)
+    if sink == "mmap":
+        return MmapSink(filepath, size, preallocate, journal=journal)
+    if sink == "memory":
+        return MemorySink(size)
+    return NullSink()
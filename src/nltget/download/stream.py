@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+import io
+from collections import deque
+from threading import Condition
+from typing import Deque, Dict, Iterator, Optional
+
+import requests
+from funlog import getLogger
+
+from .events import DownloadEvents, combine_events
+from .pool import SessionPool
+from .probe import RemoteInfo
+from .sink import Sink
+from .work import Worker, WorkerFactory
+
+logger = getLogger("funget")
+
+
+class _Block(Sink):
+    """一个范围的内存缓冲, 写入后通知等待数据的读取方"""
+
+    readable = True
+
+    def __init__(self, start: int, end: int, ready: Condition):
+        """
+        :param start: 范围起始位置
+        :param end: 范围结束位置(含)
+        :param ready: 有新数据写入时通知的条件变量
+        """
+        super(_Block, self).__init__()
+        self.start = start
+        self.end = end
+        self.ready = ready
+        self.buffer = bytearray(end - start + 1)
+
+    @property
+    def available(self) -> int:
+        """从 start 起已连续写入到的位置(不含)"""
+        written = self.written
+        if written and written[0][0] <= self.start:
+            return written[0][1]
+        return self.start
+
+    def _open(self, resume: bool):
+        pass
+
+    def _write(self, chunk, offset: int) -> int:
+        position = offset - self.start
+        self.buffer[position : position + len(chunk)] = chunk
+        return len(chunk)
+
+    def write(self, chunk, offset: int) -> int:
+        size = super(_Block, self).write(chunk, offset)
+        with self.ready:
+            self.ready.notify_all()
+        return size
+
+    def read(self, offset: int, size: int) -> bytes:
+        position = offset - self.start
+        return bytes(self.buffer[position : position + size])
+
+    def __repr__(self):
+        return f"_Block({self.start}-{self.end})"
+
+
+class _StreamEvents(DownloadEvents):
+    """范围最终失败时唤醒读取方并记录错误"""
+
+    def __init__(self, stream: "RemoteStream"):
+        self.stream = stream
+
+    def on_range_done(self, worker, success: bool, error=None):
+        # 对冲请求失败不影响原请求, 取消时的中断也不算错误
+        if success or worker.primary is not None or worker.cancelled:
+            return
+        self.stream._fail(
+            error
+            or IOError(
+                f"Failed to download range {worker.range_start}-{worker.range_end}"
+            )
+        )
+
+
+class RemoteStream(io.RawIOBase):
+    """把并行下载的远端文件按顺序读出的只读流
+
+    文件被拆成 block_size 的范围交给 WorkerFactory 并行下载, 数据先写入各范围的内存缓冲,
+    读取方按偏移顺序取走; 只有最前面的 buffer_blocks 个范围会被提交下载,
+    读取方取完最前面的范围后才提交下一个, 内存占用约为 buffer_blocks * block_size,
+    与文件大小无关。空闲线程优先拆分偏移最小的范围, 即读取方正在等待的数据。
+    worker_num 为 1、服务器不支持范围请求或大小未知时只用一个流式请求顺序读取。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        worker_num: int = 4,
+        block_size: int = 4,
+        chunk_size: int = 256 * 1024,
+        buffer_blocks: Optional[int] = None,
+        headers: Optional[Dict[str, str]] = None,
+        max_retries: int = 3,
+        timeout: int = 30,
+        events: Optional[DownloadEvents] = None,
+        pool: Optional[SessionPool] = None,
+        info: Optional[RemoteInfo] = None,
+    ):
+        """
+        :param url: 下载地址
+        :param worker_num: 并行下载的线程数
+        :param block_size: 每个范围的大小(MB)
+        :param chunk_size: 每次读取网络数据的字节数
+        :param buffer_blocks: 最多同时缓冲的范围数, 为空时等于 worker_num
+        :param headers: 额外的请求头
+        :param max_retries: 每个范围的最大重试次数
+        :param timeout: 探测请求的超时时间(秒)
+        :param events: 事件钩子, 见 DownloadEvents
+        :param pool: 共享的连接池, 为空时自建
+        :param info: 已有的探测结果, 传入时不再探测
+        """
+        super(RemoteStream, self).__init__()
+        self.url = url
+        self.worker_num = max(1, worker_num)
+        self.block_size = max(1, int(block_size * 1024 * 1024))
+        self.chunk_size = chunk_size
+        self.buffer_blocks = max(1, buffer_blocks or self.worker_num)
+        self.headers = headers or {}
+        self.max_retries = max_retries
+        self.events = events
+        self.position = 0
+        # 已分配的缓冲字节数及其峰值, 用于观察内存占用
+        self.buffered = 0
+        self.peak_buffered = 0
+        self._ready = Condition()
+        self._error: Optional[BaseException] = None
+        self._blocks: Deque[_Block] = deque()
+        self._factory: Optional[WorkerFactory] = None
+        self._response: Optional[requests.Response] = None
+        self._chunks: Optional[Iterator[bytes]] = None
+        self._pending = b""
+        self._own_pool = pool is None
+        self._pool = (pool or SessionPool(max_retries=max_retries)).ensure_size(
+            self.worker_num
+        )
+        try:
+            self.info = info or RemoteInfo.probe(
+                url, session=self._pool.session, headers=self.headers, timeout=timeout
+            )
+        except BaseException:
+            self.close()
+            raise
+        if events is not None:
+            events.on_probe(self, self.info)
+        self.size = self.info.size
+        self._head = self.info.head
+        self._next_start = len(self._head)
+
+        if self.info.complete:
+            return
+        if self.info.accept_ranges and self.size > 0 and self.worker_num > 1:
+            self._factory = WorkerFactory(
+                worker_num=self.worker_num,
+                capacity=self.buffer_blocks,
+                events=combine_events(_StreamEvents(self), events),
+                priority=lambda worker: worker.range_start,
+            )
+            self._fill()
+        else:
+            self._stream()
+
+    def _stream(self):
+        """用一个请求顺序读取, 支持范围请求时从探测收到的开头之后继续"""
+        headers = dict(self.headers)
+        if self.info.accept_ranges and self._head:
+            headers["Range"] = f"bytes={len(self._head)}-"
+            if self.info.if_range:
+                headers["If-Range"] = self.info.if_range
+        else:
+            logger.info(f"Streaming {self.url} in one request")
+        self._response = self._pool.session.get(
+            self.info.final_url, stream=True, headers=headers, timeout=60
+        )
+        self._response.raise_for_status()
+        if self._response.status_code != 206:
+            # 服务器返回了完整内容, 探测收到的开头丢弃, 从头读取
+            self._head = b""
+        self._chunks = self._response.iter_content(chunk_size=self.chunk_size)
+
+    def readable(self) -> bool:
+        return True
+
+    def _fail(self, error: BaseException):
+        with self._ready:
+            if self._error is None:
+                self._error = error
+            self._ready.notify_all()
+
+    def _fill(self):
+        """提交下载直到缓冲的范围数达到 buffer_blocks"""
+        while len(self._blocks) < self.buffer_blocks and self._next_start < self.size:
+            start = self._next_start
+            end = min(start + self.block_size, self.size) - 1
+            block = _Block(start, end, self._ready).open()
+            self._blocks.append(block)
+            self._next_start = end + 1
+            self.buffered += end - start + 1
+            self.peak_buffered = max(self.peak_buffered, self.buffered)
+            self._factory.submit(
+                Worker(
+                    url=self.info.final_url,
+                    range_start=start,
+                    range_end=end,
+                    fileobj=block,
+                    headers=self.headers,
+                    chunk_size=self.chunk_size,
+                    max_retries=self.max_retries,
+                    session=self._pool.session,
+                    if_range=self.info.if_range,
+                )
+            )
+
+    def readinto(self, buffer) -> int:
+        """按顺序读取数据, 返回读到的字节数, 0 表示已读完; 最多等到下一段数据到达"""
+        if self.closed:
+            raise ValueError("I/O operation on closed stream")
+        view = memoryview(buffer).cast("B")
+        if not len(view):
+            return 0
+        if self.position < len(self._head):
+            data = self._head[self.position : self.position + len(view)]
+        elif self._chunks is not None:
+            data = self._pending or next(self._chunks, b"")
+            self._pending = data[len(view) :]
+            data = data[: len(view)]
+        elif self._factory is not None and self._blocks:
+            return self._read_block(view)
+        else:
+            return 0
+        view[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def _read_block(self, view: memoryview) -> int:
+        """从最前面的范围读取, 数据未到达时等待"""
+        block = self._blocks[0]
+        with self._ready:
+            while block.available <= self.position and self._error is None:
+                self._ready.wait(timeout=1.0)
+            if block.available <= self.position:
+                raise IOError(
+                    f"Failed to read {self.url} at {self.position}: {self._error}"
+                )
+        size = min(len(view), block.available - self.position)
+        offset = self.position - block.start
+        view[:size] = block.buffer[offset : offset + size]
+        self.position += size
+        if self.position > block.end:
+            # 最前面的范围已经读完, 释放缓冲并提交下一个范围
+            self._blocks.popleft()
+            block.close()
+            self.buffered -= len(block.buffer)
+            self._fill()
+        return size
+
+    def stats(self) -> Dict[str, int]:
+        """缓冲峰值和线程池的拆分、对冲次数"""
+        stats = {"peak_buffered": self.peak_buffered}
+        if self._factory is not None:
+            stats.update(self._factory.stats())
+        return stats
+
+    def close(self):
+        """停止剩余的下载并释放缓冲"""
+        if self.closed:
+            return
+        if self._factory is not None:
+            self._factory.cancel()
+            self._factory.close()
+        if self._response is not None:
+            self._response.close()
+        self._blocks.clear()
+        self.buffered = 0
+        if self._own_pool:
+            self._pool.session.close()
+        super(RemoteStream, self).close()
+
+
+def open_remote(
+    url: str, buffer_size: int = io.DEFAULT_BUFFER_SIZE, **kwargs
+) -> io.BufferedReader:
+    """以只读文件的形式打开远端文件, 并行下载、按顺序读取, 不落盘
+
+    Args:
+        url: 下载地址
+        buffer_size: 读取缓冲区大小
+        **kwargs: 见 RemoteStream
+
+    Returns:
+        io.BufferedReader: 可以交给 tarfile/gzip/json 等按顺序读取的文件对象,
+            原始流为其 raw 属性
+    """
+    return io.BufferedReader(RemoteStream(url, **kwargs), buffer_size=buffer_size)
+
+
+def iter_download(url: str, chunk_size: int = 256 * 1024, **kwargs) -> Iterator[bytes]:
+    """并行下载远端文件, 按顺序逐块产出数据
+
+    Args:
+        url: 下载地址
+        chunk_size: 每次产出的最大字节数
+        **kwargs: 见 RemoteStream
+
+    Yields:
+        bytes: 按偏移顺序的文件内容
+    """
+    with RemoteStream(url, chunk_size=chunk_size, **kwargs) as stream:
+        buffer = bytearray(chunk_size)
+        while True:
+            size = stream.readinto(buffer)
+            if not size:
+                break
+            yield bytes(buffer[:size])
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import math
+from dataclasses import asdict, dataclass
+from typing import Any, Dict
+
+from funlog import getLogger
+
+from .probe import RemoteInfo
+
+logger = getLogger("funget")
+
+MB = 1024 * 1024
+
+
+@dataclass
+class TuneResult:
+    """自动调优得到的下载参数
+
+    engine 为 single 或 multi, block_size 单位为 MB, chunk_size 单位为字节;
+    rtt 和 throughput 为调优依据的往返时间(秒)和单连接吞吐量(字节/秒)。
+    """
+
+    engine: str
+    block_size: int
+    worker_num: int
+    chunk_size: int
+    size: int
+    rtt: float
+    throughput: float
+    reason: str
+
+    @property
+    def multi(self) -> bool:
+        return self.engine == "multi"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def __str__(self):
+        return (
+            f"engine={self.engine}, block_size={self.block_size}MB, "
+            f"worker_num={self.worker_num}, chunk_size={self.chunk_size // 1024}KB "
+            f"(size={self.size:,}, rtt={self.rtt * 1000:.1f}ms, "
+            f"throughput={self.throughput / MB:.1f}MB/s, {self.reason})"
+        )
+
+
+class AutoTuner:
+    """根据文件大小和探测测得的往返时间、吞吐量选择下载方式和参数
+
+    每个范围请求至少要花一个往返时间建立, 只有单连接传完一个范围的时间远大于往返时间时,
+    拆分才划算: 一个范围的大小取单连接在 max(range_time, range_rtts 个往返) 内能传完的数据量,
+    剩余数据不足两个范围时用单线程下载。往返时间越长, 单个连接越难跑满带宽,
+    连接数按往返时间增加; 每次读取的大小取单连接 chunk_time 秒内收到的数据量。
+
+    探测只读取了文件开头的一小段, 测得的吞吐量受 TCP 慢启动影响通常偏低, 往返时间包含建立连接的时间
+    通常偏高, 两者都使结果偏向更大的块和更多的连接。
+    """
+
+    def __init__(
+        self,
+        min_worker_num: int = 2,
+        max_worker_num: int = 32,
+        base_worker_num: int = 4,
+        base_rtt: float = 0.05,
+        range_time: float = 2.0,
+        range_rtts: int = 16,
+        chunk_time: float = 0.05,
+        min_chunk_size: int = 64 * 1024,
+        max_chunk_size: int = 4 * MB,
+        max_block_size: int = 256,
+        default_throughput: float = 10 * MB,
+    ):
+        """
+        :param min_worker_num: 多线程下载的最小连接数, 连接数达不到时用单线程下载
+        :param max_worker_num: 最大连接数
+        :param base_worker_num: 往返时间不超过 base_rtt 时的连接数
+        :param base_rtt: 往返时间超过该值(秒)后按比例增加连接数
+        :param range_time: 一个范围至少需要单连接传输的时间(秒)
+        :param range_rtts: 一个范围至少需要单连接传输的往返次数
+        :param chunk_time: 每次读取的数据量对应的传输时间(秒)
+        :param min_chunk_size: 每次读取的最小字节数
+        :param max_chunk_size: 每次读取的最大字节数
+        :param max_block_size: 最大块大小(MB)
+        :param default_throughput: 探测未能测得吞吐量时使用的吞吐量(字节/秒)
+        """
+        self.min_worker_num = max(2, min_worker_num)
+        self.max_worker_num = max(self.min_worker_num, max_worker_num)
+        self.base_worker_num = base_worker_num
+        self.base_rtt = base_rtt
+        self.range_time = range_time
+        self.range_rtts = range_rtts
+        self.chunk_time = chunk_time
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max(min_chunk_size, max_chunk_size)
+        self.max_block_size = max(1, max_block_size)
+        self.default_throughput = default_throughput
+
+    def chunk_size(self, throughput: float) -> int:
+        """每次读取的字节数, 按 64KB 取整"""
+        size = int(throughput * self.chunk_time) // (64 * 1024) * (64 * 1024)
+        return min(max(size, self.min_chunk_size), self.max_chunk_size)
+
+    def tune(self, info: RemoteInfo) -> TuneResult:
+        """根据探测结果计算下载参数
+
+        Args:
+            info: 探测结果, 使用其中的文件大小、范围请求支持、往返时间和吞吐量
+
+        Returns:
+            TuneResult: 下载方式和参数
+        """
+        rtt = max(info.rtt, 0.0)
+        throughput = info.throughput if info.throughput > 0 else self.default_throughput
+        chunk_size = self.chunk_size(throughput)
+
+        def single(reason: str) -> TuneResult:
+            return TuneResult(
+                engine="single",
+                block_size=max(1, math.ceil(info.size / MB)),
+                worker_num=1,
+                chunk_size=chunk_size,
+                size=info.size,
+                rtt=rtt,
+                throughput=throughput,
+                reason=reason,
+            )
+
+        if info.complete:
+            return single("complete in probe")
+        if not info.accept_ranges or info.size <= 0:
+            return single("no range support")
+
+        remaining = info.size - len(info.head)
+        range_bytes = throughput * max(self.range_time, self.range_rtts * rtt)
+        if remaining < 2 * range_bytes:
+            return single(
+                f"remaining {remaining:,} bytes below {2 * int(range_bytes):,}"
+            )
+
+        # 往返时间越长, 单个连接受拥塞窗口限制的吞吐量越低, 需要更多的连接
+        worker_num = math.ceil(self.base_worker_num * max(1.0, rtt / self.base_rtt))
+        worker_num = min(max(worker_num, self.min_worker_num), self.max_worker_num)
+
+        block_bytes = min(max(range_bytes, MB), self.max_block_size * MB)
+        # 块数少于连接数时缩小块, 让每个连接都有事做
+        if remaining / block_bytes < worker_num:
+            block_bytes = max(MB, remaining / worker_num)
+        worker_num = min(worker_num, max(1, int(remaining // block_bytes)))
+        if worker_num < self.min_worker_num:
+            return single(f"only {worker_num} block worth splitting")
+
+        return TuneResult(
+            engine="multi",
+            block_size=max(1, math.ceil(block_bytes / MB)),
+            worker_num=worker_num,
+            chunk_size=chunk_size,
+            size=info.size,
+            rtt=rtt,
+            throughput=throughput,
+            reason=f"{remaining / block_bytes:.0f} blocks over {worker_num} connections",
+        )
+
+
+def tune(info: RemoteInfo, **kwargs) -> TuneResult:
+    """用默认参数的 AutoTuner 计算下载参数, kwargs 见 AutoTuner"""
+    return AutoTuner(**kwargs).tune(info)
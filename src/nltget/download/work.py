@@ -1,25 +1,33 @@
 # -*- coding: utf-8 -*-
+import statistics
 import time
 from queue import Empty, Queue
-from threading import Thread
-from typing import Any, Callable, List, Optional
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Dict, List, Optional
 
 import requests
 from funlog import getLogger
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from ..metrics import (
+    BYTES,
+    QUEUE_DEPTH,
+    REQUEST_DURATION,
+    RETRIES,
+    TIME_TO_FIRST_BYTE,
+    WORKER_THROUGHPUT,
+    retry_cause,
+)
+from .adaptive import AdaptiveConcurrency
+from .events import DownloadEvents
+from .mirror import MirrorSet
+
 logger = getLogger("funget")
 
 
-def _update_callback(total, curser, current):
-    """
-    :param total: 总大小
-    :param curser:当前下载的大小
-    :param current: 最新一批次的大小
-    :return:
-    """
-    pass
+class ResourceChangedError(Exception):
+    """续传时远端文件已经改变, 服务器忽略 If-Range 返回了完整内容"""
 
 
 class Worker:
@@ -29,11 +37,13 @@ class Worker:
         fileobj,
         range_start: int = 0,
         range_end: Optional[int] = None,
-        update_callback: Optional[Callable] = None,
-        finish_callback: Optional[Callable] = None,
         headers: Optional[dict] = None,
         chunk_size: int = 2 * 1024 * 1024,
         max_retries: int = 3,
+        session: Optional[requests.Session] = None,
+        if_range: Optional[str] = None,
+        events: Optional[DownloadEvents] = None,
+        mirrors: Optional[MirrorSet] = None,
         *args,
         **kwargs,
     ):
@@ -45,11 +55,33 @@ class Worker:
         self.range_curser = range_start
         self.range_end = range_end or self._get_size()
         self.size = self.range_end - self.range_start + 1
-        self.update_callback = update_callback or _update_callback
-        self.finish_callback = finish_callback
+        # 下载过程的事件钩子, 见 DownloadEvents
+        self.events = events
         self.chunk_size = chunk_size or 100 * 1024
         self.max_retries = max_retries
-        self._session = self._create_session()
+        # 保护 range_curser/range_end, 被其他线程拆分时范围会缩小
+        self._lock = Lock()
+        # 传入的会话由调用方共享和关闭, 否则自建会话
+        self._session = session or self._create_session()
+        # 续传时的 If-Range 校验值(ETag 或 Last-Modified)
+        self.if_range = if_range
+        # 镜像, 设置后每个请求从中选择地址, 不再使用 url
+        self.mirrors = mirrors
+        self.cancelled = False
+        self.error: Optional[Exception] = None
+        # 每次请求失败时的回调, 由 WorkerFactory 设置, 用于并发控制
+        self.error_callback: Optional[Callable[[Exception], None]] = None
+        # 实际写入的字节数, 重试和拆分不会重复计数
+        self.downloaded = 0
+        # 对冲请求: hedge 为替本 Worker 发出的重复请求, 其 primary 指回本 Worker;
+        # 两者共用本 Worker 的范围和写入位置, winner 为先下载完剩余范围的一方
+        self.primary: Optional["Worker"] = None
+        self.hedge: Optional["Worker"] = None
+        self.winner: Optional["Worker"] = None
+        # 当前请求的开始时间和已收到的字节数(含对冲时丢弃的部分), 用于判断是否落后
+        self.request_started: Optional[float] = None
+        self.received = 0
+        self._response = None
 
     def _create_session(self) -> requests.Session:
         """创建带有重试策略的会话"""
@@ -86,32 +118,197 @@ class Worker:
 
     def run(self) -> bool:
         """执行下载任务"""
+        self.error = None
+        events = self.events
+        if events is not None:
+            events.on_range_start(self)
+        started, downloaded = time.monotonic(), self.downloaded
         for attempt in range(self.max_retries + 1):
             try:
-                return self._download_chunk()
+                success = self._download_chunk()
+                elapsed = time.monotonic() - started
+                if success and self.downloaded > downloaded and elapsed > 0:
+                    WORKER_THROUGHPUT.observe((self.downloaded - downloaded) / elapsed)
+                if events is not None:
+                    events.on_range_done(self, success)
+                return success
             except requests.exceptions.RequestException as e:
+                if self.finished:
+                    # 对冲的另一方已经下载完剩余范围, 本请求被中断
+                    if events is not None:
+                        events.on_range_done(self, True)
+                    return True
                 logger.warning(f"Download attempt {attempt + 1} failed: {e}")
-                if attempt == self.max_retries:
-                    logger.error(
-                        f"Download failed after {self.max_retries + 1} attempts"
-                    )
+                if self.error_callback:
+                    self.error_callback(e)
+                if attempt == self.max_retries or self.cancelled:
+                    logger.error(f"Download failed after {attempt + 1} attempts")
+                    self.error = e
+                    if events is not None:
+                        events.on_range_done(self, False, e)
                     raise
+                RETRIES.inc(cause=retry_cause(e))
+                if events is not None:
+                    events.on_retry(self, attempt + 1, e)
                 # 指数退避
                 time.sleep(2**attempt)
             except Exception as e:
                 logger.error(f"Unexpected error during download: {e}")
+                self.error = e
+                if events is not None:
+                    events.on_range_done(self, False, e)
                 raise
         return False
 
+    def cancel(self):
+        """取消下载, 正在进行的请求在下一个数据块处停止"""
+        self.cancelled = True
+
+    @property
+    def owner(self) -> "Worker":
+        """持有范围和写入位置的 Worker, 对冲请求为其 primary"""
+        return self.primary or self
+
+    @property
+    def remaining(self) -> int:
+        """剩余未下载的字节数"""
+        owner = self.owner
+        return max(0, owner.range_end - owner.range_curser + 1)
+
+    @property
+    def finished(self) -> bool:
+        """范围是否已经下载完成, 对冲时由任一方完成即可"""
+        return self.remaining == 0
+
+    def rate(self, now: Optional[float] = None) -> Optional[float]:
+        """当前请求的吞吐量(字节/秒), 尚未发出请求时为 None"""
+        if self.request_started is None:
+            return None
+        elapsed = (now or time.monotonic()) - self.request_started
+        return self.received / elapsed if elapsed > 0 else None
+
+    def hedged(self) -> Optional["Worker"]:
+        """为剩余范围创建对冲请求, 已经对冲过、本身是对冲请求或已完成时返回 None
+
+        对冲请求从当前写入位置开始请求同一段数据, 两个请求中领先的一方写入数据,
+        落后的一方丢弃已写入的部分; 先完成的一方中断另一方的请求。
+        """
+        with self._lock:
+            if self.primary is not None or self.hedge is not None or self.finished:
+                return None
+            worker = Worker(
+                url=self.url,
+                fileobj=self.fileobj,
+                range_start=self.range_curser,
+                range_end=self.range_end,
+                headers=self.headers,
+                chunk_size=self.chunk_size,
+                max_retries=self.max_retries,
+                session=self._session,
+                if_range=self.if_range,
+                events=self.events,
+                mirrors=self.mirrors,
+            )
+            worker.primary = self
+            self.hedge = worker
+        return worker
+
+    def abort(self):
+        """中断正在进行的请求, 阻塞在读取上的线程随即因连接断开而出错返回
+
+        urllib3 2.3 起的 HTTPResponse.shutdown 可以唤醒阻塞的读取; 更早的版本只能关闭响应,
+        读取线程要等到下一块数据到达后才会返回。
+        """
+        response = self._response
+        if response is None:
+            return
+        shutdown = getattr(response.raw, "shutdown", None)
+        try:
+            if shutdown is not None:
+                shutdown()
+            else:
+                response.close()
+        except (OSError, ValueError, RuntimeError) as e:
+            logger.debug(f"Failed to abort request: {e}")
+
+    def split(self, min_size: int = 1024 * 1024) -> Optional["Worker"]:
+        """把剩余范围的后一半拆分给新的 Worker
+
+        当前 Worker 原地缩小 range_end, 正在进行的请求读到新的结束位置后即停止。
+
+        Args:
+            min_size: 拆分后每一半的最小字节数, 剩余不足时不拆分
+
+        Returns:
+            Optional[Worker]: 负责后一半范围的 Worker, 无法拆分时返回 None
+        """
+        with self._lock:
+            remaining = self.remaining
+            if remaining < 2 * min_size:
+                return None
+            middle = self.range_curser + remaining // 2
+            worker = Worker(
+                url=self.url,
+                fileobj=self.fileobj,
+                range_start=middle,
+                range_end=self.range_end,
+                headers=self.headers,
+                chunk_size=self.chunk_size,
+                max_retries=self.max_retries,
+                session=self._session,
+                if_range=self.if_range,
+                events=self.events,
+                mirrors=self.mirrors,
+            )
+            self.range_end = middle - 1
+            self.size = self.range_end - self.range_start + 1
+        return worker
+
     def _download_chunk(self) -> bool:
-        """下载数据块"""
-        headers = {"Range": f"bytes={self.range_curser}-{self.range_end}"}
+        """下载数据块, 设置了镜像时每次请求选择一个镜像并记录其吞吐量"""
+        if self.finished:
+            return True
+        if self.mirrors is None:
+            return self._fetch(self.url, self.if_range)
+
+        mirror = self.mirrors.acquire()
+        # 各镜像的 ETag 已在探测时核对过, If-Range 使用镜像自己的校验值
+        if_range = (mirror.if_range or self.if_range) if self.if_range else None
+        started, downloaded = time.monotonic(), self.downloaded
+        try:
+            success = self._fetch(mirror.request_url, if_range)
+        except Exception as e:
+            # 被对冲的另一方中断不算镜像的错误
+            self.mirrors.release(
+                mirror,
+                self.downloaded - downloaded,
+                time.monotonic() - started,
+                None if self.finished else e,
+            )
+            raise
+        self.mirrors.release(
+            mirror, self.downloaded - downloaded, time.monotonic() - started
+        )
+        return success
+
+    def _fetch(self, url: str, if_range: Optional[str]) -> bool:
+        """用一个范围请求下载剩余的范围"""
+        owner = self.owner
+        # 本请求收到的数据在文件中的位置
+        position = owner.range_curser
+        headers = {"Range": f"bytes={position}-{owner.range_end}"}
+        if if_range:
+            headers["If-Range"] = if_range
         headers.update(self.headers)
 
+        started = time.monotonic()
+        self.request_started, self.received = started, 0
+        first_byte = True
         try:
             with self._session.get(
-                self.url, stream=True, headers=headers, timeout=60
+                url, stream=True, headers=headers, timeout=60
             ) as req:
+                self._response = req
                 req.raise_for_status()
 
                 # 检查状态码
@@ -126,23 +323,62 @@ class Worker:
                     )
                     return True
 
+                # 续传时收到完整内容, 说明 If-Range 校验失败, 远端文件已经改变
+                if req.status_code == 200 and if_range:
+                    raise ResourceChangedError(
+                        f"{url} changed since the download started"
+                    )
+
                 for chunk in req.iter_content(chunk_size=self.chunk_size):
+                    if self.cancelled:
+                        return False
                     if chunk:  # 过滤掉空块
-                        try:
-                            _size = self.fileobj.write(
-                                chunk=chunk, offset=self.range_curser
+                        if first_byte:
+                            first_byte = False
+                            TIME_TO_FIRST_BYTE.observe(
+                                time.monotonic() - started, direction="download"
                             )
-                            self.range_curser += _size
-                            if self.update_callback:
-                                self.update_callback(
-                                    self.size, self.range_curser, _size
-                                )
+                        self.received += len(chunk)
+                        try:
+                            with owner._lock:
+                                # 对冲时另一方可能已经写到更后面, 跳过已写入的部分
+                                skip = owner.range_curser - position
+                                position += len(chunk)
+                                if skip > 0:
+                                    chunk = chunk[skip:]
+                                # 范围可能已被拆分, 只写入仍属于自己的部分
+                                remaining = self.remaining
+                                if len(chunk) > remaining:
+                                    chunk = chunk[:remaining]
+                                offset = owner.range_curser
+                                _size = 0
+                                if chunk:
+                                    _size = self.fileobj.write(
+                                        chunk=chunk, offset=offset
+                                    )
+                                owner.range_curser += _size
+                                owner.downloaded += _size
+                                finished = owner.range_curser > owner.range_end
+                                if finished and owner.winner is None:
+                                    owner.winner = self
+                            if _size:
+                                BYTES.inc(_size, direction="download")
+                                if self.events is not None:
+                                    self.events.on_chunk(self, offset, _size)
                         except Exception as e:
                             logger.error(f"Error writing to file: {e}")
                             raise
+                        if finished:
+                            break
 
-                if self.finish_callback:
-                    self.finish_callback(self)
+                REQUEST_DURATION.observe(
+                    time.monotonic() - started, direction="download"
+                )
+                if owner.winner is self:
+                    # 中断对冲的另一方
+                    peer = self.hedge if self.primary is None else self.primary
+                    if peer is not None:
+                        peer.abort()
                 return True
 
         except requests.exceptions.Timeout:
@@ -154,6 +390,8 @@ class Worker:
         except requests.exceptions.HTTPError as e:
             logger.warning(f"HTTP error: {e}")
             raise
+        finally:
+            self._response = None
 
     def __lt__(self, another):
         return self.range_start < another.range_start
@@ -169,55 +407,237 @@ class Worker:
 
 
 class WorkerFactory(object):
-    def __init__(self, worker_num: int = 10, capacity: int = 100, timeout: int = 30):
+    def __init__(
+        self,
+        worker_num: int = 10,
+        capacity: int = 100,
+        timeout: int = 30,
+        steal: bool = True,
+        min_steal_size: int = 1024 * 1024,
+        steal_interval: float = 0.1,
+        controller: Optional[AdaptiveConcurrency] = None,
+        events: Optional[DownloadEvents] = None,
+        hedge: bool = False,
+        hedge_ratio: float = 0.25,
+        hedge_delay: float = 1.0,
+        latency_budget: Optional[float] = None,
+        priority: Optional[Callable[[Worker], Any]] = None,
+    ):
+        """
+        :param worker_num: 线程数
+        :param capacity: 任务队列容量
+        :param timeout: 空闲线程等待任务的超时时间
+        :param steal: 队列为空时, 空闲线程是否拆分正在运行的最大范围
+        :param min_steal_size: 拆分后每一半的最小字节数
+        :param steal_interval: 开启拆分时空闲线程的轮询间隔
+        :param controller: 自适应并发控制器, 设置后线程数随吞吐量动态调整, 忽略 worker_num
+        :param events: 事件钩子, 提交的 Worker 没有设置钩子时使用
+        :param hedge: 队列为空时, 空闲线程是否为落后的范围发出对冲请求, 对冲会重复下载落后范围剩余的数据, 默认关闭
+        :param hedge_ratio: 请求的吞吐量低于所有请求吞吐量中位数的该倍数时视为落后
+        :param hedge_delay: 请求开始后至少经过该秒数才判断是否落后
+        :param latency_budget: 请求耗时超过该秒数时同样视为落后, 为空时不限制
+        :param priority: 拆分时挑选运行中范围的排序键, 小的优先, 为空时剩余最多的优先
+        """
         self.worker_num = worker_num
         self.timeout = timeout
+        self.steal = steal
+        self.min_steal_size = min_steal_size
+        self.steal_interval = steal_interval
+        self.controller = controller
+        self.events = events
+        self.hedge = hedge
+        self.hedge_ratio = hedge_ratio
+        self.hedge_delay = hedge_delay
+        self.latency_budget = latency_budget
+        self.priority = priority
+        self.steal_count = 0
+        self.hedge_count = 0
+        # 已完成请求的吞吐量, 与进行中的请求一起计算中位数
+        self._rates: List[float] = []
         self._close = False
         self._task_queue = Queue(maxsize=capacity)
         self._threads: List[Thread] = []
+        self._monitor: Optional[Thread] = None
         self._failed_tasks = []
+        # 正在运行的 Worker, 拆分时从中挑选剩余最多的一个
+        self._active: List[Worker] = []
+        # 运行过的 Worker, 用于统计总下载量
+        self._seen = set()
+        self._lock = Lock()
+        self._idle = Condition(self._lock)
+        self._scaled = Condition(self._lock)
         self.start()
 
+    @property
+    def limit(self) -> int:
+        """当前允许同时运行的线程数"""
+        return self.controller.limit if self.controller else self.worker_num
+
     def submit(self, worker):
+        if worker.events is None:
+            worker.events = self.events
         self._task_queue.put(worker)
+        QUEUE_DEPTH.inc()
 
     def start(self):
-        for i in range(self.worker_num):
-            thread = Thread(target=self._worker)
+        with self._lock:
+            self._grow()
+        if self.controller is not None:
+            self._monitor = Thread(target=self._adjust, daemon=True)
+            self._monitor.start()
+
+    def _grow(self):
+        """启动线程直到线程数达到当前并发上限, 调用方需持有锁"""
+        while len(self._threads) < self.limit:
+            thread = Thread(target=self._worker, args=(len(self._threads),))
             thread.start()
             self._threads.append(thread)
 
-    def _worker(self):
+    def _adjust(self):
+        """按采样周期根据吞吐量调整并发数"""
+        while not self._close:
+            time.sleep(self.controller.interval)
+            limit = self.controller.update(self.transferred())
+            with self._scaled:
+                self._grow()
+                self._scaled.notify_all()
+            logger.debug(f"Adaptive concurrency: {limit}")
+
+    def transferred(self) -> int:
+        """所有 Worker 累计写入的字节数"""
+        with self._lock:
+            return sum(worker.downloaded for worker in self._seen)
+
+    def _worker(self, index: int = 0):
         """工作线程主循环"""
+        timeout = self.steal_interval if self.steal or self.hedge else self.timeout
         while not self._close:
+            # 超出当前并发上限的线程暂停领取任务, 直到上限提高
+            if index >= self.limit:
+                with self._scaled:
+                    self._scaled.wait(timeout=timeout)
+                continue
             try:
-                worker = self._task_queue.get(timeout=self.timeout)
+                worker = self._task_queue.get(timeout=timeout)
                 if worker is None:  # 毒丸，用于优雅关闭
                     break
+                QUEUE_DEPTH.dec()
 
                 try:
-                    success = worker.run()
-                    if not success:
-                        logger.warning(
-                            f"Worker failed to download range {worker.range_start}-{worker.range_end}"
-                        )
-                        self._failed_tasks.append(worker)
-                except Exception as e:
-                    logger.error(f"Worker execution failed: {e}")
-                    self._failed_tasks.append(worker)
+                    with self._lock:
+                        self._active.append(worker)
+                        self._seen.add(worker)
+                    self._execute(worker)
                 finally:
                     self._task_queue.task_done()
 
             except Empty:
-                # 超时，检查是否需要关闭
+                # 队列为空时先为落后的范围发出对冲请求, 再尝试从忙碌的 Worker 拆分范围,
+                # 否则检查是否需要关闭
+                worker = self._hedge() if self.hedge else None
+                if worker is None and self.steal:
+                    worker = self._steal()
+                if worker is not None:
+                    self._execute(worker)
                 continue
             except Exception as e:
                 logger.error(f"Unexpected error in worker thread: {e}")
                 # 继续运行，不要因为单个错误而停止整个线程
 
+    def _execute(self, worker: Worker):
+        """运行已登记的 Worker, 结束后从运行列表移除"""
+        if self.controller is not None:
+            worker.error_callback = self.controller.on_error
+        # 对冲请求失败不影响原请求, 不计入失败的任务
+        try:
+            success = worker.run()
+            if not success and worker.primary is None:
+                logger.warning(
+                    f"Worker failed to download range {worker.range_start}-{worker.range_end}"
+                )
+                self._failed_tasks.append(worker)
+        except Exception as e:
+            if worker.primary is None:
+                logger.error(f"Worker execution failed: {e}")
+                self._failed_tasks.append(worker)
+        finally:
+            rate = worker.rate()
+            with self._idle:
+                self._active.remove(worker)
+                if rate and worker.received >= self.min_steal_size:
+                    self._rates.append(rate)
+                self._idle.notify_all()
+
+    def _hedge(self) -> Optional[Worker]:
+        """为落后的运行中范围创建对冲请求, 返回已登记的新 Worker
+
+        请求开始 hedge_delay 秒后, 吞吐量低于所有请求中位数的 hedge_ratio 倍,
+        或耗时超过 latency_budget 的范围视为落后; 每个范围最多对冲一次, 剩余最多的优先。
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                worker
+                for worker in self._active
+                if worker.primary is None
+                and worker.hedge is None
+                and worker.request_started is not None
+                and now - worker.request_started >= self.hedge_delay
+                and not worker.finished
+            ]
+            if not candidates:
+                return None
+            rates = self._rates + [worker.rate(now) or 0.0 for worker in candidates]
+            median = statistics.median(rates)
+            for victim in sorted(candidates, key=lambda w: w.remaining, reverse=True):
+                slow = (victim.rate(now) or 0.0) < median * self.hedge_ratio
+                late = (
+                    self.latency_budget is not None
+                    and now - victim.request_started > self.latency_budget
+                )
+                if not (slow or late):
+                    continue
+                worker = victim.hedged()
+                if worker is None:
+                    continue
+                self._active.append(worker)
+                self._seen.add(worker)
+                self.hedge_count += 1
+                logger.debug(
+                    f"Hedging range {victim.range_curser}-{victim.range_end} "
+                    f"at {(victim.rate(now) or 0) / 1024:.0f}KB/s, median {median / 1024:.0f}KB/s"
+                )
+                return worker
+        return None
+
+    def _steal(self) -> Optional[Worker]:
+        """按 priority 拆分运行中的范围, 默认拆分剩余最多的, 返回已登记的新 Worker"""
+        key = self.priority or (lambda w: -w.remaining)
+        with self._lock:
+            for victim in sorted(self._active, key=key):
+                # 对冲中的范围由两个请求共用, 不再拆分
+                if victim.primary is not None or victim.hedge is not None:
+                    continue
+                worker = victim.split(self.min_steal_size)
+                if worker is not None:
+                    self._active.append(worker)
+                    self._seen.add(worker)
+                    self.steal_count += 1
+                    logger.debug(
+                        f"Split range {victim.range_start}-{victim.range_end}, "
+                        f"stolen {worker.range_start}-{worker.range_end}"
+                    )
+                    return worker
+                # 剩余最多的都无法拆分, 其他的更不行
+                if self.priority is None:
+                    break
+        return None
+
     def close(self):
         """优雅关闭线程池"""
         self._close = True
+        with self._scaled:
+            self._scaled.notify_all()
         # 向每个线程发送毒丸
         for _ in self._threads:
             try:
@@ -225,8 +645,44 @@ class WorkerFactory(object):
             except:
                 pass  # 队列可能已满，忽略错误
 
+    def stats(self) -> Dict[str, Any]:
+        """线程池统计: 并发数、线程数和拆分次数"""
+        stats = {
+            "concurrency": self.limit,
+            "threads": len(self._threads),
+            "steals": self.steal_count,
+            "hedges": self.hedge_count,
+            "hedge_wins": sum(
+                1
+                for worker in list(self._seen)
+                if worker.primary is not None and worker.primary.winner is worker
+            ),
+        }
+        if self.controller is not None:
+            stats.update(self.controller.stats())
+        return stats
+
+    def cancel(self):
+        """取消所有任务: 清空队列并通知运行中的 Worker 停止"""
+        self._close = True
+        while True:
+            try:
+                worker = self._task_queue.get_nowait()
+                self._task_queue.task_done()
+            except Empty:
+                break
+            if worker is not None:
+                QUEUE_DEPTH.dec()
+        with self._lock:
+            for worker in self._active:
+                worker.cancel()
+
     def wait_for_all_done(self):
         self._task_queue.join()
+        # 拆分出来的 Worker 不经过队列, 需要单独等待
+        with self._idle:
+            while self._active:
+                self._idle.wait()
 
     def empty(self) -> bool:
         """检查任务队列是否为空"""
@@ -243,6 +699,9 @@ class WorkerFactory(object):
 
         for task in failed_tasks:
             logger.info(f"Retrying failed task: {task.range_start}-{task.range_end}")
+            RETRIES.inc(cause=retry_cause(task.error) if task.error else "incomplete")
+            if task.events is not None:
+                task.events.on_retry(task, task.max_retries + 1, task.error)
             self.submit(task)
 
     def __enter__(self):
@@ -250,6 +709,9 @@ class WorkerFactory(object):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """上下文管理器退出时的清理工作"""
+        if exc_type is not None:
+            # 异常或 Ctrl-C 退出时不再等待剩余任务
+            self.cancel()
         try:
             # 等待所有任务完成，但设置超时
             start_time = time.time()
@@ -267,6 +729,10 @@ class WorkerFactory(object):
                 if thread.is_alive():
                     logger.warning(f"Thread {thread.name} did not terminate gracefully")
 
+        except KeyboardInterrupt:
+            # 等待过程中被 Ctrl-C 打断时, 停止剩余任务后再退出
+            self.cancel()
+            raise
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
 
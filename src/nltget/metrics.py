@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+下载和上传的运行指标
+
+进程内的指标注册表, 记录传输字节数、每个 Worker 的吞吐量、首字节时间和请求耗时分布、
+按原因统计的重试次数、新建与复用的连接数以及任务队列深度。
+可以通过 snapshot() 取得字典, 也可以输出为 Prometheus 文本格式, 写入 node_exporter 的
+textfile 目录或通过 serve() 启动一个 /metrics 接口。
+"""
+
+import json
+import math
+import os
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import requests
+from funlog import getLogger
+
+logger = getLogger("funget")
+
+# 请求耗时和首字节时间的分桶(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 吞吐量的分桶(字节/秒), 64KB/s 到 1GB/s
+THROUGHPUT_BUCKETS = tuple(64 * 1024 * 4**i for i in range(8))
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> _LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: _LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = Lock()
+
+    def samples(self) -> Iterable[Tuple[str, _LabelKey, float]]:
+        raise NotImplementedError
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super(Counter, self).__init__(name, documentation)
+        self._values: Dict[_LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, key, value
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {"labels": dict(key), "value": value}
+                for key, value in self._values.items()
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Counter):
+    """可增可减的当前值"""
+
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram(_Metric):
+    """分桶统计的分布"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float]):
+        super(Histogram, self).__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # {labels: [各桶计数(非累计), 总和, 总数]}
+        self._values: Dict[_LabelKey, List[Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(_label_key(labels))
+        return state[2] if state else 0
+
+    def _items(self):
+        with self._lock:
+            return [
+                (key, list(counts), total, count)
+                for key, (counts, total, count) in self._values.items()
+            ]
+
+    def samples(self):
+        for key, counts, total, count in self._items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                yield (
+                    f"{self.name}_bucket",
+                    key + (("le", _format_value(bound)),),
+                    cumulative,
+                )
+            yield f"{self.name}_sum", key, total
+            yield f"{self.name}_count", key, count
+
+    def snapshot(self):
+        result = []
+        for key, counts, total, count in self._items():
+            cumulative, buckets = 0, {}
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                buckets[_format_value(bound)] = cumulative
+            result.append(
+                {"labels": dict(key), "buckets": buckets, "sum": total, "count": count}
+            )
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class MetricsRegistry:
+    """指标注册表
+
+    Example:
+        registry = get_registry()
+        print(registry.snapshot()["funget_bytes_total"])
+        registry.write_textfile("/var/lib/node_exporter/funget.prom")
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = Lock()
+
+    def _register(self, cls, name: str, documentation: str, *args) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, *args)
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {name} already registered as {metric.type}")
+            return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter, name, documentation)
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._register(Gauge, name, documentation)
+
+    def histogram(
+        self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """所有指标的当前值
+
+        Returns:
+            Dict[str, Dict[str, Any]]: {指标名: {"type", "help", "samples"}},
+                直方图的每个样本包含累计的 buckets、sum 和 count
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: {
+                "type": metric.type,
+                "help": metric.documentation,
+                "samples": metric.snapshot(),
+            }
+            for metric in metrics
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False)
+
+    def to_prometheus(self) -> str:
+        """Prometheus 文本格式(text/plain; version=0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """原子地写入 Prometheus 文本格式, 供 node_exporter 的 textfile collector 读取"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory, prefix=".funget-", suffix=".prom")
+        try:
+            with os.fdopen(fd, "w") as fw:
+                fw.write(self.to_prometheus())
+            os.chmod(temp, 0o644)
+            os.replace(temp, path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """在后台线程启动 HTTP 接口, GET /metrics 返回 Prometheus 文本格式
+
+        指标中包含下载地址和主机名, 默认只监听本机; 需要被其他机器抓取时显式传入
+        host="0.0.0.0"。
+
+        Returns:
+            ThreadingHTTPServer: 调用 shutdown() 停止
+        """
+        registry = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(
+            f"Serving metrics on http://{host}:{server.server_address[1]}/metrics"
+        )
+        return server
+
+    def reset(self):
+        """清空所有指标的值"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+
+REGISTRY = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """进程级的指标注册表"""
+    return REGISTRY
+
+
+BYTES = REGISTRY.counter("funget_bytes_total", "Bytes transferred")
+WORKER_THROUGHPUT = REGISTRY.histogram(
+    "funget_worker_throughput_bytes_per_second",
+    "Throughput of each finished range worker",
+    THROUGHPUT_BUCKETS,
+)
+TIME_TO_FIRST_BYTE = REGISTRY.histogram(
+    "funget_time_to_first_byte_seconds",
+    "Time from sending a request to the first body byte",
+)
+REQUEST_DURATION = REGISTRY.histogram(
+    "funget_request_duration_seconds",
+    "Time from sending a request to the end of the body",
+)
+RETRIES = REGISTRY.counter("funget_retries_total", "Retried requests by cause")
+CONNECTIONS = REGISTRY.counter(
+    "funget_connections_total", "Connections opened or reused by pooled requests"
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "funget_queue_depth", "Range tasks waiting in worker queues"
+)
+
+
+def retry_cause(error: BaseException) -> str:
+    """重试原因: timeout/connection/http_<状态码>/其他异常的类名"""
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout"
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return "connection"
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return f"http_{error.response.status_code}"
+    status = getattr(error, "status", None)
+    if isinstance(status, int):
+        return f"http_{status}"
+    if isinstance(error, TimeoutError) or type(error).__name__ == "TimeoutError":
+        return "timeout"
+    return type(error).__name__
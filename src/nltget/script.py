@@ -5,6 +5,7 @@ import typer
 from funlog import getLogger
 
 from funget import multi_thread_download, simple_download
+from funget.config import get_config
 from funget.upload import single_upload
 
 logger = getLogger("funget")
@@ -19,6 +20,18 @@ def download(
         None, "-o", "--output", help="Output file path"
     ),
     worker: int = typer.Option(10, "-w", "--worker", help="Number of worker threads"),
+    adaptive: Optional[bool] = typer.Option(
+        None,
+        "--adaptive/--no-adaptive",
+        help="Adjust the number of worker threads to the measured throughput "
+        "(default: DownloadConfig.adaptive)",
+    ),
+    max_worker: Optional[int] = typer.Option(
+        None,
+        "--max-worker",
+        help="Maximum worker threads in adaptive mode "
+        "(default: DownloadConfig.max_worker_num)",
+    ),
     block_size: int = typer.Option(100, "-b", "--block-size", help="Block size in MB"),
     capacity: int = typer.Option(100, "-c", "--capacity", help="Queue capacity"),
     max_retries: int = typer.Option(
@@ -54,6 +67,12 @@ def download(
     logger.info(f"Starting download: {url}")
     logger.info(f"Output file: {output}")
 
+    config = get_config().download
+    if adaptive is None:
+        adaptive = config.adaptive
+    if max_worker is None:
+        max_worker = config.max_worker_num
+
     try:
         if single_thread:
             logger.info("Using single-thread download")
@@ -63,7 +82,12 @@ def download(
                 overwrite=overwrite,
             )
         else:
-            logger.info(f"Using multi-thread download with {worker} workers")
+            if adaptive:
+                logger.info(
+                    f"Using multi-thread download with up to {max_worker} adaptive workers"
+                )
+            else:
+                logger.info(f"Using multi-thread download with {worker} workers")
             success = multi_thread_download(
                 url=url,
                 filepath=output,
@@ -72,6 +96,8 @@ def download(
                 capacity=capacity,
                 overwrite=overwrite,
                 max_retries=max_retries,
+                adaptive=adaptive,
+                max_worker_num=max_worker,
             )
 
         if success:
@@ -160,26 +186,19 @@ def upload(
 def info(url: str = typer.Argument(..., help="URL to get information about")):
     """Get information about a downloadable file"""
     try:
-        from funget.download.core import Downloader
+        from funget.download.probe import RemoteInfo
 
-        # 创建一个临时下载器来获取文件信息
-        downloader = Downloader(url=url, filepath="/tmp/temp")
-        info = downloader.get_file_info()
+        # 一次范围请求即可取得文件大小和范围请求支持
+        remote = RemoteInfo.probe(url)
 
         typer.echo("📄 File Information:")
-        typer.echo(f"   URL: {info['url']}")
-        typer.echo(f"   Filename: {info['filename']}")
+        typer.echo(f"   URL: {remote.final_url}")
+        typer.echo(f"   Filename: {os.path.basename(remote.final_url.split('?')[0])}")
         typer.echo(
-            f"   Size: {info['filesize']:,} bytes ({info['filesize'] / (1024 * 1024):.2f} MB)"
+            f"   Size: {remote.size:,} bytes ({remote.size / (1024 * 1024):.2f} MB)"
         )
-
-        # 检查是否支持范围请求
-        from funget.download.multi import MultiDownloader
-
-        multi_downloader = MultiDownloader(url=url, filepath="/tmp/temp")
-        supports_range = multi_downloader.check_available()
         typer.echo(
-            f"   Range requests: {'✅ Supported' if supports_range else '❌ Not supported'}"
+            f"   Range requests: {'✅ Supported' if remote.accept_ranges else '❌ Not supported'}"
         )
 
     except Exception as e:
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
+import time
 from typing import Generator, Optional
 
 import requests
-from funfile.compress.utils import file_tqdm_bar
 from funlog import getLogger
 
+from ..download.progress import ProgressRenderer
+from ..metrics import BYTES, REQUEST_DURATION
 from .core import Uploader
 
 logger = getLogger("funget")
@@ -50,11 +52,11 @@ class SingleUploader(Uploader):
             pbar = None
             try:
                 with open(self.filepath, "rb") as file:
-                    pbar = file_tqdm_bar(
+                    pbar = ProgressRenderer(
                         path=self.filepath,
                         total=self.filesize,
                         prefix=f"{prefix}",
-                    )
+                    ).start()
 
                     uploaded_bytes = 0
 
@@ -66,6 +68,7 @@ class SingleUploader(Uploader):
                             if not data:
                                 break
                             uploaded_bytes += len(data)
+                            BYTES.inc(len(data), direction="upload")
                             try:
                                 pbar.update(len(data))
                             except Exception as e:
@@ -82,6 +85,7 @@ class SingleUploader(Uploader):
                     )
 
                     # 执行上传
+                    started = time.monotonic()
                     method = method.upper()
                     if method == "PUT":
                         response = self._session.put(
@@ -111,6 +115,10 @@ class SingleUploader(Uploader):
                         logger.error(f"Unsupported HTTP method: {method}")
                         return False
 
+                    REQUEST_DURATION.observe(
+                        time.monotonic() - started, direction="upload"
+                    )
+
                     # 检查响应
                     response.raise_for_status()
 
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+自适应并发控制测试
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import requests
+
+from benchmarks.server import RangeServer
+from funget.config import get_config
+from funget.download.adaptive import AdaptiveConcurrency, is_congestion_error
+from funget.download.multi import MultiDownloader
+
+MB = 1024 * 1024
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    """AIMD 控制器测试"""
+
+    def test_additive_increase(self):
+        """测试吞吐量上升时逐个增加连接"""
+        controller = AdaptiveConcurrency(initial=2, maximum=8)
+        controller.update(0, now=0)
+        self.assertEqual(controller.update(10 * MB, now=1), 3)
+        self.assertEqual(controller.update(25 * MB, now=2), 4)
+        self.assertEqual(controller.peak, 4)
+
+    def test_plateau_backs_off(self):
+        """测试吞吐量不再上升时退回到达到最高吞吐量的并发数"""
+        controller = AdaptiveConcurrency(initial=8, maximum=16)
+        controller.update(0, now=0)
+        self.assertEqual(controller.update(10 * MB, now=1), 9)
+        self.assertEqual(controller.update(20 * MB, now=2), 8)
+
+    def test_saturated_link(self):
+        """测试链路饱和后稳定在饱和点附近, 不会因吞吐量持平一路减到 1"""
+        controller = AdaptiveConcurrency(initial=4, maximum=64, hold_intervals=3)
+        total = 0
+        controller.update(total, now=0)
+        limits = []
+        for now in range(1, 60):
+            # 12 个连接时达到链路上限
+            total += min(controller.limit, 12) * MB
+            limits.append(controller.update(total, now=now))
+        self.assertEqual(limits[:9], [5, 6, 7, 8, 9, 10, 11, 12, 13])
+        self.assertTrue(all(12 <= limit <= 13 for limit in limits[9:]))
+        # 保持一段时间后再次向上试探
+        self.assertGreater(limits[9:].count(13), 5)
+
+    def test_throttle_halves(self):
+        """测试限流响应后并发数减半"""
+        controller = AdaptiveConcurrency(initial=8, maximum=16)
+        controller.update(0, now=0)
+        response = Mock(status_code=429)
+        controller.on_error(requests.exceptions.HTTPError(response=response))
+        self.assertEqual(controller.update(10 * MB, now=1), 4)
+
+    def test_bounds(self):
+        """测试并发数不超出上下限"""
+        controller = AdaptiveConcurrency(initial=1, minimum=1, maximum=2)
+        controller.update(0, now=0)
+        controller.update(MB, now=1)
+        self.assertEqual(controller.update(10 * MB, now=2), 2)
+        controller.on_error(requests.exceptions.ConnectionError())
+        controller.update(20 * MB, now=3)
+        controller.on_error(requests.exceptions.ConnectionError())
+        self.assertEqual(controller.update(30 * MB, now=4), 1)
+
+    def test_congestion_errors(self):
+        """测试拥塞类错误的识别"""
+        self.assertTrue(is_congestion_error(requests.exceptions.ConnectionError()))
+        self.assertTrue(is_congestion_error(requests.exceptions.RetryError()))
+        not_found = requests.exceptions.HTTPError(response=Mock(status_code=404))
+        self.assertFalse(is_congestion_error(not_found))
+        self.assertFalse(is_congestion_error(ValueError()))
+
+
+class TestAdaptiveDownload(unittest.TestCase):
+    """自适应模式下载测试"""
+
+    def test_adaptive_download(self):
+        """测试自适应模式下载并在统计中给出并发数"""
+        data = os.urandom(4 * MB)
+        with RangeServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+            url = server.add("/file.bin", data)
+            filepath = os.path.join(temp_dir, "test_file")
+            downloader = MultiDownloader(url=url, filepath=filepath, block_size=1)
+            self.assertTrue(downloader.download(adaptive=True, max_worker_num=8))
+            with open(filepath, "rb") as fr:
+                self.assertEqual(fr.read(), data)
+
+        self.assertIn("concurrency", downloader.stats)
+        self.assertLessEqual(downloader.stats["peak_concurrency"], 8)
+
+    def test_config_default(self):
+        """测试未指定时按 DownloadConfig 启用自适应模式"""
+        config = get_config().download
+        data = os.urandom(2 * MB)
+        with RangeServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+            url = server.add("/file.bin", data)
+            filepath = os.path.join(temp_dir, "test_file")
+            downloader = MultiDownloader(url=url, filepath=filepath, block_size=1)
+            saved = config.adaptive, config.max_worker_num
+            config.adaptive, config.max_worker_num = True, 3
+            try:
+                self.assertTrue(downloader.download())
+            finally:
+                config.adaptive, config.max_worker_num = saved
+
+        self.assertLessEqual(downloader.stats["peak_concurrency"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+异步下载器模块测试
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+
+from benchmarks.server import RangeServer
+from funget.download.aio import AsyncMultiDownloader, adownload
+from funget.download.sink import MemorySink
+
+try:
+    import aiohttp  # noqa: F401
+
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+
+@unittest.skipUnless(HAS_AIOHTTP, "aiohttp is not installed")
+class TestAsyncMultiDownloader(unittest.TestCase):
+    """异步多连接下载器测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(3 * 1024 * 1024 + 123)
+        self.server = RangeServer().start()
+        self.url = self.server.add("/file.bin", self.data)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_filepath = os.path.join(self.temp_dir.name, "test_file")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def test_adownload(self):
+        """测试异步下载多个范围"""
+        success = asyncio.run(
+            adownload(
+                url=self.url, filepath=self.test_filepath, worker_num=4, block_size=1
+            )
+        )
+        self.assertTrue(success)
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+
+    def test_sync_download(self):
+        """测试同步接口调用异步引擎"""
+        downloader = AsyncMultiDownloader(
+            url=self.url, filepath=self.test_filepath, block_size=1
+        )
+        self.assertEqual(downloader.blocks_num, 3)
+        self.assertTrue(downloader.download(worker_num=2))
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+
+    def test_write_off_loop(self):
+        """测试写入和顺序校验值的读回不在事件循环线程中执行"""
+        threads = set()
+
+        class RecordingSink(MemorySink):
+            def _write(self, chunk, offset):
+                # offset 0 是探测时收到的文件开头, 在开始下载前写入
+                if offset > 0:
+                    threads.add(threading.get_ident())
+                return super(RecordingSink, self)._write(chunk, offset)
+
+        async def run():
+            downloader = AsyncMultiDownloader(
+                url=self.url, filepath=self.test_filepath, block_size=1
+            )
+            success = await downloader.adownload(
+                worker_num=3,
+                sink=RecordingSink(len(self.data)),
+                checksum=f"sha256:{hashlib.sha256(self.data).hexdigest()}",
+            )
+            return success, threading.get_ident()
+
+        success, loop_thread = asyncio.run(run())
+        self.assertTrue(success)
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
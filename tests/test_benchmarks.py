@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试套件和本地测试服务测试
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import requests
+
+from benchmarks.server import RangeServer
+from benchmarks.suite import _cases, _measure, compare, main
+
+
+class TestRangeServer(unittest.TestCase):
+    """本地测试服务的延迟、限速、错误注入和上传测试"""
+
+    def test_bandwidth_and_latency(self):
+        """测试单连接带宽上限和响应延迟"""
+        data = os.urandom(1024 * 1024)
+        with RangeServer(latency=0.05, bandwidth=4 * 1024 * 1024) as server:
+            url = server.add("/file.bin", data)
+            start = time.monotonic()
+            self.assertEqual(requests.get(url, timeout=10).content, data)
+            self.assertGreaterEqual(time.monotonic() - start, 0.25)
+
+    def test_error_injection(self):
+        """测试固定种子的错误注入"""
+
+        def statuses(seed):
+            with RangeServer(error_rate=0.5, seed=seed) as server:
+                url = server.add("/file.bin", b"data")
+                result = [requests.get(url, timeout=10).status_code for _ in range(20)]
+                self.assertEqual(server.errors, result.count(503))
+                return result
+
+        first = statuses(1)
+        self.assertEqual(first, statuses(1))
+        self.assertEqual(set(first), {200, 503})
+
+    def test_upload(self):
+        """测试接收上传"""
+        with RangeServer() as server:
+            resp = requests.put(
+                f"{server.base_url}/upload", data=b"x" * 1000, timeout=10
+            )
+            self.assertEqual(resp.status_code, 201)
+            self.assertEqual(server.uploads["/upload"], 1000)
+
+
+class TestSuite(unittest.TestCase):
+    """基准测试套件测试"""
+
+    def test_cases(self):
+        """测试引擎只组合用得到的参数"""
+        args = type(
+            "Args",
+            (),
+            {
+                "engine": ["single", "multi"],
+                "worker": [4, 16],
+                "block_size": [1, 4],
+                "chunk_size": [256],
+            },
+        )
+        names = [case["name"] for case in _cases(args)]
+        self.assertEqual(len(names), 5)
+        self.assertIn("single:chunk_size=262144", names)
+
+    def test_compare(self):
+        """测试对比时标记回退"""
+        base = {
+            "results": [
+                {"name": "a", "throughput": 100.0, "cpu": 1.0, "success": True},
+                {"name": "b", "throughput": 100.0, "cpu": 1.0, "success": True},
+            ]
+        }
+        new = {
+            "results": [
+                {"name": "a", "throughput": 95.0, "cpu": 1.05, "success": True},
+                {"name": "b", "throughput": 80.0, "cpu": 1.0, "success": True},
+                {"name": "c", "throughput": 10.0, "cpu": 1.0, "success": True},
+            ]
+        }
+        rows = {row["name"]: row for row in compare(base, new, threshold=0.1)}
+        self.assertEqual(sorted(rows), ["a", "b"])
+        self.assertFalse(rows["a"]["regression"])
+        self.assertTrue(rows["b"]["regression"])
+
+    def test_measure_children(self):
+        """测试 CPU 时间和内存峰值包括子进程"""
+        # 子进程空转 0.3 秒 CPU 时间
+        code = (
+            "import time\n"
+            "end = time.process_time() + 0.3\n"
+            "while time.process_time() < end: pass"
+        )
+        measured = _measure(
+            lambda: subprocess.run([sys.executable, "-c", code]).returncode == 0,
+            children=True,
+        )
+        self.assertTrue(measured["success"])
+        self.assertGreaterEqual(measured["cpu"], 0.25)
+        if os.path.exists("/proc/self/task"):
+            parent = _measure(lambda: True)["peak_rss"]
+            self.assertGreater(measured["peak_rss"], parent)
+
+    def test_run(self):
+        """测试运行并写出结果"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = os.path.join(temp_dir, "result.json")
+            code = main(
+                [
+                    "run",
+                    "--size",
+                    "2",
+                    "--engine",
+                    "multi",
+                    "upload",
+                    "--worker",
+                    "2",
+                    "--block-size",
+                    "1",
+                    "--chunk-size",
+                    "256",
+                    "--repeat",
+                    "1",
+                    "--output",
+                    output,
+                ]
+            )
+            self.assertEqual(code, 0)
+            with open(output) as fr:
+                result = json.load(fr)
+            self.assertEqual(len(result["results"]), 2)
+            for item in result["results"]:
+                self.assertTrue(item["success"])
+                self.assertGreater(item["throughput"], 0)
+                self.assertGreater(item["peak_rss"], 0)
+            self.assertEqual(main(["compare", output, output]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+下载缓存测试
+"""
+
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.server import RangeServer
+from funget.download.cache import DownloadCache, clone_file, file_digest
+from funget.download.common import download
+from funget.download.manager import download_many
+
+
+class TestDownloadCache(unittest.TestCase):
+    """缓存索引和文件测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = DownloadCache(os.path.join(self.temp_dir.name, "cache"))
+
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+
+    def _file(self, name: str, data: bytes) -> str:
+        filepath = os.path.join(self.temp_dir.name, name)
+        with open(filepath, "wb") as fw:
+            fw.write(data)
+        return filepath
+
+    def _read(self, filepath: str) -> bytes:
+        with open(filepath, "rb") as fr:
+            return fr.read()
+
+    def test_store_and_fetch(self):
+        """测试缓存命中时生成目标文件"""
+        data = os.urandom(100 * 1024)
+        digest = self.cache.store("http://host/a", self._file("a", data), etag='"1"')
+        target = os.path.join(self.temp_dir.name, "out", "a")
+
+        self.assertTrue(self.cache.fetch("http://host/a", target, etag='"1"'))
+        self.assertEqual(self._read(target), data)
+        self.assertEqual(digest, file_digest(target))
+        # 远端文件改变后不再命中
+        self.assertFalse(self.cache.fetch("http://host/a", target, etag='"2"'))
+        self.assertFalse(self.cache.fetch("http://host/b", target, etag='"1"'))
+
+    def test_deduplicate(self):
+        """测试内容相同的文件只保存一份"""
+        data = os.urandom(1024)
+        self.cache.store("http://host/a", self._file("a", data), etag='"1"')
+        self.cache.store("http://mirror/a", self._file("b", data), etag='"x"')
+        self.assertEqual(self.cache.stats(), {"objects": 1, "urls": 2, "size": 1024})
+
+    def test_hardlink(self):
+        """测试硬链接方式与缓存共用同一份数据"""
+        cache = DownloadCache(self.cache.directory, link="hardlink")
+        digest = cache.store("http://host/a", self._file("a", b"data"), etag='"1"')
+        target = os.path.join(self.temp_dir.name, "linked")
+
+        self.assertTrue(cache.fetch("http://host/a", target, etag='"1"'))
+        self.assertTrue(os.path.samefile(target, cache.object_path(digest)))
+
+    def test_evict(self):
+        """测试超过大小上限时淘汰最久未访问的内容"""
+        cache = DownloadCache(self.cache.directory, max_size=2500)
+        for name in ("a", "b"):
+            cache.store(
+                f"http://host/{name}", self._file(name, os.urandom(1000)), etag='"1"'
+            )
+        # 访问 a 后 b 成为最久未访问的内容
+        self.assertTrue(
+            cache.fetch("http://host/a", self._file("out", b""), etag='"1"')
+        )
+        cache.store("http://host/c", self._file("c", os.urandom(1000)), etag='"1"')
+
+        self.assertIsNone(cache.get("http://host/b"))
+        self.assertIsNotNone(cache.get("http://host/a"))
+        self.assertIsNotNone(cache.get("http://host/c"))
+        self.assertEqual(cache.stats()["size"], 2000)
+
+    def test_missing_object(self):
+        """测试缓存文件被删除后视为未命中并清理索引"""
+        digest = self.cache.store("http://host/a", self._file("a", b"data"), etag='"1"')
+        os.remove(self.cache.object_path(digest))
+
+        self.assertFalse(
+            self.cache.fetch("http://host/a", self._file("out", b""), etag='"1"')
+        )
+        self.assertIsNone(self.cache.get("http://host/a"))
+
+    def test_concurrent_store(self):
+        """测试多个线程同时写入同一个缓存"""
+        files = [self._file(str(i), os.urandom(4096)) for i in range(8)]
+
+        def store(i):
+            cache = DownloadCache(self.cache.directory)
+            return cache.store(f"http://host/{i}", files[i], etag='"1"')
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            digests = list(executor.map(store, range(8)))
+
+        self.assertEqual(len(set(digests)), 8)
+        self.assertEqual(self.cache.stats()["urls"], 8)
+
+    def test_clone_file(self):
+        """测试复制文件"""
+        data = os.urandom(300 * 1024)
+        src = self._file("src", data)
+        dst = os.path.join(self.temp_dir.name, "dst")
+        self.assertIn(clone_file(src, dst), ("reflink", "copy"))
+        self.assertEqual(self._read(dst), data)
+        self.assertEqual(clone_file(src, dst, "copy"), "copy")
+        self.assertEqual(self._read(dst), data)
+
+
+class TestCachedDownload(unittest.TestCase):
+    """通过缓存下载的测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(12 * 1024 * 1024)
+        self.server = RangeServer().start()
+        self.url = self.server.add("/file.bin", self.data)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = DownloadCache(os.path.join(self.temp_dir.name, "cache"))
+
+    def tearDown(self):
+        """测试后清理"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def _check_file(self, filepath: str, data: bytes):
+        with open(filepath, "rb") as fr:
+            self.assertEqual(fr.read(), data)
+
+    def test_hit_for_another_filepath(self):
+        """测试下载到另一个路径时只发送探测请求"""
+        first = os.path.join(self.temp_dir.name, "first")
+        second = os.path.join(self.temp_dir.name, "second")
+        self.assertTrue(download(self.url, first, block_size=4, cache=self.cache))
+        self.server.requests.clear()
+
+        self.assertTrue(download(self.url, second, block_size=4, cache=self.cache))
+        self._check_file(second, self.data)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_changed(self):
+        """测试远端文件改变后重新下载"""
+        first = os.path.join(self.temp_dir.name, "first")
+        second = os.path.join(self.temp_dir.name, "second")
+        self.assertTrue(download(self.url, first, block_size=4, cache=self.cache))
+        changed = os.urandom(len(self.data))
+        self.server.add("/file.bin", changed)
+
+        self.assertTrue(download(self.url, second, block_size=4, cache=self.cache))
+        self._check_file(second, changed)
+        self.assertEqual(self.cache.stats()["objects"], 2)
+
+    def test_download_many(self):
+        """测试批量下载使用缓存"""
+        directory = os.path.join(self.temp_dir.name, "batch")
+        results = list(download_many([self.url], directory, cache=self.cache))
+        self.assertTrue(results[0].success)
+        self.server.requests.clear()
+
+        target = os.path.join(self.temp_dir.name, "again.bin")
+        results = list(download_many([(self.url, target)], cache=self.cache))
+        self.assertTrue(results[0].success)
+        self._check_file(target, self.data)
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
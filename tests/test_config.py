@@ -22,6 +22,8 @@ class TestConfig(unittest.TestCase):
         self.assertEqual(config.timeout, 30)
         self.assertFalse(config.overwrite)
         self.assertTrue(config.create_dirs)
+        self.assertEqual(config.preallocate, "fallocate")
+        self.assertEqual(config.block_hash, "none")
         self.assertIsInstance(config.headers, dict)
 
     def test_upload_config_defaults(self):
@@ -63,15 +65,22 @@ class TestConfig(unittest.TestCase):
         os.environ["FUNGET_WORKER_NUM"] = "15"
         os.environ["FUNGET_MAX_RETRIES"] = "5"
         os.environ["FUNGET_LOG_LEVEL"] = "DEBUG"
+        os.environ["FUNGET_PROGRESS_BAR"] = "0"
 
         try:
             config = FungetConfig.from_env()
             self.assertEqual(config.download.worker_num, 15)
             self.assertEqual(config.download.max_retries, 5)
             self.assertEqual(config.log_level, "DEBUG")
+            self.assertFalse(config.progress_bar)
         finally:
             # 清理环境变量
-            for key in ["FUNGET_WORKER_NUM", "FUNGET_MAX_RETRIES", "FUNGET_LOG_LEVEL"]:
+            for key in [
+                "FUNGET_WORKER_NUM",
+                "FUNGET_MAX_RETRIES",
+                "FUNGET_LOG_LEVEL",
+                "FUNGET_PROGRESS_BAR",
+            ]:
                 os.environ.pop(key, None)
 
     def test_config_to_dict(self):
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+校验值计算和校验测试
+"""
+
+import base64
+import hashlib
+import os
+import random
+import tempfile
+import unittest
+import zlib
+
+from benchmarks.server import RangeServer
+from funget.download.digest import (
+    ChecksumError,
+    StreamDigest,
+    _COMBINERS,
+    parse_checksum,
+    parse_digest_headers,
+)
+from funget.download.multi import MultiDownloader
+from funget.download.single import SingleDownloader
+
+
+class TestStreamDigest(unittest.TestCase):
+    """边写入边计算校验值的测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+        self.chunks = [
+            (offset, self.data[offset : offset + 100 * 1024])
+            for offset in range(0, len(self.data), 100 * 1024)
+        ]
+
+    def _reader(self, offset: int, size: int) -> bytes:
+        return self.data[offset : offset + size]
+
+    def _expected(self):
+        return {
+            "crc32": f"{zlib.crc32(self.data):08x}",
+            "md5": hashlib.md5(self.data).hexdigest(),
+            "sha256": hashlib.sha256(self.data).hexdigest(),
+        }
+
+    def test_out_of_order(self):
+        """测试乱序写入时的校验值"""
+        random.shuffle(self.chunks)
+        digest = StreamDigest(["crc32", "md5", "sha256"], len(self.data), self._reader)
+        for offset, chunk in self.chunks:
+            digest.update(chunk, offset)
+        self.assertEqual(digest.hexdigests(), self._expected())
+
+    def test_crc_without_reader(self):
+        """测试 CRC 不需要读回数据"""
+        random.shuffle(self.chunks)
+        digest = StreamDigest(["crc32"], len(self.data))
+        for offset, chunk in self.chunks:
+            digest.update(chunk, offset)
+        self.assertEqual(digest.hexdigests()["crc32"], self._expected()["crc32"])
+
+    def test_missing_data(self):
+        """测试有数据未写入时读回计算"""
+        digest = StreamDigest(["crc32", "sha256"], len(self.data), self._reader)
+        for offset, chunk in self.chunks[::2]:
+            digest.update(chunk, offset)
+        expected = self._expected()
+        self.assertEqual(digest.hexdigests()["crc32"], expected["crc32"])
+        self.assertEqual(digest.hexdigests()["sha256"], expected["sha256"])
+
+        digest = StreamDigest(["sha256"], len(self.data))
+        digest.update(self.chunks[1][1], self.chunks[1][0])
+        with self.assertRaises(ChecksumError):
+            digest.hexdigests()
+
+    def test_crc_combine(self):
+        """测试 CRC 合并"""
+        a, b = os.urandom(1000), os.urandom(12345)
+        combined = _COMBINERS["crc32"].combine(zlib.crc32(a), zlib.crc32(b), len(b))
+        self.assertEqual(combined, zlib.crc32(a + b))
+
+    def test_parse_headers(self):
+        """测试解析响应头中的校验值"""
+        sha256 = hashlib.sha256(b"data")
+        md5 = hashlib.md5(b"data")
+        headers = {
+            "Digest": f"SHA-256={base64.b64encode(sha256.digest()).decode()}",
+            "x-goog-hash": f"crc32c=AAAAAA==,md5={base64.b64encode(md5.digest()).decode()}",
+            "Content-MD5": base64.b64encode(b"0" * 16).decode(),
+        }
+        digests = parse_digest_headers(headers, partial=True)
+        self.assertEqual(digests["sha256"], sha256.hexdigest())
+        self.assertEqual(digests["md5"], md5.hexdigest())
+        self.assertEqual(digests["crc32c"], "00000000")
+        # 完整响应中的 Content-MD5 排在 x-goog-hash 之后
+        self.assertEqual(parse_digest_headers(headers)["md5"], md5.hexdigest())
+
+    def test_parse_checksum(self):
+        """测试解析调用方给出的校验值"""
+        value = hashlib.sha256(b"data").hexdigest()
+        self.assertEqual(parse_checksum(f"sha256:{value}"), {"sha256": value})
+        self.assertEqual(parse_checksum({"SHA-256": value.upper()}), {"sha256": value})
+        with self.assertRaises(ValueError):
+            parse_checksum("sha256")
+
+
+class TestVerifiedDownload(unittest.TestCase):
+    """下载时校验的测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(6 * 1024 * 1024)
+        self.server = RangeServer().start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_filepath = os.path.join(self.temp_dir.name, "test_file")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def _digest_header(self, data: bytes) -> dict:
+        return {
+            "Digest": f"SHA-256={base64.b64encode(hashlib.sha256(data).digest()).decode()}"
+        }
+
+    def test_checksum(self):
+        """测试调用方给出的校验值"""
+        url = self.server.add("/file.bin", self.data)
+        downloader = MultiDownloader(url=url, filepath=self.test_filepath, block_size=1)
+        checksum = f"md5:{hashlib.md5(self.data).hexdigest()}"
+        self.assertTrue(downloader.download(worker_num=4, checksum=checksum))
+        self.assertEqual(downloader.digests["md5"], hashlib.md5(self.data).hexdigest())
+
+    def test_checksum_mismatch(self):
+        """测试校验失败时删除文件"""
+        url = self.server.add("/file.bin", self.data)
+        downloader = MultiDownloader(url=url, filepath=self.test_filepath, block_size=1)
+        self.assertFalse(downloader.download(worker_num=4, checksum=f"crc32:{0:08x}"))
+        self.assertFalse(os.path.exists(self.test_filepath))
+
+    def test_header_digest(self):
+        """测试使用响应头中的校验值"""
+        url = self.server.add(
+            "/file.bin", self.data, headers=self._digest_header(self.data)
+        )
+        downloader = MultiDownloader(url=url, filepath=self.test_filepath, block_size=1)
+        self.assertTrue(downloader.download(worker_num=4))
+        self.assertEqual(
+            downloader.digests["sha256"], hashlib.sha256(self.data).hexdigest()
+        )
+
+    def test_header_digest_mismatch(self):
+        """测试响应头中的校验值不一致"""
+        url = self.server.add(
+            "/file.bin", self.data, headers=self._digest_header(b"other")
+        )
+        downloader = MultiDownloader(url=url, filepath=self.test_filepath, block_size=1)
+        self.assertFalse(downloader.download(worker_num=4))
+        self.assertFalse(os.path.exists(self.test_filepath))
+
+        downloader = MultiDownloader(url=url, filepath=self.test_filepath, block_size=1)
+        self.assertTrue(downloader.download(worker_num=4, verify=False))
+
+    def test_single(self):
+        """测试单线程下载的校验"""
+        url = self.server.add("/file.bin", self.data)
+        downloader = SingleDownloader(url=url, filepath=self.test_filepath)
+        checksum = f"sha256:{hashlib.sha256(self.data).hexdigest()}"
+        self.assertTrue(downloader.download(checksum=checksum))
+
+        downloader = SingleDownloader(
+            url=url, filepath=self.test_filepath, overwrite=True
+        )
+        self.assertFalse(downloader.download(checksum=f"sha256:{'0' * 64}"))
+        self.assertFalse(os.path.exists(self.test_filepath))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -147,7 +147,23 @@ class TestMultiDownloader(unittest.TestCase):
                 self.assertEqual(len(ranges), 1)
                 self.assertEqual(ranges[0], (0, 999))
 
-    @patch("requests.get")
+    def test_ranges_do_not_overlap(self):
+        """测试相邻的块首尾相接, 既不重叠也不遗漏"""
+        size = 10 * 1024 * 1024 + 5
+        with patch.object(MultiDownloader, "_Downloader__get_size", return_value=size):
+            with patch.object(MultiDownloader, "check_available", return_value=True):
+                downloader = MultiDownloader(
+                    url=self.test_url, filepath=self.test_filepath, block_size=3
+                )
+
+                ranges = downloader._MultiDownloader__get_range()
+                self.assertGreater(len(ranges), 1)
+                self.assertEqual(ranges[0][0], 0)
+                self.assertEqual(ranges[-1][1], size - 1)
+                for (_, end), (start, _) in zip(ranges, ranges[1:]):
+                    self.assertEqual(start, end + 1)
+
+    @patch("requests.Session.get")
     def test_check_available(self, mock_get):
         """测试范围请求支持检查"""
         # 模拟支持范围请求的响应
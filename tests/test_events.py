@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+事件钩子测试
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from collections import Counter
+from threading import Lock
+
+from benchmarks.server import RangeServer
+from funget.config import get_config
+from funget.download.aio import AsyncMultiDownloader
+from funget.download.events import DownloadEvents, TraceExporter, combine_events
+from funget.download.manager import DownloadManager
+from funget.download.multi import MultiDownloader
+from funget.download.single import SingleDownloader
+
+
+class _Recorder(DownloadEvents):
+    """记录收到的事件"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.calls = Counter()
+        self.bytes = 0
+        self.ranges = []
+        self.completed = []
+
+    def on_probe(self, downloader, info):
+        with self.lock:
+            self.calls["probe"] += 1
+
+    def on_range_start(self, worker):
+        with self.lock:
+            self.calls["range_start"] += 1
+
+    def on_chunk(self, worker, offset, size):
+        with self.lock:
+            self.bytes += size
+
+    def on_retry(self, worker, attempt, error):
+        with self.lock:
+            self.calls["retry"] += 1
+
+    def on_range_done(self, worker, success, error=None):
+        with self.lock:
+            self.ranges.append((worker.range_start, worker.range_end, success))
+
+    def on_complete(self, downloader, success):
+        self.completed.append(success)
+
+
+class TestEvents(unittest.TestCase):
+    """下载过程中的事件测试"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = get_config()
+        cls.progress_bar, cls.config.progress_bar = cls.config.progress_bar, False
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.config.progress_bar = cls.progress_bar
+
+    def setUp(self):
+        self.data = os.urandom(3 * 1024 * 1024 + 123)
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _path(self, name="file"):
+        return os.path.join(self.temp_dir.name, name)
+
+    def test_multi(self):
+        """测试多线程下载的事件"""
+        events = _Recorder()
+        with RangeServer() as server:
+            url = server.add("/file.bin", self.data)
+            downloader = MultiDownloader(
+                url=url, filepath=self._path(), block_size=1, events=events
+            )
+            self.assertTrue(downloader.download(worker_num=4))
+        self.assertEqual(events.calls["probe"], 1)
+        # 探测时收到的数据直接写入, 不经过 on_chunk
+        self.assertEqual(events.bytes + len(downloader.info.head), len(self.data))
+        self.assertEqual(events.calls["range_start"], len(events.ranges))
+        self.assertTrue(all(success for _, _, success in events.ranges))
+        self.assertEqual(events.completed, [True])
+
+    def test_single(self):
+        """测试单线程下载的事件"""
+        events = _Recorder()
+        with RangeServer() as server:
+            url = server.add("/file.bin", self.data)
+            downloader = SingleDownloader(url=url, filepath=self._path(), events=events)
+            self.assertTrue(downloader.download(chunk_size=64 * 1024))
+        self.assertEqual(events.calls["probe"], 1)
+        self.assertEqual(events.bytes + len(downloader.info.head), len(self.data))
+        self.assertEqual(events.completed, [True])
+
+    def test_async_retry(self):
+        """测试 asyncio 引擎的重试事件"""
+        events = _Recorder()
+        with RangeServer(error_rate=0.3, seed=1) as server:
+            url = server.add("/file.bin", self.data)
+            downloader = AsyncMultiDownloader(
+                url=url, filepath=self._path(), block_size=1, events=events
+            )
+            success = asyncio.run(downloader.adownload(worker_num=4, max_retries=8))
+            self.assertTrue(success)
+            errors = server.errors
+        self.assertEqual(events.bytes + len(downloader.info.head), len(self.data))
+        self.assertGreater(errors, 0)
+        self.assertGreater(events.calls["retry"], 0)
+        self.assertEqual(events.completed, [True])
+
+    def test_manager(self):
+        """测试批量下载对每个文件触发 on_complete"""
+        events = _Recorder()
+        with RangeServer() as server:
+            urls = [server.add(f"/file{i}.bin", self.data) for i in range(3)]
+            with DownloadManager(
+                max_connections=4,
+                block_size=1,
+                multi_threshold=1024 * 1024,
+                events=events,
+            ) as manager:
+                results = list(
+                    manager.download_many(urls, directory=self.temp_dir.name)
+                )
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result.success for result in results))
+        self.assertEqual(events.calls["probe"], 3)
+        self.assertTrue(all(success for _, _, success in events.ranges))
+        self.assertEqual(events.completed, [True] * 3)
+
+    def test_trace(self):
+        """测试导出 Chrome trace"""
+        recorder = _Recorder()
+        trace = TraceExporter()
+        events = combine_events(recorder, None, trace)
+        with RangeServer() as server:
+            url = server.add("/file.bin", self.data)
+            downloader = MultiDownloader(
+                url=url, filepath=self._path(), block_size=1, events=events
+            )
+            self.assertTrue(downloader.download(worker_num=2))
+
+        with open(self._path() + ".trace.json") as fr:
+            data = json.load(fr)
+        phases = Counter(event["ph"] for event in data["traceEvents"])
+        ranges = [
+            event
+            for event in data["traceEvents"]
+            if event["ph"] == "X" and event["name"].startswith("range")
+        ]
+        self.assertEqual(len(ranges), len(recorder.ranges))
+        self.assertGreater(phases["C"], 0)
+        self.assertEqual(data["otherData"]["url"], url)
+        # 并发数为 2 时最多占用两条轨道
+        self.assertLessEqual({event["tid"] for event in ranges}, {1, 2})
+        self.assertEqual(recorder.completed, [True])
+
+    def test_trace_manager(self):
+        """测试批量下载共用一个 TraceExporter 时每个文件各有一个 trace"""
+        with RangeServer() as server:
+            urls = [server.add(f"/file{i}.bin", self.data) for i in range(3)]
+            with DownloadManager(
+                max_connections=4,
+                block_size=1,
+                multi_threshold=1024 * 1024,
+                events=TraceExporter(),
+            ) as manager:
+                results = list(
+                    manager.download_many(urls, directory=self.temp_dir.name)
+                )
+        self.assertTrue(all(result.success for result in results))
+        for result in results:
+            with open(result.filepath + ".trace.json") as fr:
+                data = json.load(fr)
+            self.assertEqual(data["otherData"]["filepath"], result.filepath)
+            events = data["traceEvents"]
+            self.assertTrue(
+                any(e["ph"] == "X" and e["name"].startswith("range") for e in events)
+            )
+            # 只包含本文件的数据块: 数据块加上探测时写入的头部等于文件大小
+            chunks = sum(
+                e["args"]["size"]
+                for e in events
+                if e["ph"] == "X" and e["name"] == "chunk"
+            )
+            self.assertGreater(chunks, 0)
+            self.assertLessEqual(chunks, len(self.data))
+            self.assertEqual(
+                [e["name"] for e in events if e["ph"] == "i" and e["name"] != "retry"],
+                ["probe", "complete"],
+            )
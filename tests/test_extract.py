@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+边下载边解压测试
+"""
+
+import gzip
+import io
+import lzma
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from benchmarks.server import RangeServer
+from funget.config import get_config
+from funget.download.common import download
+from funget.download.extract import _safe_path, detect_mode, download_extract
+
+MB = 1024 * 1024
+
+
+class _Unseekable(io.RawIOBase):
+    """不能 seek 的输出, zipfile 写入时会使用数据描述符"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+class TestExtract(unittest.TestCase):
+    """边下载边解压测试"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = get_config()
+        cls.progress_bar, cls.config.progress_bar = cls.config.progress_bar, False
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.config.progress_bar = cls.progress_bar
+
+    def setUp(self):
+        self.data = os.urandom(3 * MB + 5)
+        self.files = {"a.bin": self.data, "dir/b.txt": b"hello " * 1000}
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.server = RangeServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.temp_dir.name, name)
+
+    def _assert_files(self, directory):
+        for name, data in self.files.items():
+            with open(os.path.join(directory, name), "rb") as fr:
+                self.assertEqual(fr.read(), data)
+
+    def _tar(self, compression=""):
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode=f"w:{compression}") as tar:
+            for name, data in self.files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        return archive.getvalue()
+
+    def test_gzip(self):
+        """测试单线程和并行下载时解压 gzip, 压缩包不落盘"""
+        url = self.server.add("/file.bin.gz", gzip.compress(self.data))
+        for worker_num in (1, 3):
+            target = self._path(f"out{worker_num}.bin")
+            self.assertTrue(
+                download_extract(url, target, worker_num=worker_num, block_size=1)
+            )
+            with open(target, "rb") as fr:
+                self.assertEqual(fr.read(), self.data)
+        self.assertEqual(
+            sorted(os.listdir(self.temp_dir.name)), ["out1.bin", "out3.bin"]
+        )
+
+    def test_xz(self):
+        """测试解压 xz"""
+        url = self.server.add("/file.bin.xz", lzma.compress(self.data))
+        self.assertTrue(download_extract(url, self._path("out.bin"), mode="xz"))
+        with open(self._path("out.bin"), "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+
+    def test_tar_gz(self):
+        """测试通过 download 的 extract 参数解包 tar.gz"""
+        url = self.server.add("/data.tar.gz", self._tar("gz"))
+        directory = self._path("data")
+        self.assertTrue(
+            download(url, directory, extract="auto", worker_num=3, block_size=1)
+        )
+        self._assert_files(directory)
+
+    def test_zip(self):
+        """测试顺序解出 stored/deflate 条目, 包括带数据描述符的 deflate 条目"""
+        for seekable in (True, False):
+            output = io.BytesIO() if seekable else _Unseekable()
+            # 写入不能 seek 的输出时大小记在数据描述符中, 只有 deflate 条目能流式解出
+            method = zipfile.ZIP_STORED if seekable else zipfile.ZIP_DEFLATED
+            with zipfile.ZipFile(output, "w") as archive:
+                archive.writestr("a.bin", self.data, compress_type=method)
+                archive.writestr(
+                    "dir/b.txt", self.files["dir/b.txt"], zipfile.ZIP_DEFLATED
+                )
+            data = output.getvalue() if seekable else output.buffer.getvalue()
+            url = self.server.add(f"/data{int(seekable)}.zip", data)
+            directory = self._path(f"zip{int(seekable)}")
+            self.assertTrue(
+                download_extract(url, directory, worker_num=2, block_size=1)
+            )
+            self._assert_files(directory)
+
+        output = _Unseekable()
+        with zipfile.ZipFile(output, "w") as archive:
+            archive.writestr("a.bin", self.data, compress_type=zipfile.ZIP_STORED)
+        url = self.server.add("/stored.zip", output.buffer.getvalue())
+        self.assertFalse(download_extract(url, self._path("stored")))
+
+    def test_corrupted(self):
+        """测试数据损坏时返回 False 并删除不完整的输出"""
+        url = self.server.add("/file.bin.gz", gzip.compress(self.data)[:-100])
+        target = self._path("out.bin")
+        self.assertFalse(download_extract(url, target))
+        self.assertFalse(os.path.exists(target))
+
+    def test_modes(self):
+        """测试按后缀推断解压方式, 拒绝解包到目标目录之外"""
+        self.assertEqual(detect_mode("http://host/a/data.tar.gz?x=1"), "tar")
+        self.assertEqual(detect_mode("http://host/data.tgz"), "tar")
+        self.assertEqual(detect_mode("http://host/data.json.zst"), "zstd")
+        self.assertEqual(detect_mode("http://host/data.zip"), "zip")
+        self.assertIsNone(detect_mode("http://host/data.bin"))
+        with self.assertRaises(ValueError):
+            _safe_path(self.temp_dir.name, "../evil")
+        with self.assertRaises(ValueError):
+            _safe_path(self.temp_dir.name, "/etc/passwd")
+
+
+if __name__ == "__main__":
+    unittest.main()
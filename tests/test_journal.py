@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+断点续传日志测试
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.server import RangeServer
+from funget.download.journal import DownloadJournal
+from funget.download.multi import MultiDownloader
+from funget.download.sink import FileSink
+
+
+class TestDownloadJournal(unittest.TestCase):
+    """续传日志测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(4 * 1024 * 1024)
+        self.server = RangeServer().start()
+        self.url = self.server.add("/file.bin", self.data)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_filepath = os.path.join(self.temp_dir.name, "test_file")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def _interrupted(self, etag: str, done_size: int) -> DownloadJournal:
+        """模拟一次中断的下载: 写入部分数据和对应的日志"""
+        with open(self.test_filepath, "wb") as fw:
+            fw.write(self.data[:done_size])
+        half = len(self.data) // 2
+        journal = DownloadJournal(
+            filepath=self.test_filepath,
+            url=self.url,
+            size=len(self.data),
+            etag=etag,
+            ranges=[[0, half - 1], [half, len(self.data) - 1]],
+            done=[[0, done_size]],
+        )
+        journal.save()
+        return journal
+
+    def test_save_and_load(self):
+        """测试日志的保存和读取"""
+        journal = self._interrupted('"abc"', 1024)
+        loaded = DownloadJournal.load(self.test_filepath)
+
+        self.assertEqual(loaded.to_dict()["done"], [[0, 1024]])
+        self.assertEqual(loaded.if_range, '"abc"')
+        self.assertTrue(loaded.matches(self.url, len(self.data)))
+        self.assertFalse(loaded.matches(self.url, 1))
+        self.assertEqual(loaded.path, journal.path)
+
+    def test_weak_etag_falls_back_to_last_modified(self):
+        """测试弱 ETag 不用于 If-Range"""
+        journal = DownloadJournal(
+            self.test_filepath, self.url, 1, etag='W/"abc"', last_modified="date"
+        )
+        self.assertEqual(journal.if_range, "date")
+
+    def test_resume_without_probe(self):
+        """测试根据日志续传, 不发送探测请求且只下载缺失的部分"""
+        done_size = 3 * 1024 * 1024
+        self._interrupted(self.server.etag("/file.bin"), done_size)
+
+        downloader = MultiDownloader(url=self.url, filepath=self.test_filepath)
+        self.assertTrue(downloader.download(worker_num=2))
+
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+        self.assertFalse(os.path.exists(f"{self.test_filepath}.nltget"))
+        self.assertEqual(
+            self.server.requests,
+            [("GET", "/file.bin", f"bytes={done_size}-{len(self.data) - 1}")],
+        )
+
+    def test_resume_after_change(self):
+        """测试远端文件改变后重新下载"""
+        self._interrupted('"stale"', 3 * 1024 * 1024)
+
+        downloader = MultiDownloader(url=self.url, filepath=self.test_filepath)
+        self.assertTrue(downloader.download(worker_num=2))
+
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+        self.assertFalse(os.path.exists(f"{self.test_filepath}.nltget"))
+
+    def test_sync_before_save(self):
+        """测试每次保存日志前先把数据刷到磁盘, 中断时关闭前保存"""
+        journal = DownloadJournal(
+            filepath=self.test_filepath, url=self.url, size=len(self.data)
+        )
+        calls = []
+        sink = FileSink(self.test_filepath, journal=journal, flush_interval=0)
+        with mock.patch.object(
+            sink, "_sync", side_effect=lambda: calls.append("sync")
+        ), mock.patch.object(journal, "save", side_effect=lambda: calls.append("save")):
+            sink.open()
+            sink.write(self.data[:1024], 0)
+            sink.close(complete=False)
+        self.assertEqual(calls, ["sync", "save"] * 3)
+        self.assertEqual(journal.done, [[0, 1024]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+批量下载管理器测试
+"""
+
+import os
+import tempfile
+import unittest
+from threading import Lock
+
+from benchmarks.server import RangeRequestHandler, RangeServer
+from funget.download.manager import DownloadManager, download_many
+
+
+class CountingRangeRequestHandler(RangeRequestHandler):
+    """慢速写出并记录每个服务和所有服务同时进行的 GET 请求数"""
+
+    write_size = 64 * 1024
+    write_delay = 0.002
+    lock = Lock()
+    active = 0
+    peak = 0
+
+    def do_GET(self):
+        cls, server = CountingRangeRequestHandler, self.server
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            super().do_GET()
+        finally:
+            with cls.lock:
+                cls.active -= 1
+                server.active -= 1
+
+
+def _counting_server() -> RangeServer:
+    server = RangeServer(handler=CountingRangeRequestHandler)
+    server._httpd.active, server._httpd.peak = 0, 0
+    return server.start()
+
+
+class TestDownloadManager(unittest.TestCase):
+    """批量下载测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        CountingRangeRequestHandler.peak = 0
+        self.servers = [_counting_server(), _counting_server()]
+        self.files = {}
+        for i, server in enumerate(self.servers):
+            for j, size in enumerate([1024, 64 * 1024, 3 * 1024 * 1024]):
+                data = os.urandom(size)
+                self.files[server.add(f"/file_{i}_{j}.bin", data)] = data
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """测试后清理"""
+        for server in self.servers:
+            server.stop()
+        self.temp_dir.cleanup()
+
+    def test_download_many(self):
+        """测试批量下载的结果和文件内容"""
+        results = list(
+            download_many(
+                self.files,
+                directory=self.temp_dir.name,
+                max_connections=6,
+                per_host=2,
+                block_size=1,
+                multi_threshold=1024 * 1024,
+            )
+        )
+
+        self.assertEqual(len(results), len(self.files))
+        for result in results:
+            self.assertTrue(result.success, result.error)
+            with open(result.filepath, "rb") as fr:
+                self.assertEqual(fr.read(), self.files[result.url])
+
+    def test_connection_limits(self):
+        """测试每个主机和全局的并发连接数限制"""
+        with DownloadManager(max_connections=3, per_host=2, block_size=1) as manager:
+            results = list(manager.download_many(self.files, self.temp_dir.name))
+
+        self.assertTrue(all(result.success for result in results))
+        for server in self.servers:
+            self.assertLessEqual(server._httpd.peak, 2)
+        self.assertLessEqual(CountingRangeRequestHandler.peak, 3)
+
+    def test_small_file_single_request(self):
+        """测试小文件由探测请求直接取得完整内容"""
+        server = self.servers[0]
+        url = f"{server.base_url}/file_0_1.bin"
+        with DownloadManager(block_size=1) as manager:
+            results = list(manager.download_many([url], self.temp_dir.name))
+
+        self.assertTrue(results[0].success)
+        with open(results[0].filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.files[url])
+        self.assertEqual(len(server.requests), 1)
+
+    def test_reuse_manager(self):
+        """测试同一个管理器多次批量下载, 每次只产出本批的结果"""
+        urls = list(self.files)
+        half = len(urls) // 2
+        with DownloadManager(block_size=1) as manager:
+            first = list(manager.download_many(urls[:half], self.temp_dir.name))
+            second = list(manager.download_many(urls[half:], self.temp_dir.name))
+
+        self.assertEqual(sorted(r.url for r in first), sorted(urls[:half]))
+        self.assertEqual(sorted(r.url for r in second), sorted(urls[half:]))
+        self.assertTrue(all(result.success for result in first + second))
+
+    def test_failed_file(self):
+        """测试不存在的文件返回失败结果"""
+        url = f"{self.servers[0].base_url}/missing.bin"
+        results = list(download_many([url], directory=self.temp_dir.name))
+
+        self.assertEqual(len(results), 1)
+        self.assertFalse(results[0].success)
+
+
+if __name__ == "__main__":
+    unittest.main()
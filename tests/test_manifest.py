@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+分块校验值清单测试
+"""
+
+import hashlib
+import os
+import random
+import tempfile
+import unittest
+
+from benchmarks.server import RangeServer
+from funget.config import get_config
+from funget.download.journal import DownloadJournal
+from funget.download.manifest import BlockManifest
+from funget.download.metadata import MetadataStore
+from funget.download.multi import MultiDownloader
+
+MB = 1024 * 1024
+
+
+class TestBlockManifest(unittest.TestCase):
+    """分块校验值计算测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(3 * MB + 17)
+        self.chunks = [
+            (offset, self.data[offset : offset + 100 * 1024])
+            for offset in range(0, len(self.data), 100 * 1024)
+        ]
+
+    def _reader(self, offset: int, size: int) -> bytes:
+        return self.data[offset : offset + size]
+
+    def _expected(self, manifest: BlockManifest):
+        hashes = {}
+        for index in range(manifest.blocks_num):
+            start, end = manifest.block_range(index)
+            hashes[index] = hashlib.sha256(self.data[start:end]).hexdigest()
+        return hashes
+
+    def test_block_size(self):
+        """测试按文件大小选择块大小"""
+        self.assertEqual(BlockManifest.choose_block_size(1), 8 * MB)
+        block_size = BlockManifest.choose_block_size(100 * 1024 * MB)
+        self.assertEqual(block_size % MB, 0)
+        self.assertLessEqual(
+            -(-100 * 1024 * MB // block_size), BlockManifest.max_blocks
+        )
+
+    def test_update(self):
+        """测试顺序和乱序写入时的分块校验值"""
+        manifest = BlockManifest(len(self.data), block_size=MB)
+        for offset, chunk in self.chunks:
+            manifest.update(chunk, offset)
+        self.assertEqual(manifest.hashes, self._expected(manifest))
+
+        random.shuffle(self.chunks)
+        manifest = BlockManifest(len(self.data), block_size=MB)
+        manifest.reader = self._reader
+        for offset, chunk in self.chunks:
+            manifest.update(chunk, offset)
+        self.assertEqual(manifest.hashes, self._expected(manifest))
+
+    def test_verify(self):
+        """测试校验时剔除损坏和未写满的块"""
+        manifest = BlockManifest(len(self.data), block_size=MB)
+        for offset, chunk in self.chunks:
+            manifest.update(chunk, offset)
+        manifest = BlockManifest.from_dict(len(self.data), manifest.to_dict())
+
+        corrupted = bytearray(self.data)
+        corrupted[MB + 5] ^= 0xFF
+
+        def reader(offset, size):
+            return bytes(corrupted[offset : offset + size])
+
+        verified = manifest.verify(reader, [[0, 3 * MB + 10]])
+        self.assertEqual(verified, [[0, MB], [2 * MB, 3 * MB]])
+        self.assertEqual(sorted(manifest.hashes), [0, 2])
+
+
+class TestVerifiedResume(unittest.TestCase):
+    """按分块校验值续传和修复的测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(32 * MB)
+        self.server = RangeServer().start()
+        self.url = self.server.add("/file.bin", self.data)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_filepath = os.path.join(self.temp_dir.name, "test_file")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def _corrupt(self, offset: int):
+        with open(self.test_filepath, "r+b") as fw:
+            fw.seek(offset)
+            fw.write(b"\0" * 16)
+
+    def _fetched(self):
+        return [request[2] for request in self.server.requests if request[2]]
+
+    def test_resume_with_corrupted_block(self):
+        """测试续传时只重新下载校验失败的块"""
+        manifest = BlockManifest(len(self.data), block_size=8 * MB)
+        manifest.update(self.data[: 24 * MB], 0)
+        with open(self.test_filepath, "wb") as fw:
+            fw.write(self.data[: 24 * MB])
+        DownloadJournal(
+            filepath=self.test_filepath,
+            url=self.url,
+            size=len(self.data),
+            etag=self.server.etag("/file.bin"),
+            ranges=[[0, len(self.data) - 1]],
+            done=[[0, 24 * MB]],
+            manifest=manifest,
+        ).save()
+        self._corrupt(9 * MB)
+
+        downloader = MultiDownloader(url=self.url, filepath=self.test_filepath)
+        self.assertTrue(downloader.download(worker_num=2))
+
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+        self.assertCountEqual(
+            self._fetched(),
+            [f"bytes={8 * MB}-{16 * MB - 1}", f"bytes={24 * MB}-{32 * MB - 1}"],
+        )
+
+    def test_repair(self):
+        """测试本地文件损坏后按下载记录中的分块校验值修复"""
+        config = get_config().download
+        block_hash, config.block_hash = config.block_hash, "sha256"
+        self.addCleanup(setattr, config, "block_hash", block_hash)
+        metadata = MetadataStore(os.path.join(self.temp_dir.name, "metadata.db"))
+        downloader = MultiDownloader(
+            url=self.url, filepath=self.test_filepath, block_size=8, metadata=metadata
+        )
+        self.assertTrue(downloader.download(worker_num=4))
+        self.assertEqual(
+            len(metadata.get(self.url, self.test_filepath).blocks["hashes"]), 4
+        )
+
+        self._corrupt(17 * MB)
+        self.server.requests.clear()
+        downloader = MultiDownloader(
+            url=self.url, filepath=self.test_filepath, block_size=8, metadata=metadata
+        )
+        self.assertTrue(downloader.download(worker_num=4))
+
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+        # 除探测请求外只请求了损坏的块, 空闲线程可能分走其中一部分
+        ranges = [
+            [int(value) for value in fetched[len("bytes=") :].split("-")]
+            for fetched in self._fetched()[1:]
+        ]
+        self.assertEqual(min(start for start, _ in ranges), 16 * MB)
+        self.assertEqual(max(end for _, end in ranges), 24 * MB - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
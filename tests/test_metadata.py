@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+下载记录与条件请求测试
+"""
+
+import os
+import tempfile
+import unittest
+
+from benchmarks.server import RangeServer
+from funget.download.common import download
+from funget.download.metadata import MetadataStore
+from funget.download.multi import MultiDownloader
+
+
+class TestMetadataStore(unittest.TestCase):
+    """下载记录测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = MetadataStore(os.path.join(self.temp_dir.name, "metadata.db"))
+        self.test_filepath = os.path.join(self.temp_dir.name, "test_file")
+        with open(self.test_filepath, "wb") as fw:
+            fw.write(b"data")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+
+    def test_put_and_get(self):
+        """测试记录的保存和读取"""
+        self.store.put("http://host/file", self.test_filepath, etag='"abc"')
+        record = self.store.get("http://host/file", self.test_filepath)
+
+        self.assertEqual(record.size, 4)
+        self.assertTrue(record.local_unchanged())
+        self.assertTrue(record.matches('"abc"', None, 4))
+        self.assertFalse(record.matches('"def"', None, 4))
+        self.assertEqual(
+            self.store.conditional_headers("http://host/file", self.test_filepath),
+            {"If-None-Match": '"abc"'},
+        )
+
+    def test_local_file_changed(self):
+        """测试本地文件被修改后不再发送条件请求"""
+        self.store.put("http://host/file", self.test_filepath, etag='"abc"')
+        with open(self.test_filepath, "ab") as fw:
+            fw.write(b"more")
+
+        self.assertEqual(
+            self.store.conditional_headers("http://host/file", self.test_filepath), {}
+        )
+
+    def test_no_validators(self):
+        """测试没有校验信息时不记录"""
+        self.assertIsNone(self.store.put("http://host/file", self.test_filepath))
+        self.assertIsNone(self.store.get("http://host/file", self.test_filepath))
+
+
+class TestConditionalDownload(unittest.TestCase):
+    """条件下载测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(2 * 1024 * 1024)
+        self.server = RangeServer().start()
+        self.url = self.server.add("/file.bin", self.data)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_filepath = os.path.join(self.temp_dir.name, "test_file")
+        self.store = MetadataStore(os.path.join(self.temp_dir.name, "metadata.db"))
+
+    def tearDown(self):
+        """测试后清理"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def _download(self) -> bool:
+        downloader = MultiDownloader(
+            url=self.url, filepath=self.test_filepath, block_size=1, metadata=self.store
+        )
+        return downloader.download(worker_num=2, overwrite=True)
+
+    def test_not_modified(self):
+        """测试远端文件未改变时只发送一个条件请求, 即使 overwrite 为真"""
+        self.assertTrue(self._download())
+        self.server.requests.clear()
+
+        self.assertTrue(self._download())
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.server.requests[0][0], "GET")
+
+    def test_changed_with_same_size(self):
+        """测试远端文件大小不变但内容改变时重新下载"""
+        self.assertTrue(self._download())
+        changed = os.urandom(len(self.data))
+        self.server.add("/file.bin", changed)
+
+        self.assertTrue(self._download())
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), changed)
+
+    def test_common_download(self):
+        """测试自动选择下载方式时的条件请求"""
+        self.assertTrue(download(self.url, self.test_filepath, metadata=self.store))
+        self.server.requests.clear()
+
+        self.assertTrue(
+            download(self.url, self.test_filepath, overwrite=True, metadata=self.store)
+        )
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
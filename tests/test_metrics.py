@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标测试
+"""
+
+import os
+import tempfile
+import unittest
+
+import requests
+
+from benchmarks.server import RangeServer
+from funget.download.multi import MultiDownloader
+from funget.metrics import MetricsRegistry, get_registry
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """指标注册表测试"""
+
+    def test_prometheus(self):
+        """测试 Prometheus 文本格式"""
+        registry = MetricsRegistry()
+        counter = registry.counter("test_total", "A counter")
+        counter.inc(3, cause='say "hi"')
+        histogram = registry.histogram("test_seconds", "A histogram", buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        text = registry.to_prometheus()
+        self.assertIn("# TYPE test_total counter", text)
+        self.assertIn('test_total{cause="say \\"hi\\""} 3', text)
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('test_seconds_bucket{le="1"} 2', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn("test_seconds_count 3", text)
+        self.assertEqual(registry.snapshot()["test_seconds"]["samples"][0]["sum"], 5.55)
+
+        with self.assertRaises(ValueError):
+            registry.gauge("test_total", "Not a gauge")
+
+    def test_textfile_and_serve(self):
+        """测试写入 textfile 和 /metrics 接口"""
+        registry = MetricsRegistry()
+        registry.gauge("test_depth", "A gauge").set(2)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "funget.prom")
+            registry.write_textfile(path)
+            with open(path) as fr:
+                self.assertIn("test_depth 2", fr.read())
+
+        server = registry.serve(port=0)
+        try:
+            port = server.server_address[1]
+            resp = requests.get(f"http://127.0.0.1:{port}/metrics", timeout=5)
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("test_depth 2", resp.text)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestDownloadMetrics(unittest.TestCase):
+    """下载时记录的指标测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(8 * 1024 * 1024)
+        self.server = RangeServer().start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_filepath = os.path.join(self.temp_dir.name, "test_file")
+        get_registry().reset()
+
+    def tearDown(self):
+        """测试后清理"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def test_multi(self):
+        """测试多线程下载的指标"""
+        url = self.server.add("/file.bin", self.data)
+        downloader = MultiDownloader(url=url, filepath=self.test_filepath, block_size=1)
+        self.assertTrue(downloader.download(worker_num=4))
+
+        registry = get_registry()
+        bytes_total = registry.get("funget_bytes_total")
+        # 探测请求收到的开头数据直接写入, 不经过 Worker
+        self.assertGreater(bytes_total.value(direction="download"), 0)
+        self.assertLessEqual(bytes_total.value(direction="download"), len(self.data))
+        self.assertGreater(
+            registry.get("funget_time_to_first_byte_seconds").count(
+                direction="download"
+            ),
+            0,
+        )
+        self.assertGreater(
+            registry.get("funget_worker_throughput_bytes_per_second").count(), 0
+        )
+        self.assertEqual(registry.get("funget_queue_depth").value(), 0)
+        connections = registry.get("funget_connections_total")
+        self.assertGreater(connections.value(state="opened"), 0)
+        self.assertIn(
+            "funget_request_duration_seconds_bucket", registry.to_prometheus()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
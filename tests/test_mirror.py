@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+多镜像下载测试
+"""
+
+import os
+import tempfile
+import unittest
+
+from benchmarks.server import RangeServer
+from funget.config import get_config
+from funget.download.mirror import MirrorSet
+from funget.download.multi import MultiDownloader, download
+
+
+def _ranges(server):
+    """服务收到的范围请求(不含探测)"""
+    return [
+        item
+        for item in server.requests
+        if item[0] == "GET" and item[2] != "bytes=0-65535"
+    ]
+
+
+class TestMirrorSet(unittest.TestCase):
+    """镜像选择测试"""
+
+    def test_proportional(self):
+        """测试同时进行的请求数与吞吐量成正比"""
+        mirrors = MirrorSet(["http://a/file", "http://b/file"])
+        mirrors.mirrors[0].throughput = 300.0
+        mirrors.mirrors[1].throughput = 100.0
+        chosen = [mirrors.acquire().url for _ in range(8)]
+        self.assertEqual(chosen.count("http://a/file"), 6)
+        self.assertEqual(chosen.count("http://b/file"), 2)
+
+    def test_unmeasured(self):
+        """测试尚未测得吞吐量的镜像也会被选中"""
+        mirrors = MirrorSet(["http://a/file", "http://b/file"])
+        mirrors.mirrors[0].throughput = 100.0
+        chosen = {mirrors.acquire().url for _ in range(2)}
+        self.assertEqual(chosen, {"http://a/file", "http://b/file"})
+
+    def test_drop(self):
+        """测试停用连续失败和落后的镜像, 至少保留一个"""
+        mirrors = MirrorSet(
+            ["http://a/file", "http://b/file", "http://c/file"],
+            max_errors=2,
+            lag_ratio=0.5,
+        )
+        a, b, c = mirrors.mirrors
+        for _ in range(2):
+            mirrors.release(mirrors.acquire(), 0, 0.1, error=OSError("reset"))
+        self.assertIsNotNone(a.disabled)
+
+        for mirror, elapsed in ((b, 1.0), (c, 4.0), (b, 1.0), (c, 4.0)):
+            mirror.active += 1
+            mirrors.release(mirror, 1024 * 1024, elapsed)
+        self.assertIsNone(b.disabled)
+        self.assertIn("lagging", c.disabled)
+
+        for _ in range(3):
+            mirrors.release(mirrors.acquire(), 0, 0.1, error=OSError("reset"))
+        self.assertEqual(mirrors.available, [b])
+
+
+class TestMirrorDownload(unittest.TestCase):
+    """多镜像下载测试"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = get_config()
+        cls.progress_bar, cls.config.progress_bar = cls.config.progress_bar, False
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.config.progress_bar = cls.progress_bar
+
+    def setUp(self):
+        self.data = os.urandom(8 * 1024 * 1024 + 7)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.temp_dir.name, "file.bin")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _assert_file(self):
+        with open(self.filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+
+    def test_spread(self):
+        """测试范围请求分布到各镜像, 越快的镜像分到越多的数据"""
+        with RangeServer(bandwidth=2 * 1024 * 1024) as slow, RangeServer() as fast:
+            urls = [slow.add("/file.bin", self.data), fast.add("/file.bin", self.data)]
+            downloader = MultiDownloader(
+                url=urls[0], filepath=self.filepath, block_size=1, mirrors=urls[1:]
+            )
+            self.assertTrue(downloader.download(worker_num=4))
+            self._assert_file()
+        stats = {item["url"]: item for item in downloader.stats["mirrors"]}
+        self.assertGreater(stats[urls[1]]["bytes"], stats[urls[0]]["bytes"])
+        self.assertGreater(len(_ranges(fast)), len(_ranges(slow)))
+
+    def test_mismatch(self):
+        """测试大小或 ETag 不一致的镜像不参与下载"""
+        other = bytearray(self.data)
+        other[-1] ^= 0xFF
+        with RangeServer() as primary, RangeServer() as changed, RangeServer() as short:
+            url = primary.add("/file.bin", self.data)
+            mirrors = [
+                changed.add("/file.bin", bytes(other)),
+                short.add("/file.bin", self.data[:-1]),
+            ]
+            self.assertTrue(download([url] + mirrors, self.filepath, block_size=1))
+            self._assert_file()
+            self.assertEqual(len(changed.requests), 1)
+            self.assertEqual(len(short.requests), 1)
+
+    def test_failing_mirror(self):
+        """测试持续失败的镜像被停用, 其范围由其他镜像完成"""
+        with RangeServer() as primary, RangeServer(error_rate=1.0) as broken:
+            url = primary.add("/file.bin", self.data)
+            mirror = broken.add("/file.bin", self.data)
+            downloader = MultiDownloader(
+                url=url,
+                filepath=self.filepath,
+                block_size=1,
+                mirrors=[mirror],
+                max_retries=1,
+            )
+            self.assertTrue(downloader.download(worker_num=2, max_retries=4))
+            self._assert_file()
+        stats = {item["url"]: item for item in downloader.stats["mirrors"]}
+        self.assertIsNotNone(stats[mirror]["disabled"])
+        self.assertIsNone(stats[url]["disabled"])
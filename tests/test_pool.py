@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+连接池模块测试
+"""
+
+import os
+import tempfile
+import unittest
+
+from benchmarks.server import RangeServer
+from funget.download.multi import MultiDownloader
+from funget.download.pool import SessionPool
+
+
+class TestSessionPool(unittest.TestCase):
+    """连接池测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(4 * 1024 * 1024)
+        self.server = RangeServer().start()
+        self.url = self.server.add("/file.bin", self.data)
+
+    def tearDown(self):
+        """测试后清理"""
+        SessionPool.close_shared()
+        self.server.stop()
+
+    def test_connection_reuse(self):
+        """测试顺序请求复用同一个连接"""
+        pool = SessionPool(pool_size=2)
+        for _ in range(5):
+            pool.session.get(self.url, headers={"Range": "bytes=0-9"}).close()
+
+        stats = pool.stats()
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["connections"], 1)
+        self.assertAlmostEqual(stats["reuse_ratio"], 0.8)
+
+    def test_ensure_size_keeps_stats(self):
+        """测试扩容后统计继续累加"""
+        pool = SessionPool(pool_size=2)
+        pool.session.get(self.url, headers={"Range": "bytes=0-9"}).close()
+        pool.ensure_size(8)
+        pool.session.get(self.url, headers={"Range": "bytes=0-9"}).close()
+
+        self.assertEqual(pool.pool_size, 8)
+        self.assertEqual(pool.stats()["requests"], 2)
+
+    def test_shared_by_host(self):
+        """测试按主机共享连接池"""
+        first = SessionPool.shared(self.url, pool_size=4)
+        second = SessionPool.shared(f"{self.server.base_url}/other", pool_size=16)
+        self.assertIs(first, second)
+        self.assertEqual(first.pool_size, 16)
+
+    def test_multi_downloader_reuses_connections(self):
+        """测试多线程下载的 Worker 共用连接池"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            downloader = MultiDownloader(
+                url=self.url,
+                filepath=os.path.join(temp_dir, "test_file"),
+                block_size=1,
+                min_block_size=1,
+            )
+            self.assertTrue(downloader.download(worker_num=2))
+
+        self.assertLessEqual(downloader.stats["connections"], 3)
+        self.assertGreater(downloader.stats["reuse_ratio"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+远端文件探测测试
+"""
+
+import os
+import tempfile
+import unittest
+
+from benchmarks.server import RangeServer
+from funget.download.common import download
+from funget.download.probe import RemoteInfo
+
+
+class TestRemoteInfo(unittest.TestCase):
+    """探测请求测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(1024 * 1024)
+        self.server = RangeServer().start()
+        self.url = self.server.add("/file.bin", self.data)
+        self.small_url = self.server.add("/small.bin", self.data[:1000])
+        self.empty_url = self.server.add("/empty.bin", b"")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.server.stop()
+
+    def test_probe(self):
+        """测试一次范围请求取得大小、范围支持、校验信息和开头数据"""
+        info = RemoteInfo.probe(self.url, probe_size=4096)
+
+        self.assertEqual(info.size, len(self.data))
+        self.assertTrue(info.accept_ranges)
+        self.assertEqual(info.etag, self.server.etag("/file.bin"))
+        self.assertEqual(info.head, self.data[:4096])
+        self.assertFalse(info.complete)
+        self.assertEqual(info.final_url, self.url)
+        self.assertEqual(self.server.requests, [("GET", "/file.bin", "bytes=0-4095")])
+
+    def test_small_file(self):
+        """测试小文件探测时即取得完整内容"""
+        info = RemoteInfo.probe(self.small_url, probe_size=4096)
+        self.assertTrue(info.complete)
+        self.assertEqual(info.head, self.data[:1000])
+
+    def test_empty_file(self):
+        """测试空文件"""
+        info = RemoteInfo.probe(self.empty_url)
+        self.assertEqual(info.size, 0)
+        self.assertTrue(info.complete)
+
+    def test_no_range_support(self):
+        """测试服务器忽略 Range 时只读取开头的数据"""
+        with RangeServer(accept_ranges=False) as server:
+            url = server.add("/file.bin", self.data)
+            info = RemoteInfo.probe(url, probe_size=4096)
+
+        self.assertFalse(info.accept_ranges)
+        self.assertEqual(info.size, len(self.data))
+        self.assertEqual(info.head, self.data[:4096])
+        self.assertFalse(info.complete)
+
+
+class TestSingleProbe(unittest.TestCase):
+    """下载过程只探测一次的测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(12 * 1024 * 1024)
+        self.server = RangeServer().start()
+        self.url = self.server.add("/file.bin", self.data)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_filepath = os.path.join(self.temp_dir.name, "test_file")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def _check_file(self, data: bytes):
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), data)
+
+    def test_multi(self):
+        """测试多线程下载只发送一次探测请求, 并复用探测收到的数据"""
+        self.assertTrue(
+            download(self.url, self.test_filepath, block_size=4, worker_num=3)
+        )
+        self._check_file(self.data)
+
+        methods = [method for method, _, _ in self.server.requests]
+        self.assertNotIn("HEAD", methods)
+        ranges = [r for _, _, r in self.server.requests]
+        self.assertEqual(ranges[0], f"bytes=0-{256 * 1024 - 1}")
+        # 其余范围请求从探测数据之后开始
+        self.assertFalse(any(r.startswith("bytes=0-") for r in ranges[1:]))
+
+    def test_single(self):
+        """测试单线程下载从探测数据之后继续"""
+        self.assertTrue(download(self.url, self.test_filepath, multi=False))
+        self._check_file(self.data)
+        self.assertEqual(
+            [r for _, _, r in self.server.requests],
+            [f"bytes=0-{256 * 1024 - 1}", f"bytes={256 * 1024}-"],
+        )
+
+    def test_small_file(self):
+        """测试小文件只发送一个请求"""
+        url = self.server.add("/small.bin", self.data[:1000])
+        self.assertTrue(download(url, self.test_filepath))
+        self._check_file(self.data[:1000])
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
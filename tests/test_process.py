@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+多进程下载测试
+"""
+
+import hashlib
+import os
+import tempfile
+import unittest
+
+from benchmarks.server import RangeServer
+from funget.config import get_config
+from funget.download.events import DownloadEvents
+from funget.download.journal import DownloadJournal
+from funget.download.process import ProcessMultiDownloader, download
+
+
+class _Recorder(DownloadEvents):
+    """记录写入的字节数和结束的范围"""
+
+    def __init__(self):
+        self.bytes = 0
+        self.ranges = []
+
+    def on_chunk(self, worker, offset, size):
+        self.bytes += size
+
+    def on_range_done(self, worker, success, error=None):
+        self.ranges.append(success)
+
+
+@unittest.skipUnless(hasattr(os, "pwrite"), "os.pwrite not available")
+class TestProcessDownload(unittest.TestCase):
+    """多进程下载测试"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = get_config()
+        cls.progress_bar, cls.config.progress_bar = cls.config.progress_bar, False
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.config.progress_bar = cls.progress_bar
+
+    def setUp(self):
+        self.data = os.urandom(6 * 1024 * 1024 + 11)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.temp_dir.name, "file.bin")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _assert_file(self):
+        with open(self.filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+
+    def test_download(self):
+        """测试各进程写入的数据完整, 父进程收到全部进度和事件并计算校验值"""
+        events = _Recorder()
+        checksum = "sha256:" + hashlib.sha256(self.data).hexdigest()
+        with RangeServer() as server:
+            url = server.add("/file.bin", self.data)
+            downloader = ProcessMultiDownloader(
+                url=url, filepath=self.filepath, block_size=1, events=events
+            )
+            self.assertTrue(downloader.download(worker_num=3, checksum=checksum))
+            self._assert_file()
+        self.assertEqual(events.bytes + len(downloader.info.head), len(self.data))
+        self.assertEqual(len(events.ranges), downloader.blocks_num)
+        self.assertTrue(all(events.ranges))
+        self.assertFalse(os.path.exists(f"{self.filepath}.nltget"))
+
+    def test_resume(self):
+        """测试按续传日志只下载缺失的部分"""
+        done_size = 5 * 1024 * 1024
+        with RangeServer() as server:
+            url = server.add("/file.bin", self.data)
+            with open(self.filepath, "wb") as fw:
+                fw.write(self.data[:done_size])
+            half = len(self.data) // 2
+            DownloadJournal(
+                filepath=self.filepath,
+                url=url,
+                size=len(self.data),
+                etag=server.etag("/file.bin"),
+                ranges=[[0, half - 1], [half, len(self.data) - 1]],
+                done=[[0, done_size]],
+            ).save()
+            self.assertTrue(download(url, self.filepath, worker_num=2))
+            self._assert_file()
+            self.assertEqual(
+                server.requests,
+                [("GET", "/file.bin", f"bytes={done_size}-{len(self.data) - 1}")],
+            )
+
+    def test_retry(self):
+        """测试子进程中失败的请求重试后完成下载"""
+        with RangeServer(error_rate=0.3, seed=2) as server:
+            url = server.add("/file.bin", self.data)
+            self.assertTrue(download(url, self.filepath, worker_num=2, block_size=1))
+            self._assert_file()
+
+
+if __name__ == "__main__":
+    unittest.main()
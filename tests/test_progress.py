@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+进度统计测试
+"""
+
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.server import RangeServer
+from funget.config import get_config
+from funget.download.multi import MultiDownloader
+from funget.download.progress import ProgressCounter, ProgressRenderer
+
+
+class TestProgress(unittest.TestCase):
+    """进度计数和绘制测试"""
+
+    def test_counter(self):
+        """测试多线程计数"""
+        counter = ProgressCounter()
+
+        def count(_):
+            for _ in range(10000):
+                counter.add(1)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(count, range(16)))
+        self.assertEqual(counter.value, 160000)
+
+    def test_render(self):
+        """测试绘制线程汇总计数"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filepath = os.path.join(temp_dir, "file")
+            with ProgressRenderer(filepath, 100, fps=50, enabled=True) as progress:
+                progress.update(60)
+                progress.update(40)
+                progress.set_description("done")
+                bar = progress._bar
+            self.assertEqual(bar.n, 100)
+            self.assertTrue(bar.desc.startswith("done"))
+
+    def test_headless(self):
+        """测试关闭进度条时不创建进度条和绘制线程"""
+        data = os.urandom(4 * 1024 * 1024)
+        config = get_config()
+        config.progress_bar = False
+        try:
+            with ProgressRenderer("file", 100) as progress:
+                progress.update(100)
+                self.assertFalse(progress.enabled)
+                self.assertIsNone(progress._thread)
+                self.assertEqual(progress.value, 100)
+
+            with RangeServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+                url = server.add("/file.bin", data)
+                filepath = os.path.join(temp_dir, "file")
+                downloader = MultiDownloader(url=url, filepath=filepath, block_size=1)
+                self.assertTrue(downloader.download(worker_num=4))
+                with open(filepath, "rb") as fr:
+                    self.assertEqual(fr.read(), data)
+        finally:
+            config.progress_bar = True
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+随机读取远端文件测试
+"""
+
+import io
+import os
+import random
+import unittest
+import zipfile
+
+from benchmarks.server import RangeServer
+from funget.download.remote import RemoteFile
+
+KB = 1024
+
+
+def _ranges(server):
+    """服务收到的范围请求(不含探测)"""
+    return [item for item in server.requests if item[2] != "bytes=0-262143"]
+
+
+class TestRemoteFile(unittest.TestCase):
+    """随机读取和块缓存测试"""
+
+    def setUp(self):
+        self.data = os.urandom(4 * 1024 * KB + 17)
+        self.server = RangeServer().start()
+        self.url = self.server.add("/file.bin", self.data)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_random_reads(self):
+        """测试任意位置的读取与原文件一致"""
+        rng = random.Random(1)
+        with RemoteFile(self.url, block_size=64 * KB, cache_blocks=8) as fr:
+            self.assertEqual(fr.seek(0, io.SEEK_END), len(self.data))
+            for _ in range(50):
+                offset = rng.randrange(len(self.data))
+                size = rng.randrange(1, 300 * KB)
+                fr.seek(offset)
+                self.assertEqual(fr.read(size), self.data[offset : offset + size])
+            fr.seek(-5, io.SEEK_END)
+            self.assertEqual(fr.read(), self.data[-5:])
+            self.assertEqual(fr.read(1), b"")
+
+    def test_cache_stats(self):
+        """测试重复读取命中缓存, 不再发出请求"""
+        with RemoteFile(self.url, block_size=64 * KB, readahead=0) as fr:
+            fr.seek(2 * 1024 * KB)
+            self.assertEqual(fr.read(100 * KB), self.data[2048 * KB : 2148 * KB])
+            requests = len(_ranges(self.server))
+            fr.seek(2 * 1024 * KB + 10)
+            self.assertEqual(
+                fr.read(100 * KB), self.data[2048 * KB + 10 : 2148 * KB + 10]
+            )
+            stats = fr.stats()
+        self.assertEqual(len(_ranges(self.server)), requests)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["fetched_bytes"], 128 * KB)
+
+    def test_readahead(self):
+        """测试顺序读取时预读后面的块"""
+        with RemoteFile(self.url, block_size=64 * KB, readahead=4) as fr:
+            fr.seek(1024 * KB)
+            fr.read(64 * KB)
+            # 从上次结束的位置继续读, 视为顺序读取
+            data = b"".join(fr.read(64 * KB) for _ in range(8))
+            stats = fr.stats()
+        self.assertEqual(data, self.data[1088 * KB : 1600 * KB])
+        self.assertGreater(stats["hits"], 0)
+
+    def test_scattered_read(self):
+        """测试一次大读取拆分为多个并发的范围请求, 不超过缓存容量"""
+        with RemoteFile(
+            self.url, block_size=64 * KB, cache_blocks=8, max_fetch_blocks=2
+        ) as fr:
+            fr.seek(512 * KB)
+            self.assertEqual(fr.read(2048 * KB), self.data[512 * KB : 2560 * KB])
+            stats = fr.stats()
+        self.assertGreaterEqual(stats["fetches"], 16)
+        self.assertLessEqual(stats["cached_blocks"], 8)
+
+    def test_zipfile(self):
+        """测试 zipfile 只读取需要的成员"""
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            for i in range(4):
+                zf.writestr(f"part{i}.bin", self.data[i * KB : (i + 1) * 1024 * KB])
+        url = self.server.add("/archive.zip", archive.getvalue())
+        with RemoteFile(url, block_size=64 * KB) as fr:
+            with zipfile.ZipFile(fr) as zf:
+                self.assertEqual(
+                    zf.read("part3.bin"), self.data[3 * KB : 4 * 1024 * KB]
+                )
+            fetched = fr.stats()["fetched_bytes"]
+        self.assertLess(fetched, len(archive.getvalue()) // 2)
+
+    def test_no_range_support(self):
+        """测试不支持范围请求时打开失败"""
+        with RangeServer(accept_ranges=False) as server:
+            url = server.add("/file.bin", self.data)
+            with self.assertRaises(IOError):
+                RemoteFile(url)
+
+
+if __name__ == "__main__":
+    unittest.main()
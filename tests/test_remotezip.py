@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+按需下载 zip 成员测试
+"""
+
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+from benchmarks.server import RangeServer
+from funget.config import get_config
+from funget.download.remotezip import download_zip_members
+
+MB = 1024 * 1024
+
+
+def _requested(server):
+    """服务收到的范围请求覆盖的字节数(不含探测)"""
+    total = 0
+    for _, _, header in server.requests:
+        start, end = header.split("=")[1].split("-")
+        if start != "0" or end != "262143":
+            total += int(end) - int(start) + 1
+    return total
+
+
+class TestZipMembers(unittest.TestCase):
+    """只下载 zip 中指定成员测试"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = get_config()
+        cls.progress_bar, cls.config.progress_bar = cls.config.progress_bar, False
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.config.progress_bar = cls.progress_bar
+
+    def setUp(self):
+        self.members = {f"data/part{i}.bin": os.urandom(2 * MB + i) for i in range(6)}
+        self.members["docs/readme.txt"] = b"readme " * 1000
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            for i, (name, data) in enumerate(self.members.items()):
+                method = zipfile.ZIP_STORED if i % 2 else zipfile.ZIP_DEFLATED
+                zf.writestr(name, data, compress_type=method)
+        self.archive = archive.getvalue()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.server = RangeServer().start()
+        self.url = self.server.add("/release.zip", self.archive)
+
+    def tearDown(self):
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def _assert_member(self, name):
+        with open(os.path.join(self.temp_dir.name, name), "rb") as fr:
+            self.assertEqual(fr.read(), self.members[name])
+
+    def test_members(self):
+        """测试只请求中央目录和指定成员的数据"""
+        names = ["data/part3.bin", "docs/readme.txt", "data/part0.bin"]
+        self.assertTrue(
+            download_zip_members(self.url, names, self.temp_dir.name, worker_num=4)
+        )
+        for name in names:
+            self._assert_member(name)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.temp_dir.name, "data/part1.bin"))
+        )
+        # 没有留下临时文件
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), ["data", "docs"])
+        self.assertLess(_requested(self.server), len(self.archive) // 2)
+
+    def test_missing_member(self):
+        """测试成员不存在时失败且不下载数据"""
+        self.assertFalse(
+            download_zip_members(self.url, ["data/none.bin"], self.temp_dir.name)
+        )
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+写入目标测试
+"""
+
+import os
+import tempfile
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from benchmarks.server import RangeServer
+from funget.download.multi import MultiDownloader
+from funget.download.sink import (
+    DiskSpaceError,
+    FileSink,
+    MemorySink,
+    MmapSink,
+    NullSink,
+    create_sink,
+)
+
+
+class TestSink(unittest.TestCase):
+    """各写入目标测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(256 * 1024)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_filepath = os.path.join(self.temp_dir.name, "test_file")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+
+    def _write_out_of_order(self, sink):
+        """倒序分块写入全部数据"""
+        step = 64 * 1024
+        with sink:
+            for offset in reversed(range(0, len(self.data), step)):
+                sink.write(self.data[offset : offset + step], offset)
+            self.assertEqual(sink.written, [[0, len(self.data)]])
+
+    def test_file_sink(self):
+        """测试 pwrite 写入文件"""
+        self._write_out_of_order(FileSink(self.test_filepath))
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+
+    def test_mmap_sink(self):
+        """测试内存映射写入文件"""
+        self._write_out_of_order(MmapSink(self.test_filepath, len(self.data)))
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+
+    def test_memory_sink(self):
+        """测试写入内存, 大小未知时按需扩容"""
+        for size in (len(self.data), 0):
+            sink = MemorySink(size)
+            self._write_out_of_order(sink)
+            self.assertEqual(sink.getvalue(), self.data)
+
+    def test_null_sink(self):
+        """测试丢弃数据的写入目标"""
+        sink = NullSink()
+        self._write_out_of_order(sink)
+        self.assertFalse(os.path.exists(self.test_filepath))
+
+    def test_write_after_close(self):
+        """测试关闭后写入抛出异常"""
+        sink = create_sink("memory", size=4)
+        with sink:
+            sink.write(b"ab", 0)
+        with self.assertRaises(ValueError):
+            sink.write(b"cd", 2)
+
+    def test_unknown_sink(self):
+        """测试未知的写入目标名称"""
+        with self.assertRaises(ValueError):
+            create_sink("tape")
+
+
+class TestPreallocate(unittest.TestCase):
+    """文件预分配测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_filepath = os.path.join(self.temp_dir.name, "test_file")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+
+    def test_reserve_final_size(self):
+        """测试打开时即预留最终大小"""
+        for strategy in ("fallocate", "sparse"):
+            with FileSink(self.test_filepath, 1024 * 1024, strategy) as sink:
+                self.assertEqual(os.path.getsize(self.test_filepath), 1024 * 1024)
+                sink.write(b"tail", 1024 * 1024 - 4)
+            self.assertEqual(os.path.getsize(self.test_filepath), 1024 * 1024)
+
+    def test_no_preallocate(self):
+        """测试不预分配时文件随写入增长"""
+        with FileSink(self.test_filepath, 1024 * 1024, "none"):
+            self.assertEqual(os.path.getsize(self.test_filepath), 0)
+
+    def test_disk_full(self):
+        """测试磁盘空间不足时在写入前失败并清理文件"""
+        usage = namedtuple("usage", "total used free")(1024, 1024, 0)
+        with mock.patch("shutil.disk_usage", return_value=usage):
+            with self.assertRaises(DiskSpaceError):
+                FileSink(self.test_filepath, 1024 * 1024, "fallocate").open()
+        self.assertFalse(os.path.exists(self.test_filepath))
+
+    def test_unknown_strategy(self):
+        """测试未知的预分配策略"""
+        with self.assertRaises(ValueError):
+            FileSink(self.test_filepath, 1024, "eager")
+
+
+class TestDownloadSink(unittest.TestCase):
+    """下载器使用不同写入目标的测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(3 * 1024 * 1024 + 7)
+        self.server = RangeServer().start()
+        self.url = self.server.add("/file.bin", self.data)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_filepath = os.path.join(self.temp_dir.name, "test_file")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def _downloader(self) -> MultiDownloader:
+        return MultiDownloader(url=self.url, filepath=self.test_filepath, block_size=1)
+
+    def test_mmap(self):
+        """测试通过内存映射下载"""
+        self.assertTrue(self._downloader().download(worker_num=3, sink="mmap"))
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+
+    def test_memory(self):
+        """测试下载到内存, 不创建文件"""
+        downloader = self._downloader()
+        self.assertTrue(downloader.download(worker_num=3, sink="memory"))
+        self.assertEqual(downloader.sink.getvalue(), self.data)
+        self.assertFalse(os.path.exists(self.test_filepath))
+
+    def test_disk_full(self):
+        """测试磁盘空间不足时下载直接失败, 不发送范围请求"""
+        usage = namedtuple("usage", "total used free")(1024, 1024, 0)
+        downloader = self._downloader()
+        before = len(self.server.requests)
+        with mock.patch("shutil.disk_usage", return_value=usage):
+            self.assertFalse(downloader.download(worker_num=3, preallocate="fallocate"))
+        self.assertEqual(len(self.server.requests), before)
+
+    def test_null(self):
+        """测试丢弃数据的下载"""
+        downloader = self._downloader()
+        self.assertTrue(downloader.download(worker_num=3, sink="null"))
+        self.assertEqual(downloader.sink.written, [[0, len(self.data)]])
+        self.assertFalse(os.path.exists(self.test_filepath))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+顺序流式读取测试
+"""
+
+import io
+import os
+import tarfile
+import time
+import unittest
+
+from benchmarks.server import RangeServer
+from funget.download.stream import RemoteStream, iter_download, open_remote
+
+MB = 1024 * 1024
+
+
+class TestRemoteStream(unittest.TestCase):
+    """并行下载、按顺序读取测试"""
+
+    def setUp(self):
+        self.data = os.urandom(6 * MB + 13)
+
+    def test_iter_download(self):
+        """测试逐块产出的数据与原文件一致且拆成了多个范围请求"""
+        with RangeServer() as server:
+            url = server.add("/file.bin", self.data)
+            chunks = list(iter_download(url, worker_num=3, block_size=1))
+            self.assertEqual(b"".join(chunks), self.data)
+            # 探测请求加 6 个 1MB 范围
+            self.assertGreaterEqual(len(server.requests), 7)
+
+    def test_backpressure(self):
+        """测试读取方较慢时缓冲不超过 buffer_blocks 个范围"""
+        with RangeServer() as server:
+            url = server.add("/file.bin", self.data)
+            with RemoteStream(
+                url, worker_num=4, block_size=1, buffer_blocks=2
+            ) as stream:
+                received = bytearray()
+                while True:
+                    data = stream.read(256 * 1024)
+                    if not data:
+                        break
+                    received += data
+                    time.sleep(0.005)
+                stats = stream.stats()
+        self.assertEqual(bytes(received), self.data)
+        self.assertLessEqual(stats["peak_buffered"], 2 * MB)
+
+    def test_tarfile(self):
+        """测试作为文件对象交给 tarfile 流式解包"""
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            for name in ("a.bin", "b.bin"):
+                info = tarfile.TarInfo(name)
+                info.size = len(self.data)
+                tar.addfile(info, io.BytesIO(self.data))
+        with RangeServer() as server:
+            url = server.add("/file.tar", archive.getvalue())
+            with open_remote(url, worker_num=4, block_size=1) as fr:
+                with tarfile.open(fileobj=fr, mode="r|") as tar:
+                    members = [
+                        (member.name, tar.extractfile(member).read()) for member in tar
+                    ]
+        self.assertEqual(members, [("a.bin", self.data), ("b.bin", self.data)])
+
+    def test_no_range_support(self):
+        """测试不支持范围请求时用一个请求顺序读取"""
+        with RangeServer(accept_ranges=False) as server:
+            url = server.add("/file.bin", self.data)
+            self.assertEqual(b"".join(iter_download(url, block_size=1)), self.data)
+
+    def test_close_early(self):
+        """测试提前关闭时停止剩余的下载"""
+        with RangeServer(bandwidth=8 * MB) as server:
+            url = server.add("/file.bin", self.data)
+            stream = RemoteStream(url, worker_num=2, block_size=1)
+            self.assertEqual(stream.read(1024), self.data[:1024])
+            stream.close()
+            self.assertTrue(stream.closed)
+            self.assertEqual(stream.buffered, 0)
+            with self.assertRaises(ValueError):
+                stream.read(1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+自动调优测试
+"""
+
+import os
+import tempfile
+import unittest
+
+from benchmarks.server import RangeServer
+from funget.config import get_config
+from funget.download.common import download
+from funget.download.probe import RemoteInfo
+from funget.download.tune import MB, AutoTuner, tune
+
+
+def _info(size, rtt, throughput, accept_ranges=True):
+    return RemoteInfo(
+        url="http://example.com/file.bin",
+        size=size,
+        accept_ranges=accept_ranges,
+        head=b"\0" * min(size, 256 * 1024),
+        rtt=rtt,
+        throughput=throughput,
+    )
+
+
+class TestAutoTuner(unittest.TestCase):
+    """根据探测结果选择参数测试"""
+
+    def test_small_file_high_latency(self):
+        """测试高延迟链路上的小文件用单线程下载"""
+        result = tune(_info(8 * MB, rtt=0.3, throughput=1 * MB))
+        self.assertEqual(result.engine, "single")
+        self.assertEqual(result.worker_num, 1)
+
+    def test_large_file_high_latency(self):
+        """测试高延迟链路上的大文件使用更多的连接"""
+        result = tune(_info(2048 * MB, rtt=0.3, throughput=1 * MB))
+        self.assertEqual(result.engine, "multi")
+        self.assertEqual(result.worker_num, 24)
+        # 一个范围至少传输 16 个往返
+        self.assertGreaterEqual(result.block_size * MB, 16 * 0.3 * MB)
+
+    def test_huge_file_fat_pipe(self):
+        """测试低延迟、高带宽链路上的大文件使用大块"""
+        result = tune(_info(20 * 1024 * MB, rtt=0.002, throughput=200 * MB))
+        self.assertEqual(result.engine, "multi")
+        self.assertEqual(result.worker_num, 4)
+        self.assertEqual(result.block_size, 256)
+        self.assertEqual(result.chunk_size, 4 * MB)
+
+    def test_blocks_cover_workers(self):
+        """测试块数少于连接数时缩小块"""
+        result = tune(_info(100 * MB, rtt=0.01, throughput=10 * MB))
+        self.assertEqual(result.engine, "multi")
+        self.assertGreaterEqual(100 // result.block_size, result.worker_num)
+
+    def test_no_range_support(self):
+        """测试不支持范围请求或大小未知时用单线程下载"""
+        self.assertFalse(
+            tune(_info(1024 * MB, 0.01, 10 * MB, accept_ranges=False)).multi
+        )
+        self.assertFalse(tune(_info(0, 0.01, 10 * MB)).multi)
+
+    def test_chunk_size(self):
+        """测试读取大小按吞吐量取整并限制范围"""
+        tuner = AutoTuner()
+        self.assertEqual(tuner.chunk_size(0), 64 * 1024)
+        self.assertEqual(tuner.chunk_size(10 * MB), 512 * 1024)
+        self.assertEqual(tuner.chunk_size(1024 * MB), 4 * MB)
+
+
+class TestAutoTuneDownload(unittest.TestCase):
+    """探测测量和下载测试"""
+
+    def test_probe_measures(self):
+        """测试探测请求测量往返时间和吞吐量"""
+        with RangeServer(latency=0.05) as server:
+            url = server.add("/file.bin", os.urandom(MB))
+            info = RemoteInfo.probe(url)
+        self.assertGreaterEqual(info.rtt, 0.05)
+        self.assertGreater(info.throughput, 0)
+
+    def test_download(self):
+        """测试自动调优的下载, 调用方指定的参数优先"""
+        data = os.urandom(8 * MB + 17)
+        config = get_config()
+        progress_bar, config.progress_bar = config.progress_bar, False
+        tuner = AutoTuner(range_time=0.0, range_rtts=0, max_block_size=1)
+        try:
+            with RangeServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+                url = server.add("/file.bin", data)
+                filepath = os.path.join(temp_dir, "file.bin")
+                self.assertTrue(download(url, filepath, tuner=tuner))
+                with open(filepath, "rb") as fr:
+                    self.assertEqual(fr.read(), data)
+                # 拆分为多个 1MB 的范围
+                self.assertGreater(len(server.requests), 4)
+
+                requests = len(server.requests)
+                self.assertTrue(
+                    download(url, filepath, multi=False, overwrite=True, tuner=tuner)
+                )
+                self.assertEqual(len(server.requests) - requests, 2)
+        finally:
+            config.progress_bar = progress_bar
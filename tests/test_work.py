@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Worker 与 WorkerFactory 测试
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from threading import Lock, Thread
+
+from benchmarks.server import RangeRequestHandler, RangeServer
+from funget.download.sink import FileSink
+from funget.download.work import Worker, WorkerFactory
+
+
+class SlowRangeRequestHandler(RangeRequestHandler):
+    """每次写出后暂停, 模拟慢速连接"""
+
+    write_size = 64 * 1024
+    write_delay = 0.005
+
+
+class StallingRangeRequestHandler(RangeRequestHandler):
+    """第一个从 stall_offset 开始的范围请求每次写出后暂停很久, 模拟卡住的连接"""
+
+    write_size = 64 * 1024
+    stall_offset = 2 * 1024 * 1024
+    stalled = False
+    lock = Lock()
+
+    def _send_body(self, data: bytes, head_only: bool = False):
+        with StallingRangeRequestHandler.lock:
+            stall = not StallingRangeRequestHandler.stalled and self.headers.get(
+                "Range", ""
+            ).startswith(f"bytes={self.stall_offset}-")
+            if stall:
+                StallingRangeRequestHandler.stalled = True
+        self.write_delay = 5.0 if stall else 0.0
+        super()._send_body(data, head_only)
+
+
+class TestWorker(unittest.TestCase):
+    """Worker 测试"""
+
+    def test_split(self):
+        """测试拆分剩余范围"""
+        worker = Worker(url="http://localhost/file", fileobj=None, range_end=99)
+        worker.range_curser = 20
+
+        stolen = worker.split(min_size=10)
+        self.assertEqual((worker.range_end, stolen.range_start), (59, 60))
+        self.assertEqual(stolen.range_end, 99)
+        self.assertEqual(worker.remaining + stolen.remaining, 80)
+
+    def test_split_too_small(self):
+        """测试剩余不足时不拆分"""
+        worker = Worker(url="http://localhost/file", fileobj=None, range_end=99)
+        self.assertIsNone(worker.split(min_size=60))
+        self.assertEqual(worker.range_end, 99)
+
+    def test_hedge(self):
+        """测试对冲请求与原请求共用范围, 数据只写入一次"""
+        data = os.urandom(2 * 1024 * 1024)
+        with RangeServer(
+            handler=SlowRangeRequestHandler
+        ) as server, tempfile.TemporaryDirectory() as temp_dir:
+            url = server.add("/file.bin", data)
+            filepath = os.path.join(temp_dir, "file")
+            with FileSink(filepath) as fw:
+                worker = Worker(
+                    url=url, fileobj=fw, range_end=len(data) - 1, chunk_size=64 * 1024
+                )
+                hedge = worker.hedged()
+                self.assertIsNone(worker.hedged())
+                self.assertIsNone(hedge.hedged())
+                results = []
+                threads = [
+                    Thread(target=lambda w=w: results.append(w.run()))
+                    for w in (worker, hedge)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            self.assertEqual(results, [True, True])
+            self.assertIn(worker.winner, (worker, hedge))
+            self.assertEqual(worker.downloaded, len(data))
+            self.assertEqual(hedge.downloaded, 0)
+            with open(filepath, "rb") as fr:
+                self.assertEqual(fr.read(), data)
+
+
+class TestWorkerFactory(unittest.TestCase):
+    """WorkerFactory 测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.data = os.urandom(4 * 1024 * 1024)
+        self.server = RangeServer(handler=SlowRangeRequestHandler).start()
+        self.url = self.server.add("/file.bin", self.data)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_filepath = os.path.join(self.temp_dir.name, "test_file")
+
+    def tearDown(self):
+        """测试后清理"""
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def test_work_stealing(self):
+        """测试空闲线程拆分慢速范围"""
+        with FileSink(self.test_filepath) as fw:
+            with WorkerFactory(
+                worker_num=4, min_steal_size=256 * 1024, steal_interval=0.01
+            ) as pool:
+                pool.submit(
+                    Worker(
+                        url=self.url,
+                        fileobj=fw,
+                        range_end=len(self.data) - 1,
+                    )
+                )
+
+        self.assertGreater(pool.steal_count, 0)
+        self.assertFalse(pool.get_failed_tasks())
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+
+    def test_hedge_straggler(self):
+        """测试为卡住的范围发出对冲请求, 对冲请求完成后中断原请求"""
+        StallingRangeRequestHandler.stalled = False
+        size = 1024 * 1024
+        with RangeServer(handler=StallingRangeRequestHandler) as server:
+            url = server.add("/file.bin", self.data)
+            started = time.monotonic()
+            with FileSink(self.test_filepath) as fw:
+                with WorkerFactory(
+                    worker_num=4, steal=False, steal_interval=0.05, hedge=True
+                ) as pool:
+                    for start in range(0, len(self.data), size):
+                        pool.submit(
+                            Worker(
+                                url=url,
+                                fileobj=fw,
+                                range_start=start,
+                                range_end=start + size - 1,
+                            )
+                        )
+                    pool.wait_for_all_done()
+            elapsed = time.monotonic() - started
+
+        # 卡住的请求需要 16 x 5 秒, 对冲后约 1 秒即完成
+        self.assertLess(elapsed, 10)
+        self.assertEqual(pool.stats()["hedges"], 1)
+        self.assertEqual(pool.stats()["hedge_wins"], 1)
+        self.assertFalse(pool.get_failed_tasks())
+        with open(self.test_filepath, "rb") as fr:
+            self.assertEqual(fr.read(), self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()